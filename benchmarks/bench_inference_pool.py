@@ -0,0 +1,120 @@
+"""
+Inference Pool Benchmark
+
+Trains a random forest with the parameters of models/train_models.py,
+saves it as a model bundle and compares, per batch size:
+
+  * inline: MLDetector.predict_batch on the calling thread, which under
+    Ryu is the event loop, so the whole call blocks OpenFlow processing,
+  * pool: InferencePool.submit, timing how long the caller is blocked
+    (copying into shared memory and queueing) and the latency until the
+    callback delivers the verdicts.
+
+It also reports how many rows per second the pool sustains with every
+slot kept busy. Worker processes only add throughput when the host has
+cores to spare; on one core they still take inference off the event loop.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.detection.inference_pool import InferencePool
+from src.detection.ml_detector import MLDetector
+from src.detection.model_bundle import ModelBundle
+from bench_ml_batch import synthetic_data
+
+
+def pool_latency(pool, matrix, repeat):
+    """Median (ms blocked in submit, ms until the callback) over repeat batches"""
+    blocked, latency = [], []
+    for _ in range(repeat):
+        done = threading.Event()
+        start = time.perf_counter()
+        if not pool.submit(matrix, lambda result: done.set()):
+            raise RuntimeError("Pool refused the batch")
+        blocked.append(time.perf_counter() - start)
+        done.wait()
+        latency.append(time.perf_counter() - start)
+    return statistics.median(blocked) * 1000, statistics.median(latency) * 1000
+
+
+def pool_throughput(pool, matrix, seconds=2.0):
+    """Rows per second with as many batches in flight as the pool accepts"""
+    completed = [0]
+
+    def callback(result):
+        completed[0] += len(result['prediction'])
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        if not pool.submit(matrix, callback):
+            time.sleep(0.0005)
+    while pool.get_statistics()['pending']:
+        time.sleep(0.001)
+    return completed[0] / (time.perf_counter() - start)
+
+
+def main():
+    import argparse
+    from sklearn.ensemble import RandomForestClassifier
+
+    parser = argparse.ArgumentParser(description='Benchmark out-of-process ML inference')
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[16, 64, 256])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    X, y = synthetic_data(rng, args.samples)
+    model = RandomForestClassifier(n_estimators=args.trees, max_depth=20, min_samples_split=5,
+                                   min_samples_leaf=2, random_state=42, n_jobs=-1)
+    model.fit(X, y)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bundle = ModelBundle.from_training(model)
+        bundle.save(f'{tmpdir}/model.pkl')
+        detector = MLDetector()
+        detector.use_bundle(ModelBundle.load(f'{tmpdir}/model.pkl'))
+        pool = InferencePool(detector, workers=args.workers, max_batch=max(args.batch_sizes))
+        pool.start()
+        try:
+            pool_latency(pool, X[:8], 20)  # workers up and model mapped
+
+            print(f"{args.trees} trees, {args.workers} workers, {os.cpu_count()} CPUs; "
+                  f"median ms per batch")
+            print(f"{'batch':>6} {'inline blocked':>15} {'pool blocked':>13} "
+                  f"{'pool latency':>13}")
+            for size in args.batch_sizes:
+                matrix = X[:size]
+                repeat = max(20, 2000 // size)
+                inline = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    detector.predict_batch(matrix)
+                    inline.append(time.perf_counter() - start)
+                blocked, latency = pool_latency(pool, matrix, repeat)
+                print(f"{size:>6} {statistics.median(inline) * 1000:>15.3f} "
+                      f"{blocked:>13.3f} {latency:>13.3f}")
+
+            size = max(args.batch_sizes)
+            rate = pool_throughput(pool, X[:size])
+            print(f"\nPool throughput at batch {size}: {rate:,.0f} rows/s")
+            stats = pool.get_statistics()
+            print(f"max_pending {stats['max_pending']}, rejected {stats['rejected']}, "
+                  f"latency p99 {stats['latency_ms']['p99']} ms")
+        finally:
+            pool.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+ML Batch Inference Benchmark
+
+Trains a random forest with the parameters of models/train_models.py on
+synthetic traffic and compares the per-sample latency of:
+
+  * the original per-packet path (model.predict plus model.predict_proba
+    on a one-row array),
+  * MLDetector.predict (one predict_proba per packet),
+  * MLDetector.predict_batch at increasing batch sizes,
+
+and, at each batch size, sklearn's predict_proba (threaded as trained and
+single-threaded) against the CompiledForest that MLDetector now runs. The
+compiled probabilities are checked to equal sklearn's exactly.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.detection.ml_detector import MLDetector
+from src.detection.compiled_forest import CompiledForest
+from src.detection.flow_features import FlowFeatures
+
+
+def synthetic_data(rng, n):
+    """Benign and DoS-like flows in the ML feature layout"""
+    y = (rng.random(n) < 0.2).astype(int)
+    X = np.column_stack([
+        np.where(y, rng.normal(1000, 200, n), rng.normal(50, 20, n)),
+        np.where(y, rng.normal(50000, 10000, n), rng.normal(5000, 2000, n)),
+        np.where(y, rng.normal(30, 5, n), rng.normal(10, 3, n)),
+        np.where(y, rng.normal(100, 20, n), rng.normal(5, 2, n)),
+        np.where(y, rng.normal(50, 10, n), rng.normal(100, 30, n)),
+        rng.choice([6, 17, 1], n),
+        rng.integers(1024, 65535, n),
+        rng.integers(1, 1024, n),
+        np.where(y, 0x02, 0),
+    ])
+    # Label noise, so the trees grow to a realistic depth
+    return X, y ^ (rng.random(n) < 0.05)
+
+
+def per_sample_us(fn, rows, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / (repeat * rows) * 1e6
+
+
+def main():
+    import argparse
+    from sklearn.ensemble import RandomForestClassifier
+
+    parser = argparse.ArgumentParser(description='Benchmark batched ML inference')
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 64, 256, 1024])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    X, y = synthetic_data(rng, args.samples)
+    model = RandomForestClassifier(n_estimators=args.trees, max_depth=20, min_samples_split=5,
+                                   min_samples_leaf=2, random_state=42, n_jobs=-1)
+    model.fit(X, y)
+
+    detector = MLDetector()
+    detector.model = model
+    flows = [FlowFeatures(packet_count=int(r[0]), byte_count=int(r[1]), duration=float(r[2]),
+                          protocol=int(r[5]), src_port=int(r[6]), dst_port=int(r[7]),
+                          tcp_flags=int(r[8]))
+             for r in X[:64]]
+
+    def legacy():
+        row = [flows[0].to_row()]
+        model.predict(row)
+        model.predict_proba(row)
+
+    print(f"{args.trees} trees, per-sample latency")
+    print(f"{'path':<28} {'us/sample':>10}")
+    print(f"{'predict + predict_proba':<28} {per_sample_us(legacy, 1, 50):>10.1f}")
+    print(f"{'MLDetector.predict':<28} "
+          f"{per_sample_us(lambda: detector.predict(flows[0]), 1, 50):>10.1f}")
+    for size in args.batch_sizes:
+        matrix = X[:size]
+        repeat = max(5, 2000 // size)
+        latency = per_sample_us(lambda: detector.predict_batch(matrix), size, repeat)
+        print(f"{'predict_batch n=' + str(size):<28} {latency:>10.1f}")
+
+    forest = CompiledForest.from_model(model)
+    threaded = model.n_jobs
+    model.n_jobs = 1  # sklearn's sum over threads is not in a fixed order
+    assert np.array_equal(forest.predict_proba(X), model.predict_proba(X))
+    print(f"\nCompiled forest: {forest.n_nodes} nodes, max depth {forest.max_depth}, "
+          f"{forest.nbytes() / 2**20:.1f} MB; probabilities identical to sklearn")
+    print(f"{'batch':>6} {'sklearn':>10} {'n_jobs=1':>10} {'compiled':>10}  (us/sample)")
+    for size in args.batch_sizes:
+        matrix = X[:size]
+        repeat = max(5, 2000 // size)
+        model.n_jobs = threaded
+        sklearn_us = per_sample_us(lambda: model.predict_proba(matrix), size, repeat)
+        model.n_jobs = 1
+        single_us = per_sample_us(lambda: model.predict_proba(matrix), size, repeat)
+        compiled_us = per_sample_us(lambda: forest.predict_proba(matrix), size, repeat)
+        print(f"{size:>6} {sklearn_us:>10.1f} {single_us:>10.1f} {compiled_us:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
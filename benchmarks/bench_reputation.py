@@ -0,0 +1,101 @@
+"""
+Reputation Lookup Benchmark
+
+Builds a prefix feed of random IPv4 prefixes (1M by default, lengths
+mostly /24 and /32 like real threat-intel feeds), compiles it into
+the reputation PrefixTable and measures build time, table size and
+longest-prefix-match lookup latency. Lookups are compared against probing
+a dict per prefix length, the usual pure-Python LPM.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.detection.reputation import IPReputation, ip_to_int
+
+
+def write_feed(path, count, rng):
+    """Write count random prefixes; returns them as (network, prefixlen)"""
+    lengths = [16] + [20] * 4 + [24] * 25 + [28] * 10 + [32] * 60
+    prefixes = []
+    with open(path, 'w') as f:
+        f.write('# synthetic benchmark feed\n')
+        for _ in range(count):
+            prefixlen = rng.choice(lengths)
+            network = rng.getrandbits(32) & ((0xffffffff << (32 - prefixlen)) & 0xffffffff)
+            prefixes.append((network, prefixlen))
+            f.write(f'{network >> 24}.{network >> 16 & 255}.{network >> 8 & 255}.{network & 255}'
+                    f'/{prefixlen} feed-{prefixlen}\n')
+    return prefixes
+
+
+class PerLengthLPM:
+    """Baseline: one dict per prefix length, probed longest first"""
+
+    def __init__(self, prefixes):
+        self.tables = {}
+        for network, prefixlen in prefixes:
+            self.tables.setdefault(prefixlen, {})[network] = prefixlen
+        self.lengths = sorted(self.tables, reverse=True)
+
+    def lookup(self, ip):
+        address = ip_to_int(ip)
+        for prefixlen in self.lengths:
+            value = self.tables[prefixlen].get(address & ((0xffffffff << (32 - prefixlen)) & 0xffffffff))
+            if value is not None:
+                return value
+        return None
+
+
+def time_lookups(lookup, ips):
+    start = time.perf_counter()
+    hits = sum(1 for ip in ips if lookup(ip) is not None)
+    return (time.perf_counter() - start) / len(ips), hits
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark reputation prefix lookups')
+    parser.add_argument('--prefixes', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        feed = os.path.join(tmp, 'blocklist.txt')
+        prefixes = write_feed(feed, args.prefixes, rng)
+
+        reputation = IPReputation(blocklists=[feed])
+        reputation.rebuild()
+        stats = reputation.get_statistics()
+        print(f"Feed: {stats['prefixes']} distinct prefixes -> {stats['ranges']} ranges, "
+              f"{stats['memory_bytes'] / 2**20:.1f} MB, built in {stats['last_build_ms'] / 1000:.1f}s")
+
+        # Half the probes inside known prefixes, half random addresses
+        ips = []
+        for i in range(args.lookups):
+            if i % 2:
+                network, prefixlen = rng.choice(prefixes)
+                address = network | (rng.getrandbits(32 - prefixlen) if prefixlen < 32 else 0)
+            else:
+                address = rng.getrandbits(32)
+            ips.append(f'{address >> 24}.{address >> 16 & 255}.{address >> 8 & 255}.{address & 255}')
+
+        table = reputation.table
+        print(f"{'':<18} {'us/lookup':>10} {'matches':>9}")
+        for name, lookup in (('range table', table.lookup),
+                             ('per-length dicts', PerLengthLPM(prefixes).lookup)):
+            per_lookup, hits = time_lookups(lookup, ips)
+            print(f"{name:<18} {per_lookup * 1e6:>10.2f} {hits:>9}")
+
+
+if __name__ == '__main__':
+    main()
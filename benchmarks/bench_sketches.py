@@ -0,0 +1,180 @@
+"""
+Sketch Counter Benchmark
+
+Replays a mix of attack traffic (wide port scans, SYN floods from real
+sources, a spoofed-source SYN flood) over background traffic through the
+exact sliding-window counters and through the fixed-memory sketches, and
+reports retained memory, per-source estimation error, detection
+agreement at the ThreatDetector thresholds and heavy-hitter recall.
+"""
+
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.detection.sliding_window import SlidingWindowCounter, SlidingWindowDistinct
+from src.detection.sketches import CountMinSketch, DistinctSketch, HeavyHitters
+
+
+def build_trace(args, rng):
+    """Return [(timestamp, src_ip, dst_port, is_syn)] spread over one window"""
+    packets = []
+
+    def emit(src, port, syn):
+        packets.append((rng.uniform(0, args.window * 0.9), src, port, syn))
+
+    for i in range(args.background):
+        src = f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+        for _ in range(rng.randint(1, 6)):
+            emit(src, rng.choice((22, 53, 80, 443, 8080)), rng.random() < 0.3)
+
+    for i in range(args.scanners):
+        src = f'172.16.0.{i + 1}'
+        for port in rng.sample(range(1, 65536), rng.randint(20, args.scan_ports)):
+            emit(src, port, True)
+
+    for i in range(args.flooders):
+        src = f'172.17.0.{i + 1}'
+        for _ in range(rng.randint(150, args.flood_syns)):
+            emit(src, 80, True)
+
+    for _ in range(args.spoofed):
+        emit(f'{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+             80, True)
+
+    packets.sort()
+    return packets
+
+
+def feed(packets, ports, syns, offenders, port_threshold, syn_threshold, flagged=None):
+    """Run the trace through one set of counters"""
+    for now, src, port, syn in packets:
+        if ports.add(src, port, now) > port_threshold:
+            offenders.offer(src)
+            if flagged is not None:
+                flagged['PORT_SCAN'].add(src)
+        if syn and syns.add(src, 1, now) > syn_threshold:
+            offenders.offer(src)
+            if flagged is not None:
+                flagged['DOS_ATTACK'].add(src)
+
+
+def replay(packets, factory, port_threshold, syn_threshold):
+    """Return (counters, seconds, flagged sources) for a timed pass"""
+    counters = factory()
+    flagged = {'PORT_SCAN': set(), 'DOS_ATTACK': set()}
+    start = time.perf_counter()
+    feed(packets, *counters, port_threshold, syn_threshold, flagged)
+    return counters, time.perf_counter() - start, flagged
+
+
+def retained_memory(packets, factory, port_threshold, syn_threshold):
+    """Bytes held by freshly built counters after the trace"""
+    gc.collect()
+    tracemalloc.start()
+    counters = factory()
+    feed(packets, *counters, port_threshold, syn_threshold)
+    gc.collect()
+    retained, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del counters
+    return retained
+
+
+def errors(exact, sketch, keys, now):
+    """Mean/max relative and absolute error over keys"""
+    rel, diff = [], []
+    for key in keys:
+        truth = exact.count(key, now)
+        if truth:
+            error = abs(sketch.count(key, now) - truth)
+            rel.append(error / truth)
+            diff.append(error)
+    if not rel:
+        return 0.0, 0.0, 0.0, 0
+    return sum(rel) / len(rel), max(rel), sum(diff) / len(diff), max(diff)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark sketch counters against exact counters')
+    parser.add_argument('--memory-kb', type=int, default=1024,
+                        help='Sketch memory ceiling (split between the two sketches)')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='Rows of the distinct-port sketch')
+    parser.add_argument('--background', type=int, default=20000,
+                        help='Benign sources')
+    parser.add_argument('--scanners', type=int, default=20)
+    parser.add_argument('--scan-ports', type=int, default=2000,
+                        help='Most ports probed by one scanner')
+    parser.add_argument('--flooders', type=int, default=10)
+    parser.add_argument('--flood-syns', type=int, default=5000,
+                        help='Most SYNs sent by one flooder')
+    parser.add_argument('--spoofed', type=int, default=200000,
+                        help='Single-SYN packets from random spoofed sources')
+    parser.add_argument('--window', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    packets = build_trace(args, rng)
+    sources = {src for _t, src, _p, _s in packets}
+    print(f"Trace: {len(packets)} packets from {len(sources)} sources")
+
+    # ThreatDetector defaults: 10 ports and 100 SYNs per minute
+    port_threshold, syn_threshold = 10 * args.window / 60, 100 * args.window / 60
+    end = packets[-1][0]
+
+    memory = args.memory_kb * 1024
+    factories = {
+        'exact': lambda: (SlidingWindowDistinct(args.window, 12, max_items=1 << 16),
+                          SlidingWindowCounter(args.window, 12), HeavyHitters(100)),
+        'sketch': lambda: (DistinctSketch.with_memory(memory // 2, depth=args.depth,
+                                                       window=args.window),
+                           CountMinSketch.with_memory(memory // 2, window=args.window),
+                           HeavyHitters(100))
+    }
+
+    counters, results = {}, {}
+    print(f"{'':<8} {'retained':>12} {'us/packet':>10} {'scans':>7} {'floods':>7}")
+    for name, factory in factories.items():
+        counters[name], elapsed, flagged = replay(packets, factory, port_threshold, syn_threshold)
+        retained = retained_memory(packets, factory, port_threshold, syn_threshold)
+        results[name] = flagged
+        print(f"{name:<8} {retained / 1024:>10.0f}KB {elapsed / len(packets) * 1e6:>10.2f} "
+              f"{len(flagged['PORT_SCAN']):>7} {len(flagged['DOS_ATTACK']):>7}")
+    exact, sketch = counters['exact'], counters['sketch']
+
+    scanners = [f'172.16.0.{i + 1}' for i in range(args.scanners)]
+    flooders = [f'172.17.0.{i + 1}' for i in range(args.flooders)]
+    background = rng.sample(sorted(s for s in sources if s.startswith('10.')),
+                            min(2000, args.background))
+
+    print(f"\n{'Error vs exact':<20} {'relative mean / max':>22} {'absolute mean / max':>22}")
+    for label, exact_counter, sketch_counter, keys in (
+            ('scanner ports', exact[0], sketch[0], scanners),
+            ('background ports', exact[0], sketch[0], background),
+            ('flooder SYNs', exact[1], sketch[1], flooders),
+            ('background SYNs', exact[1], sketch[1], background)):
+        mean, worst, mean_abs, worst_abs = errors(exact_counter, sketch_counter, keys, end)
+        print(f"  {label:<18} {mean:>12.1%} / {worst:<7.1%} {mean_abs:>12.1f} / {worst_abs}")
+
+    print("\nDetection vs exact:")
+    for threat in ('PORT_SCAN', 'DOS_ATTACK'):
+        truth, found = results['exact'][threat], results['sketch'][threat]
+        print(f"  {threat:<11} missed {len(truth - found):>4}  extra {len(found - truth):>4}")
+
+    attackers = set(scanners + flooders)
+    top = {ip for ip, _count, _error in sketch[2].top(len(attackers))}
+    print(f"\nHeavy-hitter recall of the {len(attackers)} attackers: "
+          f"{len(top & attackers) / len(attackers):.0%}")
+
+
+if __name__ == '__main__':
+    main()
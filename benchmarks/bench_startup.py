@@ -0,0 +1,122 @@
+"""
+Controller Startup Benchmark
+
+Breaks controller cold start down into module imports, database
+initialization and ML model loading. Every measurement runs in a fresh
+interpreter, since a warm one has everything imported already, and the
+median of several runs is reported.
+
+The model phase trains a forest with the parameters of
+models/train_models.py, saves it as a model bundle and loads it two ways,
+each followed by one prediction:
+
+  * unpickling the bundle and compiling the forest (what happens when
+    there is no up-to-date compiled forest next to the pickle), which
+    also imports scikit-learn,
+  * memory-mapping the compiled forest saved with the bundle.
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.detection.model_bundle import ModelBundle
+from bench_ml_batch import synthetic_data
+
+PRELUDE = f"""
+import json, sys, time
+sys.path.insert(0, {str(ROOT)!r})
+import logging
+logging.disable(logging.CRITICAL)
+"""
+
+PHASES = [
+    ('import src.detection.ml_detector', """
+start = time.perf_counter()
+import src.detection.ml_detector
+elapsed = time.perf_counter() - start
+"""),
+    ('import src.controller.threat_detector', """
+start = time.perf_counter()
+import src.controller.threat_detector
+elapsed = time.perf_counter() - start
+"""),
+    ('import src.controller.sdn_controller', """
+start = time.perf_counter()
+import src.controller.sdn_controller
+elapsed = time.perf_counter() - start
+"""),
+    ('database init (engine, create_all)', """
+from src.database.database import DatabaseManager
+start = time.perf_counter()
+DatabaseManager(url='sqlite:///{tmpdir}/bench.db').engine
+elapsed = time.perf_counter() - start
+"""),
+    ('model load: unpickle + compile', """
+import numpy as np
+from src.detection.model_bundle import ModelBundle
+row = np.ones((1, 9))
+start = time.perf_counter()
+ModelBundle.load('{tmpdir}/model.pkl', mmap=False).predict_proba(row)
+elapsed = time.perf_counter() - start
+"""),
+    ('model load: memory-mapped', """
+import numpy as np
+from src.detection.model_bundle import ModelBundle
+row = np.ones((1, 9))
+start = time.perf_counter()
+ModelBundle.load('{tmpdir}/model.pkl').predict_proba(row)
+elapsed = time.perf_counter() - start
+"""),
+]
+
+
+def run_phase(code, tmpdir):
+    """Seconds one phase takes in a fresh interpreter"""
+    script = PRELUDE + code.format(tmpdir=tmpdir) + "\nprint(json.dumps(elapsed))\n"
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    import argparse
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    parser = argparse.ArgumentParser(description='Benchmark controller startup phases')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--samples', type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    X, y = synthetic_data(rng, args.samples)
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=args.trees, max_depth=20, min_samples_split=5,
+                                   min_samples_leaf=2, random_state=42, n_jobs=-1)
+    model.fit(scaler.transform(X), y)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bundle = ModelBundle.from_training(model, scaler)
+        bundle.save(f'{tmpdir}/model.pkl')
+        forest = bundle.compile()
+        size = Path(f'{tmpdir}/model.pkl').stat().st_size
+        print(f"Model: {args.trees} trees, {forest.n_nodes} nodes; pickle {size / 2**20:.1f} MB, "
+              f"compiled arrays {forest.nbytes() / 2**20:.1f} MB")
+        print(f"{'phase':<40} {'ms (median of ' + str(args.runs) + ')':>20}")
+        for name, code in PHASES:
+            times = [run_phase(code, tmpdir) for _ in range(args.runs)]
+            print(f"{name:<40} {statistics.median(times) * 1000:>20.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,9 @@ Trains a Random Forest classifier for network traffic anomaly detection
 using the CICIDS2017 dataset or synthetic data.
 """
 
+import sys
 import numpy as np
 import pandas as pd
-import joblib
 from pathlib import Path
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
@@ -15,6 +15,11 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 import warnings
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.detection.flow_features import ML_FEATURE_NAMES
+from src.detection.model_bundle import ModelBundle, ATTACK_TYPES, forest_path
+
 warnings.filterwarnings('ignore')
 
 class ModelTrainer:
@@ -22,12 +27,11 @@ class ModelTrainer:
         self.model_path = Path(model_path)
         self.model = None
         self.scaler = None
-        self.feature_names = [
-            'packet_count', 'byte_count', 'duration',
-            'packets_per_second', 'bytes_per_packet',
-            'protocol', 'src_port', 'dst_port', 'tcp_flags'
-        ]
-        self.attack_types = ['BENIGN', 'DOS', 'PROBE', 'R2L', 'U2R']
+        self.bundle = None
+        self.metrics = {}
+        # The controller's feature extractor defines the schema
+        self.feature_names = list(ML_FEATURE_NAMES)
+        self.attack_types = list(ATTACK_TYPES)
     
     def generate_synthetic_data(self, n_samples=10000):
         """Generate synthetic training data"""
@@ -144,6 +148,7 @@ class ModelTrainer:
         # Select features
         feature_cols = [col for col in df.columns if col != 'Label']
         X = df[feature_cols].fillna(0).values
+        self.feature_names = feature_cols
         y = df['Label'].map(label_map).fillna(0).values.astype(int)
         
         print(f"Loaded {len(X)} samples with {X.shape[1]} features")
@@ -183,6 +188,7 @@ class ModelTrainer:
         
         accuracy = accuracy_score(y_test, y_pred)
         print(f"Accuracy: {accuracy:.4f}")
+        self.metrics = {'accuracy': round(float(accuracy), 4), 'test_samples': len(y_test)}
         
         print("\nClassification Report:")
         print(classification_report(y_test, y_pred, 
@@ -207,14 +213,13 @@ class ModelTrainer:
         
         self.model_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Save model
-        joblib.dump(self.model, self.model_path)
-        print(f"Model saved to {self.model_path}")
-        
-        # Save scaler
-        scaler_path = self.model_path.parent / 'scaler.pkl'
-        joblib.dump(self.scaler, scaler_path)
-        print(f"Scaler saved to {scaler_path}")
+        # One bundle holds the model, its scaler and the feature schema; its
+        # compiled forest is saved alongside for memory-mapped loading
+        bundle = ModelBundle.from_training(self.model, self.scaler, self.feature_names,
+                                           self.attack_types, self.metrics)
+        bundle.save(self.model_path)
+        print(f"Model bundle version {bundle.version} saved to {self.model_path}")
+        print(f"Compiled forest saved to {forest_path(self.model_path)}")
     
     def load_model(self):
         """Load pre-trained model"""
@@ -222,13 +227,18 @@ class ModelTrainer:
             print(f"Model file not found: {self.model_path}")
             return False
         
-        self.model = joblib.load(self.model_path)
+        try:
+            bundle = ModelBundle.load(self.model_path)
+        except ValueError as e:
+            print(f"Cannot load model bundle: {e}")
+            return False
         
-        scaler_path = self.model_path.parent / 'scaler.pkl'
-        if scaler_path.exists():
-            self.scaler = joblib.load(scaler_path)
+        # The scaler's parameters stay in the bundle, folded into its compiled forest
+        self.bundle = bundle
+        self.model = bundle.model
+        self.metrics = bundle.metrics
         
-        print(f"Model loaded from {self.model_path}")
+        print(f"Model version {bundle.version} loaded from {self.model_path}")
         return True
 
 def main():
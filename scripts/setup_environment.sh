@@ -77,7 +77,7 @@ echo "Setup Complete!"
 echo "=========================================="
 echo ""
 echo "Next steps:"
-echo "1. Start Ryu controller: ryu-manager src/controller/sdn_controller.py"
+echo "1. Start Ryu controller: ryu-manager --observe-links src/controller/sdn_controller.py"
 echo "2. Start dashboard: python3 src/dashboard/app.py"
 echo "3. Run topology: python3 src/network/topology.py simple"
 echo "4. Run demo: ./scripts/run_demo.sh"
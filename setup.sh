@@ -238,7 +238,7 @@ print_instructions() {
 Next steps to run the system:
 
 1. Start the Ryu Controller:
-   ryu-manager src/controller/sdn_controller.py
+   ryu-manager --observe-links src/controller/sdn_controller.py
 
 2. In another terminal, start the Dashboard:
    python3 src/dashboard/app.py
@@ -12,18 +12,16 @@ __version__ = "1.0.0"
 __author__ = "Abhidutta Mukund Giri, Avishi Bansal, Piyush"
 __license__ = "Educational Use"
 
-# Import main components for easy access
-try:
-    from src.controller.sdn_controller import SDNIDPSController
-    from src.detection.suricata_monitor import SuricataMonitor
-    from src.dashboard.app import create_app
-    from src.database.database import db
-except ImportError as e:
-    print(f"Warning: Could not import some modules: {e}")
+# Main components, imported on first access (see src/utils/lazy_import.py)
+from .utils.lazy_import import lazy_exports
 
-__all__ = [
-    'SDNIDPSController',
-    'SuricataMonitor',
-    'create_app',
-    'db'
-]
+_EXPORTS = {
+    'SDNIDPSController': '.controller.sdn_controller',
+    'SuricataMonitor': '.detection.suricata_monitor',
+    'create_app': '.dashboard.app',
+    'db': '.database.database'
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
@@ -8,23 +8,22 @@ Handles:
 - Demo scenarios
 """
 
-from .attack_base import AttackBase
-from .attack_manager import AttackManager
-from .dos_attack import DoSAttack, UDPFloodAttack, ICMPFloodAttack
-from .port_scan import PortScanAttack
-from .mitm_attack import MITMAttack
-from .sql_injection import SQLInjectionAttack, BlindSQLInjection
-from .brute_force import BruteForceAttack
+from ..utils.lazy_import import lazy_exports
 
-__all__ = [
-    'AttackBase',
-    'AttackManager',
-    'DoSAttack',
-    'UDPFloodAttack',
-    'ICMPFloodAttack',
-    'PortScanAttack',
-    'MITMAttack',
-    'SQLInjectionAttack',
-    'BlindSQLInjection',
-    'BruteForceAttack'
-]
+# Imported on first access; see src/utils/lazy_import.py
+_EXPORTS = {
+    'AttackBase': '.attack_base',
+    'AttackManager': '.attack_manager',
+    'DoSAttack': '.dos_attack',
+    'UDPFloodAttack': '.dos_attack',
+    'ICMPFloodAttack': '.dos_attack',
+    'PortScanAttack': '.port_scan',
+    'MITMAttack': '.mitm_attack',
+    'SQLInjectionAttack': '.sql_injection',
+    'BlindSQLInjection': '.sql_injection',
+    'BruteForceAttack': '.brute_force'
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
@@ -8,14 +8,16 @@ Handles:
 - Policy enforcement
 """
 
-from .sdn_controller import SDNIDPSController
-from .flow_manager import FlowManager
-from .threat_detector import ThreatDetector
-from .policy_enforcer import PolicyEnforcer
+from ..utils.lazy_import import lazy_exports
 
-__all__ = [
-    'SDNIDPSController',
-    'FlowManager',
-    'ThreatDetector',
-    'PolicyEnforcer'
-]
+# Imported on first access; see src/utils/lazy_import.py
+_EXPORTS = {
+    'SDNIDPSController': '.sdn_controller',
+    'FlowManager': '.flow_manager',
+    'ThreatDetector': '.threat_detector',
+    'PolicyEnforcer': '.policy_enforcer'
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
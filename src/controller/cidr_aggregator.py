@@ -0,0 +1,184 @@
+"""
+CIDR aggregation of blocked addresses
+
+Blocked IPv4 addresses (or prefixes) are stored in a binary prefix tree
+keyed on the address bits. A node is "full" when it was blocked
+explicitly or both of its children are full, and the aggregate blocklist
+is the set of maximal full nodes: adjacent and covered entries collapse
+into the fewest CIDR prefixes. Each add/remove returns only the prefixes
+that left and entered the aggregate so callers can send incremental
+FlowMods.
+"""
+
+import ipaddress
+
+# Node layout: [child_0, child_1, blocked, full]
+_ZERO, _ONE, _BLOCKED, _FULL = 0, 1, 2, 3
+
+
+def _new_node():
+    return [None, None, False, False]
+
+
+def _parse(address):
+    """Return (network int, prefix length) for an address or CIDR string"""
+    network = ipaddress.IPv4Network(address, strict=False)
+    return int(network.network_address), network.prefixlen
+
+
+def prefix_to_match(network, prefixlen):
+    """Return an OFPMatch ipv4_src value for a prefix"""
+    address = str(ipaddress.IPv4Address(network))
+    if prefixlen == 32:
+        return address
+    return (address, str(ipaddress.IPv4Network((network, prefixlen)).netmask))
+
+
+def prefix_to_str(network, prefixlen):
+    """Return a prefix in CIDR notation"""
+    return f"{ipaddress.IPv4Address(network)}/{prefixlen}"
+
+
+class CIDRAggregator:
+    def __init__(self):
+        self._root = _new_node()
+        self.entries = set()  # explicit (network, prefixlen) entries
+        self.aggregate = set()  # minimal covering (network, prefixlen) set
+
+    def add(self, address):
+        """Block address; returns (removed, added) aggregate prefixes"""
+        network, prefixlen = _parse(address)
+        if (network, prefixlen) in self.entries:
+            return [], []
+        self.entries.add((network, prefixlen))
+
+        path = self._walk(network, prefixlen, create=True)
+        covered = any(node[_FULL] for node in path)
+
+        path[-1][_BLOCKED] = True
+        self._refresh(path)
+        if covered:
+            return [], []
+
+        top_depth = self._top_full_depth(path)
+        top_prefix = self._prefix_at(network, top_depth)
+        removed = self._collect(path[top_depth], *top_prefix, self.aggregate.__contains__)
+
+        self.aggregate.difference_update(removed)
+        self.aggregate.add(top_prefix)
+        return removed, [top_prefix]
+
+    def remove(self, address):
+        """Unblock address; returns (removed, added) aggregate prefixes"""
+        network, prefixlen = _parse(address)
+        if (network, prefixlen) not in self.entries:
+            return [], []
+        self.entries.discard((network, prefixlen))
+
+        path = self._walk(network, prefixlen, create=False)
+        top_depth = self._top_full_depth(path)
+        top_prefix = self._prefix_at(network, top_depth)
+
+        path[-1][_BLOCKED] = False
+        self._refresh(path)
+        self._prune(path, network)
+        if path[top_depth][_FULL]:
+            return [], []
+
+        added = self._collect(path[top_depth], *top_prefix)
+        self.aggregate.discard(top_prefix)
+        self.aggregate.update(added)
+        return [top_prefix], added
+
+    def contains(self, address):
+        """Check whether address is covered by the aggregate"""
+        network, prefixlen = _parse(address)
+        node = self._root
+        for depth in range(prefixlen + 1):
+            if node[_FULL]:
+                return True
+            if depth == prefixlen:
+                break
+            node = node[(network >> (31 - depth)) & 1]
+            if node is None:
+                return False
+        return False
+
+    def prefixes(self):
+        """Return the aggregate as sorted CIDR strings"""
+        return [prefix_to_str(n, p) for n, p in sorted(self.aggregate)]
+
+    def _walk(self, network, prefixlen, create):
+        """Return the nodes from the root down to the prefix"""
+        node = self._root
+        path = [node]
+        for depth in range(prefixlen):
+            bit = (network >> (31 - depth)) & 1
+            child = node[bit]
+            if child is None:
+                if not create:
+                    break
+                child = node[bit] = _new_node()
+            node = child
+            path.append(node)
+        return path
+
+    @staticmethod
+    def _refresh(path):
+        """Recompute full flags bottom-up along a path"""
+        for node in reversed(path):
+            zero, one = node[_ZERO], node[_ONE]
+            node[_FULL] = node[_BLOCKED] or (
+                zero is not None and one is not None and zero[_FULL] and one[_FULL])
+
+    @staticmethod
+    def _top_full_depth(path):
+        """Depth of the highest full node on path"""
+        for depth, node in enumerate(path):
+            if node[_FULL]:
+                return depth
+        return len(path) - 1
+
+    @staticmethod
+    def _prefix_at(network, depth):
+        """The depth-bit prefix of network"""
+        mask = (0xffffffff << (32 - depth)) & 0xffffffff
+        return network & mask, depth
+
+    @staticmethod
+    def _collect(node, network, prefixlen, stop=None):
+        """Collect the topmost prefixes under node for which stop is true.
+
+        stop defaults to the node's full flag, which yields the maximal
+        full prefixes of the subtree.
+        """
+        found = []
+        stack = [(node, network, prefixlen)]
+        while stack:
+            node, network, prefixlen = stack.pop()
+            if stop((network, prefixlen)) if stop else node[_FULL]:
+                found.append((network, prefixlen))
+                continue
+            for bit in (0, 1):
+                child = node[bit]
+                if child is not None:
+                    stack.append((child, network | (bit << (31 - prefixlen)), prefixlen + 1))
+        return found
+
+    @staticmethod
+    def _prune(path, network):
+        """Drop empty leaves left behind by a removal"""
+        for depth in range(len(path) - 1, 0, -1):
+            node = path[depth]
+            if node[_BLOCKED] or node[_ZERO] is not None or node[_ONE] is not None:
+                break
+            bit = (network >> (31 - (depth - 1))) & 1
+            path[depth - 1][bit] = None
+
+    def get_statistics(self):
+        """Get entry vs rule counts"""
+        return {
+            'entries': len(self.entries),
+            'rules': len(self.aggregate),
+            'rules_saved': len(self.entries) - len(self.aggregate)
+        }
@@ -0,0 +1,243 @@
+"""
+Pluggable packet detectors
+
+A detector is a callable that takes a FlowFeatures record and returns the
+threat names it found (empty when the packet looks clean). Each one
+declares a relative cost and whether a hit is decisive, and evaluate()
+runs them cheapest first:
+
+- Stateful detectors (per-source rate counters) run on every packet so
+  their history stays accurate whatever the others decide.
+- Stateless detectors are skipped once a decisive detector has fired, and
+  those costing shed_cost or more are skipped while load shedding is on.
+
+Detectors that look past the cache key (payload inspection) are
+registered with cacheable=False. On a cache miss, cacheable and
+uncacheable stateless detectors run together in cost order, so a cheap
+payload match can decide a packet before the model is consulted. The
+verdict of the cacheable detectors is then kept in the optional
+VerdictCache, unless it is partial: a shed detector was skipped, or an
+uncacheable detector decided before every cacheable one ran. On a hit,
+the uncacheable detectors run on every packet the cached verdict did not
+already decide.
+
+A stateless detector may return None to defer its verdict, for instance
+until it knows every packet of a batch it has to classify. The packet's
+evaluation stops there, and resume() later carries on from that
+detector, so nothing before it runs or is looked up twice.
+"""
+
+import time
+from ..utils.logger import setup_logger
+
+logger = setup_logger('detector_registry')
+
+
+class Detector:
+    """A registered detector and its invocation counters"""
+
+    def __init__(self, name, check, cost=1.0, decisive=False, stateful=False, cacheable=True):
+        self.name = name
+        self.check = check
+        self.cost = cost
+        self.decisive = decisive
+        self.stateful = stateful
+        self.cacheable = cacheable
+
+        # Statistics
+        self.calls = 0
+        self.hits = 0
+        self.skipped = 0
+        self.shed = 0
+        self.total_time = 0.0
+
+    def run(self, features):
+        """Call the detector, timing it"""
+        start = time.perf_counter()
+        threats = self.check(features)
+        if threats is None:
+            return None  # deferred
+        self.total_time += time.perf_counter() - start
+        self.calls += 1
+        if threats:
+            self.hits += 1
+        return threats
+
+    def get_statistics(self):
+        """Get invocation counts and cumulative time"""
+        return {
+            'name': self.name,
+            'cost': self.cost,
+            'decisive': self.decisive,
+            'stateful': self.stateful,
+            'cacheable': self.cacheable,
+            'calls': self.calls,
+            'hits': self.hits,
+            'skipped': self.skipped,
+            'shed': self.shed,
+            'total_ms': self.total_time * 1000,
+            'avg_us': self.total_time / self.calls * 1e6 if self.calls else 0.0
+        }
+
+
+class DetectorRegistry:
+    def __init__(self, verdict_cache=None, shed_cost=10.0):
+        self.verdict_cache = verdict_cache
+        self.shed_cost = shed_cost
+        self.detectors = {}  # {name: Detector}
+        self._stateful = []  # cost order
+        self._stateless = []  # cost order, cacheable or not
+        self._uncached = []  # cost order, stateless but not cacheable
+
+        self.shedding = False
+        self.packets = 0
+        self.shed_packets = 0
+
+    def register(self, name, check, cost=1.0, decisive=False, stateful=False, cacheable=True):
+        """Add a detector; check(features) returns a sequence of threat names"""
+        if name in self.detectors:
+            raise ValueError(f"Detector already registered: {name}")
+
+        detector = Detector(name, check, cost, decisive, stateful, cacheable)
+        self.detectors[name] = detector
+        self._reorder()
+        if not stateful and cacheable:
+            self._invalidate(f"detector {name} registered")
+        logger.info(f"Detector registered: {name} (cost {cost})")
+        return detector
+
+    def unregister(self, name):
+        """Remove a detector; returns False if it was not registered"""
+        detector = self.detectors.pop(name, None)
+        if detector is None:
+            return False
+
+        self._reorder()
+        if not detector.stateful and detector.cacheable:
+            self._invalidate(f"detector {name} unregistered")
+        logger.info(f"Detector unregistered: {name}")
+        return True
+
+    def _reorder(self):
+        """Sort by cost, keeping registration order between equal costs"""
+        ordered = sorted(self.detectors.values(), key=lambda d: d.cost)
+        self._stateful = [d for d in ordered if d.stateful]
+        self._stateless = [d for d in ordered if not d.stateful]
+        self._uncached = [d for d in ordered if not d.stateful and not d.cacheable]
+
+    def _invalidate(self, reason):
+        if self.verdict_cache is not None:
+            self.verdict_cache.invalidate(reason)
+
+    def set_shedding(self, active):
+        """Skip expensive stateless detectors while active"""
+        if active != self.shedding:
+            self.shedding = active
+            if active:
+                logger.warning(f"Load shedding on: skipping detectors with cost >= {self.shed_cost}")
+            else:
+                logger.info("Load shedding off")
+
+    def evaluate(self, features, deferred=None):
+        """Run the detectors on one packet and return the threats found.
+
+        If a stateless detector defers its verdict, the stateful threats
+        are returned and (features, state) is appended to deferred, when
+        given, for resume().
+        """
+        self.packets += 1
+        if self.shedding:
+            self.shed_packets += 1
+
+        threats = []
+        decided = False
+        for detector in self._stateful:
+            found = detector.run(features)
+            if found:
+                threats.extend(found)
+                decided = decided or detector.decisive
+
+        if decided:
+            for detector in self._stateless:
+                detector.skipped += 1
+            return threats
+
+        stateless, progress = self._stateless_threats(features)
+        if stateless is None:
+            if deferred is not None:
+                deferred.append((features, (threats, progress)))
+            return threats
+        return threats + stateless
+
+    def resume(self, features, state):
+        """Finish a deferred evaluation, starting at the detector that deferred"""
+        threats, progress = state
+        stateless, _progress = self._run_stateless(features, progress)
+        return threats + (stateless or [])
+
+    def _stateless_threats(self, features):
+        """(threats, None) from the stateless detectors, or (None, progress) if one deferred"""
+        cache = self.verdict_cache
+        key = None
+        verdict = ()
+        detectors = self._stateless
+        if cache is not None:
+            key = cache.flow_key(features)
+            cached = cache.get(key)
+            if cached is not None:
+                verdict, decided = cached
+                if decided:
+                    for detector in self._uncached:
+                        detector.skipped += 1
+                    return list(verdict), None
+                detectors = self._uncached
+                key = None  # nothing new to cache
+
+        return self._run_stateless(features, (key, verdict, detectors, 0, [], [], True))
+
+    def _run_stateless(self, features, progress):
+        """Run detectors in order from where progress left off.
+
+        progress is (cache key or None, cached verdict, detectors, next
+        index, threats, threats from cacheable detectors, complete), where
+        complete means the cacheable detectors' verdict does not depend on
+        what was skipped. The verdict is cached when complete.
+        """
+        key, verdict, detectors, start, threats, cacheable, complete = progress
+        decided = False
+        for index in range(start, len(detectors)):
+            detector = detectors[index]
+            if self.shedding and detector.cost >= self.shed_cost:
+                detector.shed += 1
+                complete = complete and not detector.cacheable
+                continue
+
+            found = detector.run(features)
+            if found is None:
+                return None, (key, verdict, detectors, index, threats, cacheable, complete)
+            if found:
+                threats.extend(found)
+                if detector.cacheable:
+                    cacheable.extend(found)
+                if detector.decisive:
+                    rest = detectors[index + 1:]
+                    for skipped in rest:
+                        skipped.skipped += 1
+                    decided = detector.cacheable
+                    complete = complete and (decided or not any(d.cacheable for d in rest))
+                    break
+
+        if key is not None and complete:
+            self.verdict_cache.put(key, (tuple(cacheable), decided))
+        return list(verdict) + threats, None
+
+    def get_statistics(self):
+        """Get per-detector statistics in evaluation order"""
+        return {
+            'shedding': self.shedding,
+            'shed_cost': self.shed_cost,
+            'packets': self.packets,
+            'shed_packets': self.shed_packets,
+            'detectors': [d.get_statistics()
+                          for d in self._stateful + self._stateless]
+        }
@@ -1,31 +1,135 @@
 from ryu.ofproto import ofproto_v1_3
 from ..utils.logger import setup_logger
 from ..database.database import db
+from ..monitoring.performance_monitor import PerformanceMonitor
+from ..utils.config import config
+from datetime import datetime, timedelta
+import itertools
 import json
+import time
 
 logger = setup_logger('flow_manager')
 
+class FlowBatch:
+    """FlowMods collected per datapath and transmitted together"""
+    
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.flow_mods = {}  # {datapath_id: (datapath, [flow_mod])}
+        self.pending = set()  # datapath ids awaiting a barrier reply
+        self.barrier_xids = {}  # {datapath_id: barrier xid}
+        self.bundle_xids = {}  # {datapath_id: [bundle message xids]}
+        self.sent_at = None
+        self.completed = False
+        self.install_ms = None
+    
+    def add(self, datapath, mod):
+        """Queue a FlowMod for datapath"""
+        self.flow_mods.setdefault(datapath.id, (datapath, []))[1].append(mod)
+    
+    def __len__(self):
+        return sum(len(mods) for _dp, mods in self.flow_mods.values())
+
 class FlowManager:
     def __init__(self):
         self.flows = {}  # {datapath_id: {flow_id: flow_data}}
         
-    def install_flow(self, datapath, priority, match, actions, idle_timeout=0, hard_timeout=0):
-        """Install flow rule on switch"""
+        # Installed-rule cache: {datapath_id: {rule_key: (flow_id, expires_at)}}
+        self.installed_rules = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_expired = 0
+        
+        # Batched transmission
+        self.use_bundles = config.get('flow_batch.use_bundles', True)
+        self.bundle_support = {}  # {datapath_id: False} once a switch rejects bundles
+        self._bundle_ids = itertools.count(1)
+        self._pending_barriers = {}  # {(datapath_id, xid): FlowBatch}
+        self._bundle_messages = {}  # {(datapath_id, xid): FlowBatch}
+        self.batches_sent = 0
+        self.batches_completed = 0
+        self.batched_flow_mods = 0
+        self.bundle_fallbacks = 0
+        self.performance = PerformanceMonitor()
+        
+        # Flow table layout: a security table holding drop rules that
+        # continues to an L2 forwarding table, or everything in table 0
+        self.multi_table = config.get('flow_tables.multi_table', False)
+        if self.multi_table:
+            self.security_table = config.get('flow_tables.security_table', 0)
+            self.forwarding_table = config.get('flow_tables.forwarding_table', 1)
+        else:
+            self.security_table = 0
+            self.forwarding_table = 0
+    
+    @staticmethod
+    def rule_key(priority, match, actions, table_id=0, goto_table=None, meter_id=None):
+        """Canonical, hashable identity of a rule's table/match/priority/actions"""
+        return (table_id, priority, tuple(match.items()),
+                tuple(str(a) for a in actions), goto_table, meter_id)
+    
+    def _lookup_installed(self, dpid, key, now):
+        """Return the cached flow id for key if the rule is still installed"""
+        rules = self.installed_rules.get(dpid)
+        if not rules:
+            return None
+        
+        entry = rules.get(key)
+        if entry is None:
+            return None
+        
+        flow_id, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del rules[key]
+            self.cache_expired += 1
+            return None
+        
+        return flow_id
+    
+    def install_flow(self, datapath, priority, match, actions, idle_timeout=0, hard_timeout=0,
+                     batch=None, table_id=0, goto_table=None, flags=0, meter_id=None):
+        """Install flow rule on switch, skipping rules already installed.
+        
+        With a FlowBatch the FlowMod is queued and sent by send_batch().
+        goto_table continues matching packets in another table after
+        applying actions. flags are OFPFlowMod flags such as
+        OFPFF_SEND_FLOW_REM. meter_id passes matching packets through a
+        meter first.
+        """
+        now = time.monotonic()
+        key = self.rule_key(priority, match, actions, table_id, goto_table, meter_id)
+        cached_id = self._lookup_installed(datapath.id, key, now)
+        if cached_id is not None:
+            self.cache_hits += 1
+            return cached_id
+        self.cache_misses += 1
+        
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        inst = []
+        if meter_id is not None:
+            inst.append(parser.OFPInstructionMeter(meter_id, ofproto.OFPIT_METER))
+        if actions or goto_table is None:
+            inst.append(parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions))
+        if goto_table is not None:
+            inst.append(parser.OFPInstructionGotoTable(goto_table))
         
         mod = parser.OFPFlowMod(
             datapath=datapath,
+            table_id=table_id,
             priority=priority,
             match=match,
             instructions=inst,
             idle_timeout=idle_timeout,
-            hard_timeout=hard_timeout
+            hard_timeout=hard_timeout,
+            flags=flags
         )
         
-        datapath.send_msg(mod)
+        if batch is not None:
+            batch.add(datapath, mod)
+        else:
+            datapath.send_msg(mod)
         
         # Store in database
         flow_data = {
@@ -33,29 +137,252 @@ class FlowManager:
             'priority': priority,
             'match_fields': json.dumps(match.to_jsondict()),
             'actions': json.dumps([str(a) for a in actions]),
+            'expires_at': datetime.utcnow() + timedelta(seconds=hard_timeout) if hard_timeout else None,
             'active': True
         }
-        flow_id = db.insert_flow_rule(flow_data)
+        flow_id = db.queue_flow_rule(flow_data)
+        
+        # The switch may drop the rule after the shorter of its timeouts
+        timeouts = [t for t in (idle_timeout, hard_timeout) if t]
+        expires_at = now + min(timeouts) if timeouts else None
+        self.installed_rules.setdefault(datapath.id, {})[key] = (flow_id, expires_at)
         
-        logger.info(f"Flow installed on switch {datapath.id}: priority={priority}")
+        logger.info(f"Flow installed on switch {datapath.id}: table={table_id} priority={priority}")
         return flow_id
     
-    def delete_flow(self, datapath, match=None):
-        """Delete flow rule"""
+    def delete_flow(self, datapath, match=None, batch=None, table_id=0, priority=None):
+        """Delete flow rule.
+        
+        Without priority this is a non-strict delete, removing every rule
+        in the table whose match includes match. With priority only the
+        rule with exactly this match and priority is deleted.
+        """
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
+        match = match if match else parser.OFPMatch()
+        
+        if priority is None:
+            self._forget_matching(datapath.id, match, table_id)
+            command, priority = ofproto.OFPFC_DELETE, 0
+        else:
+            self._forget_exact(datapath.id, match, table_id, priority)
+            command = ofproto.OFPFC_DELETE_STRICT
         
         mod = parser.OFPFlowMod(
             datapath=datapath,
-            command=ofproto.OFPFC_DELETE,
+            table_id=table_id,
+            command=command,
+            priority=priority,
             out_port=ofproto.OFPP_ANY,
             out_group=ofproto.OFPG_ANY,
-            match=match if match else parser.OFPMatch()
+            match=match
         )
         
-        datapath.send_msg(mod)
+        if batch is not None:
+            batch.add(datapath, mod)
+        else:
+            datapath.send_msg(mod)
         logger.info(f"Flow deleted on switch {datapath.id}")
     
+    def begin_batch(self, callback=None):
+        """Start collecting FlowMods; callback(batch) runs once all switches ack"""
+        return FlowBatch(callback)
+    
+    def send_batch(self, batch):
+        """Send a batch's FlowMods and request one barrier per switch.
+        
+        Each switch gets an atomic ONF bundle (the OpenFlow 1.3 bundle
+        extension) unless it has rejected bundles before, in which case
+        the FlowMods are sent back-to-back. A barrier follows either way
+        and its reply marks the switch as done.
+        """
+        batch.sent_at = time.monotonic()
+        self.batches_sent += 1
+        self.batched_flow_mods += len(batch)
+        
+        for dpid, (datapath, mods) in batch.flow_mods.items():
+            if self.use_bundles and self.bundle_support.get(dpid, True):
+                self._send_bundle(batch, datapath, mods)
+            else:
+                for mod in mods:
+                    datapath.send_msg(mod)
+            self._send_barrier(batch, datapath)
+        
+        if not batch.pending:
+            self._complete_batch(batch)
+        return batch
+    
+    def _send_bundle(self, batch, datapath, mods):
+        """Send mods to datapath inside one atomic, ordered bundle"""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        bundle_id = next(self._bundle_ids)
+        flags = ofproto.ONF_BF_ATOMIC | ofproto.ONF_BF_ORDERED
+        
+        messages = [parser.ONFBundleCtrlMsg(datapath, bundle_id,
+                                            ofproto.ONF_BCT_OPEN_REQUEST, flags, [])]
+        for mod in mods:
+            add = parser.ONFBundleAddMsg(datapath, bundle_id, flags, mod, [])
+            datapath.set_xid(add)
+            # Switches require the inner message to carry the outer xid
+            if mod.xid is None:
+                mod.set_xid(add.xid)
+            messages.append(add)
+        messages.append(parser.ONFBundleCtrlMsg(datapath, bundle_id,
+                                                ofproto.ONF_BCT_COMMIT_REQUEST, flags, []))
+        
+        xids = batch.bundle_xids.setdefault(datapath.id, [])
+        for msg in messages:
+            if msg.xid is None:
+                datapath.set_xid(msg)
+            xids.append(msg.xid)
+            self._bundle_messages[(datapath.id, msg.xid)] = batch
+            datapath.send_msg(msg)
+    
+    def _send_barrier(self, batch, datapath):
+        """Request a barrier so the batch completes when datapath acks"""
+        req = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        datapath.set_xid(req)
+        batch.pending.add(datapath.id)
+        batch.barrier_xids[datapath.id] = req.xid
+        self._pending_barriers[(datapath.id, req.xid)] = batch
+        datapath.send_msg(req)
+    
+    def handle_barrier_reply(self, msg):
+        """Mark a switch's part of a batch as acknowledged"""
+        dpid = msg.datapath.id
+        batch = self._pending_barriers.pop((dpid, msg.xid), None)
+        if batch is None:
+            return
+        
+        for xid in batch.bundle_xids.pop(dpid, []):
+            self._bundle_messages.pop((dpid, xid), None)
+        batch.pending.discard(dpid)
+        if not batch.pending:
+            self._complete_batch(batch)
+    
+    def handle_error(self, msg):
+        """Resend a batch's FlowMods without a bundle if the bundle failed.
+        
+        An error on the open request means the switch does not support
+        bundles; an error on the commit means the atomic bundle was
+        discarded. Errors on individual adds are followed by a commit error.
+        """
+        dpid = msg.datapath.id
+        batch = self._bundle_messages.get((dpid, msg.xid))
+        if batch is None or dpid not in batch.pending:
+            return
+        
+        xids = batch.bundle_xids[dpid]
+        if msg.xid == xids[0]:
+            logger.warning(f"Switch {dpid} does not support bundles; "
+                           f"falling back to barrier batching")
+            self.bundle_support[dpid] = False
+        elif msg.xid == xids[-1]:
+            logger.warning(f"Bundle commit failed on switch {dpid}; resending FlowMods")
+        else:
+            return
+        self.bundle_fallbacks += 1
+        
+        # Forget the bundle and its barrier, then resend without a bundle
+        for xid in batch.bundle_xids.pop(dpid, []):
+            self._bundle_messages.pop((dpid, xid), None)
+        self._pending_barriers.pop((dpid, batch.barrier_xids.get(dpid)), None)
+        
+        datapath, mods = batch.flow_mods[dpid]
+        for mod in mods:
+            datapath.send_msg(mod)
+        self._send_barrier(batch, datapath)
+    
+    def _complete_batch(self, batch):
+        """Record install-to-ack latency and notify the caller"""
+        batch.completed = True
+        batch.install_ms = (time.monotonic() - batch.sent_at) * 1000
+        self.batches_completed += 1
+        self.performance.record_flow_installation(batch.install_ms)
+        
+        if batch.callback:
+            try:
+                batch.callback(batch)
+            except Exception as e:
+                logger.error(f"Flow batch callback failed: {e}")
+    
+    def _forget_matching(self, dpid, match, table_id=0):
+        """Drop cached rules a non-strict delete of match would remove"""
+        rules = self.installed_rules.get(dpid)
+        if not rules:
+            return
+        
+        all_tables = table_id == ofproto_v1_3.OFPTT_ALL
+        delete_items = set(match.items()) if match is not None else set()
+        removed = [rules.pop(k)[0] for k in list(rules)
+                   if (all_tables or k[0] == table_id) and delete_items.issubset(k[2])]
+        db.queue_flow_rules_inactive(removed)
+    
+    def _forget_exact(self, dpid, match, table_id, priority):
+        """Drop cached rules a strict delete of match at priority would remove"""
+        rules = self.installed_rules.get(dpid)
+        if not rules:
+            return
+        
+        match_items = tuple(match.items())
+        removed = [rules.pop(k)[0] for k in list(rules)
+                   if k[0] == table_id and k[1] == priority and k[2] == match_items]
+        db.queue_flow_rules_inactive(removed)
+    
+    def handle_flow_removed(self, msg):
+        """Forget a rule the switch reports as removed and mark it inactive.
+        
+        Returns the flow ids of the cached rules it matched.
+        """
+        rules = self.installed_rules.get(msg.datapath.id)
+        if not rules:
+            return []
+        
+        match_items = tuple(msg.match.items())
+        removed = [rules.pop(k)[0] for k in list(rules)
+                   if k[0] == msg.table_id and k[1] == msg.priority and k[2] == match_items]
+        db.queue_flow_rules_inactive(removed)
+        return removed
+    
+    def install_pipeline(self, datapath):
+        """Install table-miss entries for the configured table layout"""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        to_controller = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
+                                                ofproto.OFPCML_NO_BUFFER)]
+        
+        if self.multi_table:
+            # Security table: anything not dropped continues to forwarding
+            self.install_flow(datapath, 0, parser.OFPMatch(), [],
+                              table_id=self.security_table,
+                              goto_table=self.forwarding_table)
+        
+        # Forwarding table miss: send to controller for L2 learning
+        self.install_flow(datapath, 0, parser.OFPMatch(), to_controller,
+                          table_id=self.forwarding_table)
+    
+    def forget_datapath(self, dpid):
+        """Forget cached rules for a switch that disconnected or reset"""
+        self.installed_rules.pop(dpid, None)
+        self.bundle_support.pop(dpid, None)
+    
+    def get_statistics(self):
+        """Get installed-rule cache and batch transmission statistics"""
+        return {
+            'cached_rules': sum(len(r) for r in self.installed_rules.values()),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_expired': self.cache_expired,
+            'flow_mods_avoided': self.cache_hits,
+            'db_writes_avoided': self.cache_hits,
+            'batches_sent': self.batches_sent,
+            'batches_completed': self.batches_completed,
+            'batched_flow_mods': self.batched_flow_mods,
+            'bundle_fallbacks': self.bundle_fallbacks,
+            'install_to_ack_ms': self.performance.get_statistics()['flow_installation']
+        }
+    
     def get_flow_stats(self, datapath):
         """Request flow statistics"""
         ofproto = datapath.ofproto
@@ -0,0 +1,119 @@
+"""
+OpenFlow 1.3 meter allocation
+
+Meters are allocated per datapath and shared by every flow limited to
+the same rate: acquire() returns the existing meter for a (rate, unit)
+pair or installs a new one with a single drop band, and release() frees
+the meter once the last flow using it is gone.
+"""
+
+from ..utils.logger import setup_logger
+
+logger = setup_logger('meter_manager')
+
+UNIT_PKTPS = 'pktps'
+UNIT_KBPS = 'kbps'
+
+
+class MeterManager:
+    def __init__(self, max_meters=1024):
+        self.max_meters = max_meters
+        self.meters = {}  # {datapath_id: {(rate, unit): [meter_id, refcount]}}
+        self.meter_rates = {}  # {(datapath_id, meter_id): (rate, unit)}
+        self.free_ids = {}  # {datapath_id: [meter_id]}
+        self.next_ids = {}  # {datapath_id: next unused meter_id}
+
+        # Statistics
+        self.meters_installed = 0
+        self.meters_removed = 0
+        self.meters_reused = 0
+        self.allocation_failures = 0
+
+    def acquire(self, datapath, rate, unit=UNIT_PKTPS):
+        """Return a meter id limiting to rate, installing it if needed"""
+        dpid = datapath.id
+        meters = self.meters.setdefault(dpid, {})
+        entry = meters.get((rate, unit))
+        if entry is not None:
+            entry[1] += 1
+            self.meters_reused += 1
+            return entry[0]
+
+        meter_id = self._allocate_id(dpid)
+        if meter_id is None:
+            self.allocation_failures += 1
+            logger.warning(f"No free meters on switch {dpid}")
+            return None
+
+        self._send_meter_mod(datapath, datapath.ofproto.OFPMC_ADD, meter_id, rate, unit)
+        meters[(rate, unit)] = [meter_id, 1]
+        self.meter_rates[(dpid, meter_id)] = (rate, unit)
+        self.meters_installed += 1
+        logger.info(f"Meter {meter_id} installed on switch {dpid}: {rate} {unit}")
+        return meter_id
+
+    def release(self, datapath, meter_id):
+        """Drop one reference to meter_id, deleting the meter at zero"""
+        dpid = datapath.id
+        rate_unit = self.meter_rates.get((dpid, meter_id))
+        if rate_unit is None:
+            return False
+
+        entry = self.meters[dpid][rate_unit]
+        entry[1] -= 1
+        if entry[1] > 0:
+            return False
+
+        self._send_meter_mod(datapath, datapath.ofproto.OFPMC_DELETE, meter_id)
+        del self.meters[dpid][rate_unit]
+        del self.meter_rates[(dpid, meter_id)]
+        self.free_ids.setdefault(dpid, []).append(meter_id)
+        self.meters_removed += 1
+        logger.info(f"Meter {meter_id} removed from switch {dpid}")
+        return True
+
+    def _allocate_id(self, dpid):
+        """Reuse a freed meter id or take the next unused one"""
+        free = self.free_ids.get(dpid)
+        if free:
+            return free.pop()
+
+        meter_id = self.next_ids.get(dpid, 1)
+        if meter_id > self.max_meters:
+            return None
+        self.next_ids[dpid] = meter_id + 1
+        return meter_id
+
+    def _send_meter_mod(self, datapath, command, meter_id, rate=None, unit=UNIT_PKTPS):
+        """Send a meter add/delete, fenced so later FlowMods see it"""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        bands = []
+        flags = 0
+        if rate is not None:
+            bands = [parser.OFPMeterBandDrop(rate=rate, burst_size=0)]
+            flags = ofproto.OFPMF_PKTPS if unit == UNIT_PKTPS else ofproto.OFPMF_KBPS
+
+        datapath.send_msg(parser.OFPMeterMod(datapath, command=command, flags=flags,
+                                             meter_id=meter_id, bands=bands))
+        # Switches may reorder messages between barriers
+        datapath.send_msg(parser.OFPBarrierRequest(datapath))
+
+    def forget_datapath(self, dpid):
+        """Forget meters of a switch that disconnected or reset"""
+        self.meters.pop(dpid, None)
+        self.free_ids.pop(dpid, None)
+        self.next_ids.pop(dpid, None)
+        for key in [k for k in self.meter_rates if k[0] == dpid]:
+            del self.meter_rates[key]
+
+    def get_statistics(self):
+        """Get meter allocation statistics"""
+        return {
+            'meters_active': len(self.meter_rates),
+            'meters_installed': self.meters_installed,
+            'meters_removed': self.meters_removed,
+            'meters_reused': self.meters_reused,
+            'allocation_failures': self.allocation_failures
+        }
@@ -0,0 +1,100 @@
+"""
+Fast-path packet header parser
+
+Decodes the Ethernet/IPv4/TCP/UDP/ICMP header fields used for threat
+analysis directly from the packet-in buffer with fixed struct offsets,
+without building a ryu Packet object. Frames the fast path does not
+handle (VLAN tags, 802.3/LLC, IPv4 fragments, truncated headers) return
+None so the caller can fall back to ryu's full parser.
+"""
+
+import socket
+import struct
+from ..detection.flow_features import FlowFeatures
+
+ETH_TYPE_IPV4 = 0x0800
+ETH_HEADER_LEN = 14
+IPV4_MIN_HEADER_LEN = 20
+TCP_MIN_HEADER_LEN = 20
+UDP_HEADER_LEN = 8
+
+IP_PROTO_ICMP = 1
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+
+# Ethertypes that carry a VLAN tag before the real ethertype
+_VLAN_ETH_TYPES = frozenset((0x8100, 0x88a8, 0x9100))
+
+_ETH_TYPE = struct.Struct('!H')
+# version/ihl, tos, total_length, identification, flags/offset, ttl, proto
+_IPV4_HEADER = struct.Struct('!BBHHHBB')
+_L4_PORTS = struct.Struct('!HH')
+
+_PROTOCOL_NAMES = {
+    IP_PROTO_TCP: 'TCP',
+    IP_PROTO_UDP: 'UDP',
+    IP_PROTO_ICMP: 'ICMP'
+}
+
+
+def parse_packet(data, in_port, switch_id):
+    """Extract flow features from raw frame bytes.
+
+    Returns the same FlowFeatures as
+    SDNIDPSController.extract_flow_features, or None if the frame needs
+    the full ryu parser.
+    """
+    if len(data) < ETH_HEADER_LEN:
+        return None
+
+    buf = memoryview(data)
+    (eth_type,) = _ETH_TYPE.unpack_from(buf, 12)
+    if eth_type < 0x0600 or eth_type in _VLAN_ETH_TYPES:
+        return None
+
+    features = FlowFeatures(switch_id, in_port,
+                            eth_src=buf[6:12].hex(':'),
+                            eth_dst=buf[0:6].hex(':'),
+                            eth_type=eth_type)
+
+    if eth_type != ETH_TYPE_IPV4:
+        return features
+
+    if len(buf) < ETH_HEADER_LEN + IPV4_MIN_HEADER_LEN:
+        return None
+
+    (version_ihl, _tos, total_length, _ident, flags_offset,
+     ttl, proto) = _IPV4_HEADER.unpack_from(buf, ETH_HEADER_LEN)
+    header_length = (version_ihl & 0x0f) * 4
+    if version_ihl >> 4 != 4 or header_length < IPV4_MIN_HEADER_LEN:
+        return None
+    if flags_offset & 0x1fff:
+        # Non-first fragments carry no L4 header
+        return None
+
+    features.src_ip = socket.inet_ntoa(buf[26:30])
+    features.dst_ip = socket.inet_ntoa(buf[30:34])
+    features.protocol = proto
+    features.ttl = ttl
+    features.total_length = total_length
+
+    l4_offset = ETH_HEADER_LEN + header_length
+    l4_end = min(len(buf), ETH_HEADER_LEN + total_length)
+
+    if proto == IP_PROTO_TCP:
+        if l4_end - l4_offset < TCP_MIN_HEADER_LEN:
+            return None
+        features.src_port, features.dst_port = _L4_PORTS.unpack_from(buf, l4_offset)
+        features.tcp_flags = buf[l4_offset + 13] & 0x3f
+        payload_offset = l4_offset + (buf[l4_offset + 12] >> 4) * 4
+        if payload_offset < l4_end:
+            # Zero-copy view into the packet-in buffer
+            features.payload = buf[payload_offset:l4_end]
+    elif proto == IP_PROTO_UDP:
+        if l4_end - l4_offset < UDP_HEADER_LEN:
+            return None
+        features.src_port, features.dst_port = _L4_PORTS.unpack_from(buf, l4_offset)
+
+    features.protocol_name = _PROTOCOL_NAMES.get(proto)
+
+    return features
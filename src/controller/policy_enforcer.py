@@ -1,85 +1,459 @@
 from ryu.ofproto import ofproto_v1_3
 from ..utils.logger import setup_logger
+from ..utils.config import config
 from .flow_manager import FlowManager
+from .cidr_aggregator import CIDRAggregator, prefix_to_match
+from .timer_wheel import TimerWheel
+from .meter_manager import MeterManager, UNIT_KBPS, UNIT_PKTPS
+from ..detection.flow_features import FlowFeatures
+import ipaddress
 
 logger = setup_logger('policy_enforcer')
 
+# Priority of the security-table drop rules
+BLOCK_PRIORITY = 100
+# Rate-limited flows sit below drops so a block always wins
+RATE_LIMIT_PRIORITY = 90
+
 class PolicyEnforcer:
-    def __init__(self, flow_manager):
+    def __init__(self, flow_manager, topology_manager=None):
         self.flow_manager = flow_manager
+        self.topology_manager = topology_manager
         self.blocked_ips = set()
         self.blocked_flows = {}
         
+        # Per-switch blocklists aggregated into minimal CIDR drop rules
+        self.aggregators = {}  # {datapath_id: CIDRAggregator}
+        self.datapaths = {}  # {datapath_id: datapath} holding block rules
+        self.block_switches = {}  # {ip: {datapath_id}}
+        
+        # Block expiry is driven from here rather than by switch timeouts,
+        # since one aggregated rule covers blocks with different deadlines
+        self.timers = TimerWheel(tick=config.get('policies.expiry_tick', 1.0))
+        self.expired_blocks = 0
+        self.flow_removed = 0
+        self.rules_reinstalled = 0
+        
+        # IPs blocked at a switch whose flow table was reset, to reinstall
+        # when it reconnects
+        self._lost_blocks = {}  # {datapath_id: {ip}}
+        self.blocks_restored = 0
+        
+        # Install IP blocks only where the source attaches when it is known
+        self.ingress_only = config.get('policies.ingress_only', True)
+        self.ingress_blocks = 0
+        self.fallback_blocks = 0
+        self.switches_skipped = 0
+        
+        # Data-plane rate limiting with shared OpenFlow meters
+        self.rate_limit_enabled = config.get('policies.rate_limit_enabled', False)
+        self.max_packets_per_second = config.get('policies.max_packets_per_second', 10000)
+        self.meters = MeterManager(max_meters=config.get('policies.max_meters', 1024))
+        self.rate_limited = {}  # {(datapath_id, match items): (datapath, meter_id)}
+        
     def block_ip(self, datapath, ip_address, duration=300):
         """Block traffic from specific IP"""
         if ip_address in self.blocked_ips:
             logger.info(f"IP {ip_address} already blocked")
             return
         
-        parser = datapath.ofproto_parser
-        ofproto = datapath.ofproto
+        self._install_ip_block(datapath, ip_address)
         
-        # Block incoming traffic from this IP
-        match = parser.OFPMatch(ipv4_src=ip_address, eth_type=0x0800)
-        actions = []  # Drop packet
+        self.blocked_ips.add(ip_address)
+        self.timers.schedule(('ip', ip_address), duration)
+        logger.warning(f"Blocked IP: {ip_address} for {duration}s")
+    
+    def block_ip_all(self, datapaths, ip_address, duration=300, callback=None):
+        """Block an IP on several switches with one batched transmission.
         
-        self.flow_manager.install_flow(
-            datapath, 
-            priority=100,  # High priority
-            match=match, 
-            actions=actions,
-            hard_timeout=duration
-        )
+        Returns the FlowBatch; callback(batch) runs once every switch
+        has acknowledged the rules.
+        """
+        if ip_address in self.blocked_ips:
+            logger.info(f"IP {ip_address} already blocked")
+            return None
+        
+        datapaths = self.enforcement_points(datapaths, ip_address)
+        batch = self.flow_manager.begin_batch(callback)
+        for datapath in datapaths:
+            self._install_ip_block(datapath, ip_address, batch)
+        self.flow_manager.send_batch(batch)
         
         self.blocked_ips.add(ip_address)
-        logger.warning(f"Blocked IP: {ip_address} for {duration}s")
+        self.timers.schedule(('ip', ip_address), duration)
+        logger.warning(f"Blocked IP: {ip_address} for {duration}s on {len(batch.flow_mods)} switches")
+        return batch
     
-    def block_flow(self, datapath, flow_features):
-        """Block specific flow based on features"""
+    def _ingress_known(self):
+        """True if host locations can be trusted to name edge switches"""
+        return (self.ingress_only and self.topology_manager is not None and
+                self.topology_manager.has_links())
+    
+    def enforcement_points(self, datapaths, ip_address):
+        """Pick the switches that need the block for ip_address.
+        
+        With ingress-only enforcement these are the edge switches where
+        hosts using the address attach; unknown sources fall back to
+        every switch in datapaths. Until link discovery reports the
+        inter-switch ports, edge and transit switches cannot be told
+        apart and every switch is used.
+        """
+        datapaths = list(datapaths)
+        if self._ingress_known():
+            edges = self.topology_manager.locate_ip(ip_address)
+            selected = [dp for dp in datapaths if dp.id in edges]
+            if selected:
+                self.ingress_blocks += 1
+                self.switches_skipped += len(datapaths) - len(selected)
+                return selected
+        
+        self.fallback_blocks += 1
+        return datapaths
+    
+    def enforce_at(self, datapath, ip_address):
+        """Extend an existing block to a switch that still sees the source.
+        
+        Traffic from a blocked address entering at an edge switch without
+        the drop rule means the host moved or its address is being used
+        elsewhere. Copies flooded to transit switches before the block
+        took effect are ignored.
+        """
+        if ip_address not in self.blocked_ips:
+            return False
+        if datapath.id in self.block_switches.get(ip_address, ()):
+            return False
+        if self._ingress_known() and datapath.id not in self.topology_manager.locate_ip(ip_address):
+            return False
+        
+        self._install_ip_block(datapath, ip_address)
+        logger.warning(f"Extended block for {ip_address} to switch {datapath.id}")
+        return True
+    
+    def _install_ip_block(self, datapath, ip_address, batch=None):
+        """Add ip_address to datapath's aggregated drop rules"""
+        aggregator = self.aggregators.setdefault(datapath.id, CIDRAggregator())
+        self.datapaths[datapath.id] = datapath
+        self.block_switches.setdefault(ip_address, set()).add(datapath.id)
+        
+        removed, added = aggregator.add(ip_address)
+        self._apply_aggregate_change(datapath, removed, added, batch)
+    
+    def _remove_ip_block(self, datapath, ip_address, batch=None):
+        """Remove ip_address from datapath's aggregated drop rules"""
+        aggregator = self.aggregators.get(datapath.id)
+        if aggregator is None:
+            return
+        
+        removed, added = aggregator.remove(ip_address)
+        self._apply_aggregate_change(datapath, removed, added, batch)
+    
+    def _apply_aggregate_change(self, datapath, removed, added, batch=None):
+        """Replace the drop rules for removed prefixes with ones for added.
+        
+        Deletes are strict, so the per-flow drops and rate limits of
+        sources inside a replaced prefix stay installed. Deletes go first;
+        inside a bundle the swap is atomic.
+        """
         parser = datapath.ofproto_parser
         
+        for network, prefixlen in removed:
+            match = parser.OFPMatch(eth_type=0x0800,
+                                    ipv4_src=prefix_to_match(network, prefixlen))
+            self.flow_manager.delete_flow(datapath, match, batch=batch,
+                                          table_id=self.flow_manager.security_table,
+                                          priority=BLOCK_PRIORITY)
+        
+        for network, prefixlen in added:
+            match = parser.OFPMatch(eth_type=0x0800,
+                                    ipv4_src=prefix_to_match(network, prefixlen))
+            actions = []  # Drop packet
+            
+            self.flow_manager.install_flow(
+                datapath,
+                priority=BLOCK_PRIORITY,
+                match=match,
+                actions=actions,
+                batch=batch,
+                table_id=self.flow_manager.security_table,
+                flags=datapath.ofproto.OFPFF_SEND_FLOW_REM
+            )
+    
+    @staticmethod
+    def flow_key(flow_features):
+        """blocked_flows key of a flow"""
+        return f"{flow_features.src_ip}:{flow_features.src_port}"
+    
+    def _flow_match(self, datapath, flow_features):
+        """Match of the drop rule block_flow installs for a flow.
+        
+        An unknown destination (a flow-stats record whose destination MAC
+        maps to no learned IP) is left out, so the rule drops the source
+        port toward every destination.
+        """
         match_dict = {
             'eth_type': 0x0800,
-            'ipv4_src': flow_features.get('src_ip'),
-            'ipv4_dst': flow_features.get('dst_ip')
+            'ipv4_src': flow_features.src_ip
         }
+        if flow_features.dst_ip is not None:
+            match_dict['ipv4_dst'] = flow_features.dst_ip
         
-        if flow_features.get('src_port'):
-            match_dict['ip_proto'] = flow_features.get('protocol', 6)
-            if flow_features['protocol'] == 6:  # TCP
-                match_dict['tcp_src'] = flow_features['src_port']
-            elif flow_features['protocol'] == 17:  # UDP
-                match_dict['udp_src'] = flow_features['src_port']
+        if flow_features.src_port:
+            match_dict['ip_proto'] = flow_features.protocol or 6
+            if flow_features.protocol == 6:  # TCP
+                match_dict['tcp_src'] = flow_features.src_port
+            elif flow_features.protocol == 17:  # UDP
+                match_dict['udp_src'] = flow_features.src_port
         
-        match = parser.OFPMatch(**match_dict)
+        return datapath.ofproto_parser.OFPMatch(**match_dict)
+    
+    def block_flow(self, datapath, flow_features):
+        """Block specific flow based on features"""
+        flow_features = FlowFeatures.coerce(flow_features)
+        match = self._flow_match(datapath, flow_features)
         actions = []  # Drop
         
         self.flow_manager.install_flow(
             datapath,
-            priority=100,
+            priority=BLOCK_PRIORITY,
             match=match,
             actions=actions,
-            hard_timeout=60
+            hard_timeout=60,
+            table_id=self.flow_manager.security_table,
+            flags=datapath.ofproto.OFPFF_SEND_FLOW_REM
         )
         
-        flow_key = f"{flow_features.get('src_ip')}:{flow_features.get('src_port')}"
+        flow_key = self.flow_key(flow_features)
         self.blocked_flows[flow_key] = flow_features
+        # Backstop in case the switch's FlowRemoved is lost
+        self.timers.schedule(('flow', flow_key), 60)
         logger.warning(f"Blocked flow: {flow_key}")
     
-    def rate_limit_flow(self, datapath, match, max_rate_kbps):
-        """Apply rate limiting to flow"""
-        # Implementation depends on switch capabilities
-        # This is a placeholder for QoS-enabled switches
-        logger.info(f"Rate limit applied: {max_rate_kbps} kbps")
+    def unblock_flow(self, datapath, flow_key):
+        """Remove a block_flow drop rule; returns False if the flow is not blocked"""
+        flow_features = self.blocked_flows.pop(flow_key, None)
+        if flow_features is None:
+            return False
+        
+        self.flow_manager.delete_flow(datapath, self._flow_match(datapath, flow_features),
+                                      table_id=self.flow_manager.security_table,
+                                      priority=BLOCK_PRIORITY)
+        self.timers.cancel(('flow', flow_key))
+        logger.info(f"Unblocked flow: {flow_key}")
+        return True
+    
+    def rate_limit_flow(self, datapath, match, max_rate_kbps=None, max_pps=None, duration=60):
+        """Throttle a flow in the data plane with an OpenFlow meter.
+        
+        Packets matching match go through a meter with a drop band at
+        max_rate_kbps, or max_pps packets per second (defaulting to
+        policies.max_packets_per_second), then continue to the forwarding
+        table. Flows limited to the same rate share a meter. Returns the
+        meter id, or None if the flow could not be rate limited.
+        """
+        if not self.rate_limit_enabled:
+            logger.info("Rate limiting disabled; not applying meter")
+            return None
+        if not self.flow_manager.multi_table:
+            logger.warning("Rate limiting needs the multi-table pipeline")
+            return None
+        
+        if max_rate_kbps is not None:
+            rate, unit = int(max_rate_kbps), UNIT_KBPS
+        else:
+            rate, unit = int(max_pps or self.max_packets_per_second), UNIT_PKTPS
+        
+        meter_id = self.meters.acquire(datapath, rate, unit)
+        if meter_id is None:
+            return None
+        
+        self.flow_manager.install_flow(
+            datapath,
+            priority=RATE_LIMIT_PRIORITY,
+            match=match,
+            actions=[],
+            hard_timeout=duration,
+            table_id=self.flow_manager.security_table,
+            goto_table=self.flow_manager.forwarding_table,
+            flags=datapath.ofproto.OFPFF_SEND_FLOW_REM,
+            meter_id=meter_id
+        )
+        
+        key = (datapath.id, tuple(match.items()))
+        previous = self.rate_limited.get(key)
+        self.rate_limited[key] = (datapath, meter_id)
+        if previous is not None:
+            # Same flow re-limited: drop the reference the old rule held
+            self.meters.release(datapath, previous[1])
+        self.timers.schedule(('rate', key), duration)
+        
+        logger.warning(f"Rate limit applied on switch {datapath.id}: {rate} {unit} (meter {meter_id})")
+        return meter_id
+    
+    def rate_limit_ip(self, datapath, ip_address, max_pps=None, duration=60):
+        """Throttle all IPv4 traffic from ip_address"""
+        match = datapath.ofproto_parser.OFPMatch(eth_type=0x0800, ipv4_src=ip_address)
+        return self.rate_limit_flow(datapath, match, max_pps=max_pps, duration=duration)
+    
+    def rate_limit_destination(self, datapaths, ip_address, max_pps=None, duration=60):
+        """Throttle all IPv4 traffic toward ip_address where it attaches.
+        
+        Protects a victim of a distributed flood whose sources are too many
+        (or too spoofed) to block one by one. Returns the meter ids applied.
+        """
+        meters = []
+        for datapath in self.enforcement_points(datapaths, ip_address):
+            match = datapath.ofproto_parser.OFPMatch(eth_type=0x0800, ipv4_dst=ip_address)
+            meter_id = self.rate_limit_flow(datapath, match, max_pps=max_pps, duration=duration)
+            if meter_id is not None:
+                meters.append(meter_id)
+        return meters
+    
+    def _end_rate_limit(self, key):
+        """Forget a rate-limited flow and release its meter"""
+        entry = self.rate_limited.pop(key, None)
+        if entry is None:
+            return
+        self.timers.cancel(('rate', key))
+        datapath, meter_id = entry
+        self.meters.release(datapath, meter_id)
     
     def unblock_ip(self, datapath, ip_address):
         """Remove IP block"""
         if ip_address not in self.blocked_ips:
             return
         
-        parser = datapath.ofproto_parser
-        match = parser.OFPMatch(ipv4_src=ip_address, eth_type=0x0800)
+        self._remove_ip_block(datapath, ip_address)
+        self.blocked_ips.remove(ip_address)
+        self.block_switches.pop(ip_address, None)
+        self.timers.cancel(('ip', ip_address))
+        logger.info(f"Unblocked IP: {ip_address}")
+    
+    def unblock_ip_all(self, datapaths, ip_address, callback=None):
+        """Remove an IP block from several switches in one batch"""
+        if ip_address not in self.blocked_ips:
+            return None
+        
+        batch = self.flow_manager.begin_batch(callback)
+        for datapath in datapaths:
+            self._remove_ip_block(datapath, ip_address, batch)
+        self.flow_manager.send_batch(batch)
         
-        self.flow_manager.delete_flow(datapath, match)
         self.blocked_ips.remove(ip_address)
+        self.block_switches.pop(ip_address, None)
+        self.timers.cancel(('ip', ip_address))
         logger.info(f"Unblocked IP: {ip_address}")
+        return batch
+    
+    def expire(self, now=None):
+        """Lift blocks whose duration has passed; returns how many expired"""
+        expired = self.timers.advance(now)
+        for kind, key in expired:
+            if kind == 'ip':
+                datapaths = [self.datapaths[dpid] for dpid in self.block_switches.get(key, ())
+                             if dpid in self.datapaths]
+                self.unblock_ip_all(datapaths, key)
+            elif kind == 'rate':
+                self._end_rate_limit(key)
+            else:
+                self.blocked_flows.pop(key, None)
+        
+        self.expired_blocks += len(expired)
+        return len(expired)
+    
+    def handle_flow_removed(self, msg):
+        """Reconcile enforcement state with a rule the switch removed"""
+        self.flow_manager.handle_flow_removed(msg)
+        if msg.table_id != self.flow_manager.security_table:
+            return
+        if msg.priority == RATE_LIMIT_PRIORITY:
+            self.flow_removed += 1
+            self._end_rate_limit((msg.datapath.id, tuple(msg.match.items())))
+            return
+        if msg.priority != BLOCK_PRIORITY:
+            return
+        self.flow_removed += 1
+        
+        match = msg.match
+        src = match.get('ipv4_src')
+        if src is None:
+            return
+        
+        if 'ipv4_dst' in match:
+            # A per-flow block timed out or was deleted
+            port = match.get('tcp_src', match.get('udp_src'))
+            flow_key = f"{src}:{port}"
+            self.blocked_flows.pop(flow_key, None)
+            self.timers.cancel(('flow', flow_key))
+            return
+        
+        # A prefix rule we still enforce went missing: put it back
+        network = ipaddress.IPv4Network('/'.join(src) if isinstance(src, tuple) else src)
+        prefix = (int(network.network_address), network.prefixlen)
+        aggregator = self.aggregators.get(msg.datapath.id)
+        if aggregator is not None and prefix in aggregator.aggregate:
+            self._apply_aggregate_change(msg.datapath, [], [prefix])
+            self.rules_reinstalled += 1
+            logger.warning(f"Reinstalled block for {network} on switch {msg.datapath.id}")
+    
+    def forget_datapath(self, dpid):
+        """Drop the rules state of a switch whose flow table was reset.
+        
+        Its IP blocks stay in force and are reinstalled by
+        restore_datapath() when it reconnects; its per-flow blocks and
+        rate limits are gone with the table.
+        """
+        self.aggregators.pop(dpid, None)
+        self.datapaths.pop(dpid, None)
+        self.meters.forget_datapath(dpid)
+        for key in [k for k in self.rate_limited if k[0] == dpid]:
+            del self.rate_limited[key]
+            self.timers.cancel(('rate', key))
+        
+        lost = self._lost_blocks.setdefault(dpid, set())
+        for ip_address, switches in self.block_switches.items():
+            if dpid in switches:
+                switches.discard(dpid)
+                lost.add(ip_address)
+        for flow_key in [k for k, f in self.blocked_flows.items() if f.switch_id == dpid]:
+            del self.blocked_flows[flow_key]
+            self.timers.cancel(('flow', flow_key))
+    
+    def restore_datapath(self, datapath):
+        """Reinstall the IP blocks a reconnected switch lost; returns how many"""
+        ips = [ip for ip in self._lost_blocks.pop(datapath.id, ()) if ip in self.blocked_ips]
+        if not ips:
+            return 0
+        
+        batch = self.flow_manager.begin_batch()
+        for ip_address in ips:
+            self._install_ip_block(datapath, ip_address, batch)
+        self.flow_manager.send_batch(batch)
+        self.blocks_restored += len(ips)
+        logger.warning(f"Reinstalled {len(ips)} IP blocks on reconnected switch {datapath.id}")
+        return len(ips)
+    
+    def get_statistics(self):
+        """Get blocklist and aggregation statistics"""
+        entries = sum(len(a.entries) for a in self.aggregators.values())
+        rules = sum(len(a.aggregate) for a in self.aggregators.values())
+        return {
+            'blocked_ips': len(self.blocked_ips),
+            'blocked_flows': len(self.blocked_flows),
+            'block_entries': entries,
+            'block_rules': rules,
+            'rules_saved': entries - rules,
+            'pending_expiries': len(self.timers),
+            'expired_blocks': self.expired_blocks,
+            'flow_removed': self.flow_removed,
+            'rules_reinstalled': self.rules_reinstalled,
+            'blocks_restored': self.blocks_restored,
+            'ingress_blocks': self.ingress_blocks,
+            'fallback_blocks': self.fallback_blocks,
+            'switches_skipped': self.switches_skipped,
+            'rate_limited_flows': len(self.rate_limited),
+            'meters': self.meters.get_statistics(),
+            'switches': {
+                dpid: dict(aggregator.get_statistics(), prefixes=aggregator.prefixes())
+                for dpid, aggregator in self.aggregators.items()
+            }
+        }
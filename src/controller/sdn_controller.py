@@ -3,11 +3,18 @@ from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
+from ryu.lib import hub
 from ryu.lib.packet import packet, ethernet, ipv4, tcp, udp, arp
+from ryu.lib.packet.ether_types import ETH_TYPE_LLDP
+from ryu.topology import event as topology_event
 from .flow_manager import FlowManager
 from .policy_enforcer import PolicyEnforcer
 from .threat_detector import ThreatDetector
+from .packet_parser import parse_packet
+from .packet_pipeline import PacketPipeline
+from .policy_enforcer import RATE_LIMIT_PRIORITY
 from ..detection.suricata_monitor import SuricataMonitor
+from ..detection.flow_features import FlowFeatures
 from ..network.topology_manager import TopologyManager
 from ..database.database import db
 from ..utils.logger import setup_logger
@@ -15,6 +22,13 @@ from ..utils.config import config
 
 logger = setup_logger('sdn_controller')
 
+# LLDP link discovery (run ryu-manager with --observe-links) tells the
+# topology manager which ports face other switches
+app_manager.require_app('ryu.topology.switches')
+
+# Threats answered with a meter rather than a drop rule
+THROTTLED_THREATS = {'DOS_ATTACK', 'TRAFFIC_ANOMALY', 'SUBNET_TRAFFIC_ANOMALY'}
+
 class SDNIDPSController(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
     
@@ -23,13 +37,36 @@ class SDNIDPSController(app_manager.RyuApp):
         
         # Initialize components
         self.flow_manager = FlowManager()
-        self.policy_enforcer = PolicyEnforcer(self.flow_manager)
+        self.topology_manager = TopologyManager(
+            host_timeout=config.get('network.host_timeout', 300.0))
+        self.policy_enforcer = PolicyEnforcer(self.flow_manager, self.topology_manager)
         self.threat_detector = ThreatDetector()
-        self.topology_manager = TopologyManager()
         
         # Data structures
         self.datapaths = {}
         self.mac_to_port = {}
+        self.ml_blocks = set()  # blocked_flows keys blocked on an ML verdict alone
+        
+        # Packet-in pipeline: parse inline, detect and respond in batches
+        self.packet_pipeline = PacketPipeline(
+            self.process_packet_batch,
+            queue_size=config.get('pipeline.queue_size', 10000),
+            batch_size=config.get('pipeline.batch_size', 64),
+            batch_timeout=config.get('pipeline.batch_timeout', 0.005),
+            workers=config.get('pipeline.workers', 1),
+            shed_watermark=config.get('pipeline.shed_watermark', 0.8)
+        )
+        if config.get('pipeline.enabled', True):
+            self.packet_pipeline.start()
+        
+        # Expire timed blocks from the policy enforcer's timer wheel
+        self.expiry_thread = hub.spawn(self._expiry_loop)
+        
+        # Poll flow counters for the ML flow scanner
+        self.flow_stats_interval = config.get('detection.flow_stats_interval', 0)
+        self.flow_stats_thread = None
+        if self.flow_stats_interval > 0:
+            self.flow_stats_thread = hub.spawn(self._flow_stats_loop)
         
         # Start Suricata monitor
         self.suricata = SuricataMonitor(self.handle_suricata_alert)
@@ -49,68 +86,253 @@ class SDNIDPSController(app_manager.RyuApp):
         elif ev.state == DEAD_DISPATCHER:
             if datapath.id in self.datapaths:
                 del self.datapaths[datapath.id]
+                self.flow_manager.forget_datapath(datapath.id)
+                self.policy_enforcer.forget_datapath(datapath.id)
                 self.topology_manager.remove_switch(datapath.id)
                 logger.warning(f"Switch disconnected: {datapath.id}")
     
+    @set_ev_cls(topology_event.EventLinkAdd)
+    def link_add_handler(self, ev):
+        """Record an inter-switch link found by LLDP discovery"""
+        link = ev.link
+        self.topology_manager.add_link(link.src.dpid, link.src.port_no,
+                                       link.dst.dpid, link.dst.port_no)
+    
+    @set_ev_cls(topology_event.EventLinkDelete)
+    def link_delete_handler(self, ev):
+        """Forget an inter-switch link that went down"""
+        link = ev.link
+        self.topology_manager.remove_link(link.src.dpid, link.src.port_no,
+                                          link.dst.dpid, link.dst.port_no)
+    
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
         """Handle switch connection"""
         datapath = ev.msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
         
-        # Install table-miss flow entry
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-        self.flow_manager.install_flow(datapath, 0, match, actions)
+        # A (re)connecting switch may have lost its flows; resync the cache
+        self.flow_manager.forget_datapath(datapath.id)
+        self.policy_enforcer.forget_datapath(datapath.id)
+        
+        # Install table-miss entries (security -> forwarding -> controller
+        # when the multi-table pipeline is enabled)
+        self.flow_manager.install_pipeline(datapath)
+        
+        # Put back the IP blocks the switch lost with its flow table
+        self.policy_enforcer.restore_datapath(datapath)
         
         logger.info(f"Switch features configured: {datapath.id}")
     
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def barrier_reply_handler(self, ev):
+        """Complete batched FlowMod transmissions"""
+        self.flow_manager.handle_barrier_reply(ev.msg)
+    
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, MAIN_DISPATCHER)
+    def error_msg_handler(self, ev):
+        """Handle OpenFlow errors reported by switches"""
+        msg = ev.msg
+        logger.warning(f"OpenFlow error from switch {msg.datapath.id}: "
+                       f"type={msg.type} code={msg.code} xid={msg.xid}")
+        self.flow_manager.handle_error(msg)
+    
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def flow_removed_handler(self, ev):
+        """Keep enforcement state in sync with rules switches removed"""
+        self.policy_enforcer.handle_flow_removed(ev.msg)
+    
+    def _expiry_loop(self):
+        """Advance the block expiry timer wheel once per tick"""
+        while True:
+            try:
+                self.policy_enforcer.expire()
+            except Exception as e:
+                logger.error(f"Block expiry failed: {e}")
+            hub.sleep(self.policy_enforcer.timers.tick)
+    
+    def _flow_stats_loop(self):
+        """Request flow counters from every switch once per interval"""
+        while True:
+            hub.sleep(self.flow_stats_interval)
+            if not self.threat_detector.ml_detector.is_loaded():
+                continue
+            for datapath in list(self.datapaths.values()):
+                try:
+                    self.flow_manager.get_flow_stats(datapath)
+                except Exception as e:
+                    logger.error(f"Flow stats request to switch {datapath.id} failed: {e}")
+    
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def flow_stats_reply_handler(self, ev):
+        """Classify a switch's forwarding flows by their counters"""
+        datapath = ev.msg.datapath
+        
+        # Skip table-miss entries and our own drop and meter rules
+        flows = [self.extract_stats_features(stat, datapath.id) for stat in ev.msg.body
+                 if 0 < stat.priority < RATE_LIMIT_PRIORITY]
+        self.apply_ml_verdicts(
+            self.threat_detector.scan_flows(flows, callback=self.apply_ml_verdicts))
+    
+    def apply_ml_verdicts(self, verdicts):
+        """Act on (features, threat result or None) pairs from the ML model.
+        
+        With the inference pool these arrive after the packets were already
+        answered on the heuristic verdicts. Flagged flows are blocked. A flow
+        blocked on an ML verdict alone is unblocked when a later verdict
+        finds it benign; blocks from other detectors are never lifted here.
+        """
+        blocked_flows = self.policy_enforcer.blocked_flows
+        self.ml_blocks.intersection_update(blocked_flows)
+        flagged = set()
+        cleared = set()
+        for flow_features, threat_result in verdicts:
+            flow_key = self.policy_enforcer.flow_key(flow_features)
+            if threat_result is None:
+                cleared.add(flow_key)
+                continue
+            flagged.add(flow_key)
+            if flow_features.src_ip is None:
+                logger.warning(f"ML flagged {threat_result['threat_type']} flow from "
+                               f"{flow_features.eth_src} with no known IP")
+                continue
+            if flow_key in blocked_flows or flow_features.src_ip in self.policy_enforcer.blocked_ips:
+                continue
+            datapath = self.datapaths.get(flow_features.switch_id)
+            try:
+                if datapath is not None and self._handle_threat(datapath, flow_features,
+                                                                threat_result):
+                    self.ml_blocks.add(flow_key)
+            except Exception as e:
+                # One bad verdict must not stop the rest of the batch
+                logger.error(f"Failed to act on ML verdict for {flow_key}: {e}")
+        
+        for flow_key in (cleared - flagged) & self.ml_blocks:
+            self.ml_blocks.discard(flow_key)
+            datapath = self.datapaths.get(blocked_flows[flow_key].switch_id)
+            if datapath is not None:
+                logger.info(f"ML verdict cleared {flow_key}; lifting its block")
+                self.policy_enforcer.unblock_flow(datapath, flow_key)
+    
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):
         """Handle incoming packets"""
         msg = ev.msg
         datapath = msg.datapath
-        ofproto = datapath.ofproto
-        parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
         
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
+        # Extract packet info, falling back to ryu's parser for frames
+        # the fast path does not handle
+        flow_features = parse_packet(msg.data, in_port, datapath.id)
+        if flow_features is None:
+            pkt = packet.Packet(msg.data)
+            flow_features = self.extract_flow_features(pkt, in_port, datapath.id)
         
-        # Extract packet info
-        flow_features = self.extract_flow_features(pkt, in_port, datapath.id)
+        # LLDP probes belong to link discovery, not to a host
+        if flow_features.eth_src is None or flow_features.eth_type == ETH_TYPE_LLDP:
+            return
         
-        # Threat detection
-        threat_result = self.threat_detector.analyze_packet(flow_features)
+        # Learn host locations in arrival order so the first (edge) switch
+        # to report a source wins
+        self.topology_manager.learn_host(flow_features.eth_src, flow_features.src_ip,
+                                         datapath.id, in_port)
         
-        if threat_result['is_threat']:
-            logger.warning(f"Threat detected: {threat_result['threat_type']} from {flow_features.get('src_ip')}")
-            
-            # Enforce policy
-            self.policy_enforcer.block_flow(datapath, flow_features)
-            
-            # Log to database
-            db.insert_alert({
-                'severity': threat_result.get('severity', 2),
-                'alert_type': threat_result['threat_type'],
-                'source_ip': flow_features.get('src_ip'),
-                'destination_ip': flow_features.get('dst_ip'),
-                'source_port': flow_features.get('src_port'),
-                'destination_port': flow_features.get('dst_port'),
-                'protocol': flow_features.get('protocol_name'),
-                'signature': threat_result.get('signature', ''),
-                'description': threat_result.get('description', ''),
-                'blocked': True
-            })
-            
-            # Don't forward malicious packet
+        # Detection and forwarding happen in pipeline workers
+        if self.packet_pipeline.running:
+            self.packet_pipeline.submit((msg, flow_features))
+        else:
+            self.process_packet_batch([(msg, flow_features)])
+    
+    def process_packet_batch(self, batch):
+        """Run threat detection on a batch of packet-ins and respond"""
+        self.threat_detector.set_load_shedding(self.packet_pipeline.overloaded())
+        for victim in self.threat_detector.analyze_destinations(
+                [flow_features for _msg, flow_features in batch]):
+            self._protect_destination(victim)
+        
+        # Packets from blocked sources are dropped without running detection
+        blocked_ips = self.policy_enforcer.blocked_ips
+        unblocked = []
+        for msg, flow_features in batch:
+            if flow_features.src_ip in blocked_ips:
+                # Blocked source seen at a switch without its drop rule
+                self.policy_enforcer.enforce_at(msg.datapath, flow_features.src_ip)
+            else:
+                unblocked.append((msg, flow_features))
+        if not unblocked:
             return
         
-        # Normal L2 learning switch logic
-        dst = eth.dst
-        src = eth.src
+        # With the inference pool, ML verdicts come later through apply_ml_verdicts
+        results = self.threat_detector.analyze_batch(
+            [flow_features for _msg, flow_features in unblocked],
+            ml_callback=self.apply_ml_verdicts)
+        for (msg, flow_features), threat_result in zip(unblocked, results):
+            if threat_result['is_threat'] and self._handle_threat(
+                    msg.datapath, flow_features, threat_result):
+                continue
+            self._forward_packet(msg, flow_features)
+    
+    def _handle_threat(self, datapath, flow_features, threat_result):
+        """Block or throttle a malicious flow and record the alert.
+        
+        Returns True if the packet should be dropped.
+        """
+        logger.warning(f"Threat detected: {threat_result['threat_type']} from {flow_features.src_ip}")
+        self.ml_blocks.discard(self.policy_enforcer.flow_key(flow_features))
+        
+        # Suspected floods and rate anomalies are throttled by a meter in the
+        # data plane; anything else (or a switch without free meters) is
+        # dropped. Allowlisted sources are only alerted on.
+        blocked = not self.threat_detector.is_allowlisted(flow_features.src_ip)
+        if blocked and set(threat_result['threat_type'].split(', ')) <= THROTTLED_THREATS:
+            blocked = self.policy_enforcer.rate_limit_ip(datapath, flow_features.src_ip) is None
+        if blocked:
+            self.policy_enforcer.block_flow(datapath, flow_features)
+        
+        # Log to database
+        db.queue_alert({
+            'severity': threat_result.get('severity', 2),
+            'alert_type': threat_result['threat_type'],
+            'source_ip': flow_features.src_ip,
+            'destination_ip': flow_features.dst_ip,
+            'source_port': flow_features.src_port,
+            'destination_port': flow_features.dst_port,
+            'protocol': flow_features.protocol_name,
+            'signature': threat_result.get('signature', ''),
+            'description': threat_result.get('description', ''),
+            'blocked': blocked
+        })
+        return blocked
+    
+    def _protect_destination(self, victim):
+        """Meter traffic toward the victim of a distributed flood and record the alert"""
+        dst_ip = victim['dst_ip']
+        meters = self.policy_enforcer.rate_limit_destination(
+            list(self.datapaths.values()), dst_ip,
+            max_pps=config.get('detection.ddos.mitigation_pps', 2000),
+            duration=config.get('detection.ddos.hold_time', 60))
+        
+        db.queue_alert({
+            'severity': 1,
+            'alert_type': 'DDOS_ATTACK',
+            'source_ip': None,
+            'destination_ip': dst_ip,
+            'signature': 'Distributed flood toward destination',
+            'description': (f"{victim['packet_rate']:.0f} pps, {victim['syn_rate']:.0f} SYN/s "
+                            f"from ~{victim['sources']} sources "
+                            f"(source entropy {victim['entropy']})"),
+            'raw_data': str(victim),
+            'blocked': bool(meters)
+        })
+    
+    def _forward_packet(self, msg, flow_features):
+        """Normal L2 learning switch logic"""
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        in_port = flow_features.in_port
+        
+        dst = flow_features.eth_dst
+        src = flow_features.eth_src
         dpid = datapath.id
         
         self.mac_to_port.setdefault(dpid, {})
@@ -127,7 +349,8 @@ class SDNIDPSController(app_manager.RyuApp):
         if out_port != ofproto.OFPP_FLOOD:
             match = parser.OFPMatch(in_port=in_port, eth_dst=dst, eth_src=src)
             self.flow_manager.install_flow(datapath, 1, match, actions, 
-                                          idle_timeout=60, hard_timeout=300)
+                                          idle_timeout=60, hard_timeout=300,
+                                          table_id=self.flow_manager.forwarding_table)
         
         # Send packet out
         data = None
@@ -140,42 +363,64 @@ class SDNIDPSController(app_manager.RyuApp):
     
     def extract_flow_features(self, pkt, in_port, switch_id):
         """Extract features from packet for analysis"""
-        features = {
-            'switch_id': switch_id,
-            'in_port': in_port,
-            'timestamp': None  # Add actual timestamp
-        }
+        features = FlowFeatures(switch_id, in_port)
         
         eth_pkt = pkt.get_protocol(ethernet.ethernet)
         if eth_pkt:
-            features['eth_src'] = eth_pkt.src
-            features['eth_dst'] = eth_pkt.dst
-            features['eth_type'] = eth_pkt.ethertype
+            features.eth_src = eth_pkt.src
+            features.eth_dst = eth_pkt.dst
+            features.eth_type = eth_pkt.ethertype
         
         ip_pkt = pkt.get_protocol(ipv4.ipv4)
         if ip_pkt:
-            features['src_ip'] = ip_pkt.src
-            features['dst_ip'] = ip_pkt.dst
-            features['protocol'] = ip_pkt.proto
-            features['ttl'] = ip_pkt.ttl
-            features['total_length'] = ip_pkt.total_length
+            features.src_ip = ip_pkt.src
+            features.dst_ip = ip_pkt.dst
+            features.protocol = ip_pkt.proto
+            features.ttl = ip_pkt.ttl
+            features.total_length = ip_pkt.total_length
             
             if ip_pkt.proto == 6:  # TCP
-                features['protocol_name'] = 'TCP'
+                features.protocol_name = 'TCP'
                 tcp_pkt = pkt.get_protocol(tcp.tcp)
                 if tcp_pkt:
-                    features['src_port'] = tcp_pkt.src_port
-                    features['dst_port'] = tcp_pkt.dst_port
-                    features['tcp_flags'] = tcp_pkt.bits
+                    features.src_port = tcp_pkt.src_port
+                    features.dst_port = tcp_pkt.dst_port
+                    features.tcp_flags = tcp_pkt.bits
+                    # ryu leaves the undecoded payload as trailing bytes
+                    if isinstance(pkt.protocols[-1], (bytes, bytearray)):
+                        features.payload = pkt.protocols[-1]
             elif ip_pkt.proto == 17:  # UDP
-                features['protocol_name'] = 'UDP'
+                features.protocol_name = 'UDP'
                 udp_pkt = pkt.get_protocol(udp.udp)
                 if udp_pkt:
-                    features['src_port'] = udp_pkt.src_port
-                    features['dst_port'] = udp_pkt.dst_port
+                    features.src_port = udp_pkt.src_port
+                    features.dst_port = udp_pkt.dst_port
             elif ip_pkt.proto == 1:  # ICMP
-                features['protocol_name'] = 'ICMP'
+                features.protocol_name = 'ICMP'
+        
+        return features
+    
+    def extract_stats_features(self, stat, switch_id):
+        """Build a feature record from one OFPFlowStats entry"""
+        match = stat.match
+        features = FlowFeatures(
+            switch_id, match.get('in_port'),
+            eth_src=match.get('eth_src'), eth_dst=match.get('eth_dst'),
+            eth_type=match.get('eth_type'),
+            src_ip=match.get('ipv4_src'), dst_ip=match.get('ipv4_dst'),
+            protocol=match.get('ip_proto'),
+            src_port=match.get('tcp_src', match.get('udp_src')),
+            dst_port=match.get('tcp_dst', match.get('udp_dst')),
+            packet_count=stat.packet_count, byte_count=stat.byte_count,
+            duration=stat.duration_sec + stat.duration_nsec / 1e9
+        )
         
+        # Forwarding flows match on MACs; recover the IPs from the topology
+        hosts = self.topology_manager.hosts
+        if features.src_ip is None and features.eth_src is not None:
+            features.src_ip = hosts.get(features.eth_src, {}).get('ip')
+        if features.dst_ip is None and features.eth_dst is not None:
+            features.dst_ip = hosts.get(features.eth_dst, {}).get('ip')
         return features
     
     def handle_suricata_alert(self, alert):
@@ -188,11 +433,10 @@ class SDNIDPSController(app_manager.RyuApp):
         
         # Block if critical/high severity
         if severity <= 2 and src_ip:
-            for dpid, datapath in self.datapaths.items():
-                self.policy_enforcer.block_ip(datapath, src_ip)
+            self.policy_enforcer.block_ip_all(list(self.datapaths.values()), src_ip)
         
         # Store in database
-        db.insert_alert({
+        db.queue_alert({
             'severity': severity,
             'alert_type': alert.get('alert', {}).get('category', 'Unknown'),
             'source_ip': src_ip,
@@ -1,5 +1,18 @@
 from ..utils.logger import setup_logger
 from ..detection.ml_detector import MLDetector
+from ..detection.model_registry import ModelRegistry
+from ..detection.inference_pool import InferencePool
+from ..detection.flow_features import FlowFeatures
+from ..utils.config import config
+from ..detection.sliding_window import SlidingWindowCounter, SlidingWindowDistinct
+from ..detection.sketches import CountMinSketch, DistinctSketch, HeavyHitters
+from ..detection.reputation import IPReputation
+from ..detection.payload_signatures import PayloadSignatures
+from ..detection.baselines import TrafficBaselines
+from ..detection.destination_monitor import DestinationMonitor
+from .verdict_cache import VerdictCache
+from .detector_registry import DetectorRegistry
+import threading
 import time
 
 logger = setup_logger('threat_detector')
@@ -7,32 +20,161 @@ logger = setup_logger('threat_detector')
 class ThreatDetector:
     def __init__(self):
         self.ml_detector = MLDetector()
-        self.suspicious_ips = {}  # {ip: {'count': int, 'first_seen': timestamp}}
-        self.port_scan_threshold = 10  # ports scanned per minute
-        self.connection_threshold = 100  # connections per minute
+        self.suspicious_ips = {}  # {ip: {threat: window count, 'last_seen': timestamp}}
+        self.port_scan_threshold = config.get('detection.port_scan_threshold', 10)  # ports per minute
+        self.connection_threshold = config.get('detection.connection_threshold', 100)  # SYNs per minute
         
-    def analyze_packet(self, flow_features):
-        """Analyze packet for threats"""
-        threats = []
+        # Trailing-window counters per source; idle sources are swept out.
+        # Sketch mode trades exact counts for a fixed memory ceiling.
+        window = config.get('detection.window_seconds', 60)
+        buckets = config.get('detection.window_buckets', 12)
+        self.window = window
+        self._sweep_interval = window / buckets
+        self._per_minute = 60.0 / window
+        self.sketch_mode = config.get('detection.sketch.enabled', False)
+        if self.sketch_mode:
+            memory = config.get('detection.sketch.memory_kb', 1024) * 1024
+            generations = config.get('detection.sketch.generations', 4)
+            self.scanned_ports = DistinctSketch.with_memory(
+                memory // 2, depth=config.get('detection.sketch.hll_depth', 3),
+                precision=config.get('detection.sketch.hll_precision', 6),
+                window=window, generations=generations)
+            self.syn_counts = CountMinSketch.with_memory(
+                memory // 2, depth=config.get('detection.sketch.cms_depth', 4),
+                window=window, generations=generations)
+        else:
+            self.scanned_ports = SlidingWindowDistinct(
+                window, buckets, max_items=max(64, int(self.port_scan_threshold * 4 / self._per_minute)))
+            self.syn_counts = SlidingWindowCounter(window, buckets)
+        self.offenders = HeavyHitters(config.get('detection.heavy_hitters', 100))
+        self._next_sweep = 0.0
+        self._next_decay = 0.0
+        
+        # ML verdicts for the batch being analyzed, from one model call
+        self._batch = threading.local()
+        self.ml_batches = 0
+        self.ml_batch_rows = 0
+        
+        # Per-5-tuple cache of the history-independent verdicts
+        self.verdict_cache = None
+        if config.get('detection.verdict_cache.enabled', True):
+            self.verdict_cache = VerdictCache(
+                max_entries=config.get('detection.verdict_cache.max_entries', 65536),
+                ttl=config.get('detection.verdict_cache.ttl', 5.0)
+            )
+            self.ml_detector.add_model_listener(
+                lambda: self.invalidate_verdicts('ML model changed'))
+        
+        # Retrained models dropped into the model directory are swapped in live
+        self.model_registry = None
+        if config.get('detection.model_registry.enabled', False):
+            self.model_registry = ModelRegistry(
+                self.ml_detector,
+                model_dir=config.get('detection.model_registry.model_dir', 'models'),
+                model_path=config.get('detection.model_path', 'models/traffic_classifier.pkl'),
+                poll_interval=config.get('detection.model_registry.poll_interval', 10),
+                warmup_rows=config.get('detection.model_registry.warmup_rows', 256)
+            )
+            self.model_registry.start()
         
-        # Check for port scanning
-        if self._detect_port_scan(flow_features):
-            threats.append('PORT_SCAN')
+        # ML inference in worker processes, verdicts delivered after the
+        # heuristic ones (see analyze_batch)
+        self.inference_pool = None
+        if config.get('detection.inference_pool.enabled', False):
+            self.inference_pool = InferencePool(
+                self.ml_detector,
+                workers=config.get('detection.inference_pool.workers', 2),
+                max_batch=config.get('detection.inference_pool.max_batch', 256),
+                slots=config.get('detection.inference_pool.slots', 8),
+                poll_interval=config.get('detection.inference_pool.poll_interval', 0.002)
+            )
+            self.inference_pool.start()
         
-        # Check for DoS patterns
-        if self._detect_dos(flow_features):
-            threats.append('DOS_ATTACK')
+        # Detectors run cheapest first; the rate counters always run, the
+        # rest stop at the first decisive hit and ML is shed under load
+        self.detectors = DetectorRegistry(self.verdict_cache,
+                                          shed_cost=config.get('detection.shed_cost', 10))
+        self.reputation = None
+        if config.get('detection.reputation.enabled', False):
+            self.reputation = IPReputation(
+                blocklists=config.get('detection.reputation.blocklists', []),
+                allowlists=config.get('detection.reputation.allowlists', []),
+                refresh_interval=config.get('detection.reputation.refresh_interval', 300)
+            )
+            self.reputation.add_listener(
+                lambda: self.invalidate_verdicts('reputation feeds reloaded'))
+            self.reputation.start()
+            self.register_detector(
+                'reputation',
+                lambda f: ('BAD_REPUTATION',) if self.reputation.is_blocked(f.src_ip) else (),
+                cost=0.5, decisive=True)
+        self.register_detector(
+            'suspicious_port',
+            lambda f: ('SUSPICIOUS_PORT',) if self._detect_suspicious_port(f) else (),
+            cost=1, decisive=True)
+        self.register_detector(
+            'port_scan',
+            lambda f: ('PORT_SCAN',) if self._detect_port_scan(f) else (),
+            cost=2, decisive=True, stateful=True)
+        self.register_detector(
+            'dos',
+            lambda f: ('DOS_ATTACK',) if self._detect_dos(f) else (),
+            cost=2, decisive=True, stateful=True)
+        self.register_detector('ml', self._ml_verdict, cost=100, decisive=True)
         
-        # Check for suspicious protocols/ports
-        if self._detect_suspicious_port(flow_features):
-            threats.append('SUSPICIOUS_PORT')
+        # Learned per-host and per-subnet rates, flagged by z-score
+        self.baselines = None
+        if config.get('detection.baseline.enabled', False):
+            self.baselines = TrafficBaselines(
+                subnet_prefix=config.get('detection.baseline.subnet_prefix', 24),
+                state_file=config.get('detection.baseline.state_file', 'logs/baselines.npz'),
+                save_interval=config.get('detection.baseline.save_interval', 300),
+                interval=config.get('detection.baseline.interval', 10),
+                alpha=config.get('detection.baseline.alpha', 0.1),
+                z_threshold=config.get('detection.baseline.z_threshold', 4.0),
+                min_samples=config.get('detection.baseline.min_samples', 6)
+            )
+            self.register_detector('baseline', self.baselines.observe, cost=2, stateful=True)
         
-        # ML-based detection
-        if self.ml_detector.is_loaded():
-            ml_result = self.ml_detector.predict(flow_features)
-            if ml_result['is_malicious']:
-                threats.append(ml_result['attack_type'])
+        # Per-destination aggregates catch floods spread over many sources
+        self.destinations = None
+        if config.get('detection.ddos.enabled', False):
+            self.destinations = DestinationMonitor(
+                window=config.get('detection.ddos.window_seconds', 10),
+                buckets=config.get('detection.ddos.window_buckets', 5),
+                max_destinations=config.get('detection.ddos.max_destinations', 1024),
+                packet_rate_threshold=config.get('detection.ddos.packet_rate_threshold', 5000),
+                syn_rate_threshold=config.get('detection.ddos.syn_rate_threshold', 1000),
+                min_sources=config.get('detection.ddos.min_sources', 100),
+                entropy_threshold=config.get('detection.ddos.entropy_threshold', 0.95),
+                hold_time=config.get('detection.ddos.hold_time', 60)
+            )
+        
+        # Payload signatures look past the 5-tuple, so their verdict is not cached
+        self.payload_signatures = None
+        if config.get('detection.payload.enabled', False):
+            self.payload_signatures = PayloadSignatures(
+                config.get('detection.payload.signatures', 'src/detection/rules/payload.sigs'),
+                max_scan_bytes=config.get('detection.payload.max_scan_bytes', 1500)
+            )
+            self.register_detector(
+                'payload_signatures',
+                lambda f: self.payload_signatures.match(f.payload),
+                cost=5, decisive=True, cacheable=False)
+        
+    def analyze_packet(self, flow_features):
+        """Analyze packet for threats"""
+        return self._analyze(FlowFeatures.coerce(flow_features))
+    
+    def _analyze(self, flow_features, deferred=None):
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self.sweep(now)
         
+        return self._threat_result(self.detectors.evaluate(flow_features, deferred),
+                                   flow_features)
+    
+    def _threat_result(self, threats, flow_features):
         if threats:
             return {
                 'is_threat': True,
@@ -44,6 +186,199 @@ class ThreatDetector:
         
         return {'is_threat': False}
     
+    def register_detector(self, name, check, cost=1.0, decisive=False, stateful=False,
+                          cacheable=True):
+        """Add a detector returning a sequence of threat names per packet"""
+        return self.detectors.register(name, check, cost, decisive, stateful, cacheable)
+    
+    def set_load_shedding(self, active):
+        """Skip expensive detectors while the packet-in backlog is high"""
+        self.detectors.set_shedding(active)
+    
+    def is_allowlisted(self, ip):
+        """True if ip falls in an allowlisted prefix"""
+        return self.reputation is not None and self.reputation.is_allowed(ip)
+    
+    def _ml_verdict(self, flow_features):
+        """ML-based detection"""
+        if not self.ml_detector.is_loaded():
+            return ()
+        deferred = getattr(self._batch, 'ml_deferred', None)
+        if deferred is not None:
+            # Classified by the inference pool once the batch is answered
+            deferred.append(flow_features)
+            return ()
+        if getattr(self._batch, 'ml_collect', False):
+            # Deferred until the packets of the batch reaching ML are known
+            return None
+        verdicts = getattr(self._batch, 'ml_verdicts', None)
+        if verdicts:
+            verdict = verdicts.get(id(flow_features))
+            if verdict is not None:
+                return verdict
+        ml_result = self.ml_detector.predict(flow_features)
+        if ml_result['is_malicious']:
+            return (ml_result['attack_type'],)
+        return ()
+    
+    def invalidate_verdicts(self, reason=None):
+        """Forget cached verdicts after a model or policy change"""
+        if self.verdict_cache is not None:
+            self.verdict_cache.invalidate(reason)
+    
+    def get_statistics(self):
+        """Get detector state and verdict cache statistics"""
+        return {
+            'flagged_ips': len(self.suspicious_ips),
+            'counter_mode': 'sketch' if self.sketch_mode else 'exact',
+            'scan_sources': None if self.sketch_mode else len(self.scanned_ports),
+            'syn_sources': None if self.sketch_mode else len(self.syn_counts),
+            'sketches': ({'ports': self.scanned_ports.get_statistics(),
+                          'syns': self.syn_counts.get_statistics()}
+                         if self.sketch_mode else None),
+            'top_offenders': self.top_offenders(),
+            'ml_loaded': self.ml_detector.is_loaded(),
+            'ml_model': self.ml_detector.get_model_info(),
+            'model_registry': (self.model_registry.get_statistics()
+                               if self.model_registry is not None else None),
+            'ml_batches': self.ml_batches,
+            'ml_batch_rows': self.ml_batch_rows,
+            'inference_pool': (self.inference_pool.get_statistics()
+                               if self.inference_pool is not None else None),
+            'verdict_cache': (self.verdict_cache.get_statistics()
+                              if self.verdict_cache is not None else None),
+            'detectors': self.detectors.get_statistics(),
+            'payload': (self.payload_signatures.get_statistics()
+                        if self.payload_signatures is not None else None),
+            'baselines': (self.baselines.get_statistics()
+                          if self.baselines is not None else None),
+            'destinations': (self.destinations.get_statistics()
+                             if self.destinations is not None else None)
+        }
+    
+    def analyze_batch(self, features_batch, ml_callback=None):
+        """Analyze a batch of packets, returning one result per packet.
+        
+        Packets reaching the ML detector have their evaluation deferred;
+        once the batch has been seen, only those packets are classified,
+        in one model call, and their evaluation is resumed with the
+        verdicts. With ml_callback and the inference pool available, the
+        results hold only the heuristic verdicts instead. The packets
+        that would have reached the ML detector are classified in the
+        pool afterwards, and ml_callback(verdicts) receives them as
+        classify_async() describes.
+        """
+        features_batch = [FlowFeatures.coerce(f) for f in features_batch]
+        deferred = None
+        waiting = []  # (position, (features, evaluation state)) of packets reaching ML
+        if ml_callback is not None and self.ml_async():
+            deferred = self._batch.ml_deferred = []
+        else:
+            self._batch.ml_collect = True
+        try:
+            results = []
+            for flow_features in features_batch:
+                pending = []
+                results.append(self._analyze(flow_features, pending))
+                if pending:
+                    waiting.append((len(results) - 1, pending[0]))
+            
+            self._batch.ml_collect = False
+            if waiting:
+                self._batch.ml_verdicts = self._ml_batch_verdicts(
+                    [flow_features for _position, (flow_features, _state) in waiting])
+                for position, (flow_features, state) in waiting:
+                    results[position] = self._threat_result(
+                        self.detectors.resume(flow_features, state), flow_features)
+        finally:
+            self._batch.ml_collect = False
+            self._batch.ml_verdicts = None
+            self._batch.ml_deferred = None
+        if deferred:
+            self.classify_async(deferred, ml_callback)
+        return results
+    
+    def ml_async(self):
+        """True if ML verdicts can come from the inference pool"""
+        return self.inference_pool is not None and self.inference_pool.available()
+    
+    def classify_async(self, flows, callback):
+        """Classify flows in the inference pool, in chunks of its max_batch.
+        
+        callback(verdicts) is called from the pool's collector thread with
+        (features, threat result or None if benign) for every flow of a
+        chunk. Chunks the pool is too busy to take are not classified.
+        Returns the number of flows submitted.
+        """
+        submitted = 0
+        step = self.inference_pool.max_batch
+        for start in range(0, len(flows), step):
+            chunk = flows[start:start + step]
+            if self.inference_pool.submit(
+                    self.ml_detector.feature_matrix(chunk),
+                    lambda result, chunk=chunk: callback(self._ml_results(chunk, result))):
+                submitted += len(chunk)
+        return submitted
+    
+    def _ml_batch_verdicts(self, features_batch):
+        """{id(features): threats} for a batch, from one predict_batch call"""
+        result = self.ml_detector.predict_batch(self.ml_detector.feature_matrix(features_batch))
+        if result is None:
+            return {}
+        self.ml_batches += 1
+        self.ml_batch_rows += len(features_batch)
+        attack_types = self.ml_detector.attack_types
+        return {id(f): (attack_types[prediction],) if malicious else ()
+                for f, malicious, prediction in zip(features_batch,
+                                                    result['is_malicious'].tolist(),
+                                                    result['prediction'].tolist())}
+    
+    def scan_flows(self, flows, callback=None):
+        """Classify flow-stats records with the ML model in one batch.
+        
+        Returns (features, threat result) for each flow found malicious.
+        With callback and the inference pool available, the flows are
+        classified by classify_async() instead and nothing is returned.
+        """
+        if not flows or not self.ml_detector.is_loaded():
+            return []
+        if callback is not None and self.ml_async():
+            self.classify_async(flows, callback)
+            return []
+        result = self.ml_detector.predict_batch(self.ml_detector.feature_matrix(flows))
+        if result is None:
+            return []
+        return [(features, threat) for features, threat in self._ml_results(flows, result)
+                if threat is not None]
+    
+    def _ml_results(self, flows, result):
+        """(features, threat result or None) per flow from a predict_batch result"""
+        self.ml_batches += 1
+        self.ml_batch_rows += len(flows)
+        attack_types = self.ml_detector.attack_types
+        results = []
+        for features, malicious, prediction, confidence in zip(
+                flows, result['is_malicious'].tolist(), result['prediction'].tolist(),
+                result['confidence'].tolist()):
+            if not malicious:
+                results.append((features, None))
+                continue
+            attack_type = attack_types[prediction]
+            results.append((features, {
+                'is_threat': True,
+                'threat_type': attack_type,
+                'severity': self._calculate_severity([attack_type]),
+                'signature': f"ML flow classification ({confidence:.2f})",
+                'description': self._generate_description([attack_type], features)
+            }))
+        return results
+    
+    def analyze_destinations(self, features_batch):
+        """Aggregate a batch per destination; returns newly attacked destinations"""
+        if self.destinations is None:
+            return []
+        return self.destinations.update(features_batch)
+    
     def _detect_port_scan(self, features):
         """Detect port scanning behavior"""
         src_ip = features.get('src_ip')
@@ -52,28 +387,12 @@ class ThreatDetector:
         if not src_ip or not dst_port:
             return False
         
-        current_time = time.time()
-        
-        if src_ip not in self.suspicious_ips:
-            self.suspicious_ips[src_ip] = {
-                'ports': set(),
-                'first_seen': current_time
-            }
-        
-        ip_data = self.suspicious_ips[src_ip]
-        ip_data['ports'].add(dst_port)
-        
-        # Check if scanning multiple ports
-        time_window = current_time - ip_data['first_seen']
-        if time_window > 0:
-            ports_per_minute = len(ip_data['ports']) / (time_window / 60)
-            if ports_per_minute > self.port_scan_threshold:
-                logger.warning(f"Port scan detected from {src_ip}: {len(ip_data['ports'])} ports")
-                return True
-        
-        # Cleanup old entries
-        if time_window > 300:  # 5 minutes
-            del self.suspicious_ips[src_ip]
+        # Distinct destination ports in the trailing window
+        ports = self.scanned_ports.add(src_ip, dst_port)
+        if ports * self._per_minute > self.port_scan_threshold:
+            self._flag(src_ip, 'PORT_SCAN', ports)
+            logger.warning(f"Port scan detected from {src_ip}: {ports} ports")
+            return True
         
         return False
     
@@ -87,25 +406,43 @@ class ThreatDetector:
         if features.get('protocol') == 6:  # TCP
             tcp_flags = features.get('tcp_flags', 0)
             if tcp_flags & 0x02:  # SYN flag
-                # Track SYN packets per IP
-                if src_ip not in self.suspicious_ips:
-                    self.suspicious_ips[src_ip] = {
-                        'syn_count': 0,
-                        'syn_first_seen': time.time()
-                    }
-                
-                ip_data = self.suspicious_ips[src_ip]
-                ip_data['syn_count'] = ip_data.get('syn_count', 0) + 1
-                
-                time_window = time.time() - ip_data.get('syn_first_seen', time.time())
-                if time_window > 0:
-                    syn_per_minute = ip_data['syn_count'] / (time_window / 60)
-                    if syn_per_minute > self.connection_threshold:
-                        logger.warning(f"SYN flood detected from {src_ip}")
-                        return True
+                # SYN packets per IP in the trailing window
+                syns = self.syn_counts.add(src_ip)
+                if syns * self._per_minute > self.connection_threshold:
+                    self._flag(src_ip, 'DOS_ATTACK', syns)
+                    logger.warning(f"SYN flood detected from {src_ip}")
+                    return True
         
         return False
     
+    def _flag(self, src_ip, threat, count):
+        """Remember a source that tripped a rate detector"""
+        entry = self.suspicious_ips.setdefault(src_ip, {})
+        entry[threat] = count
+        entry['last_seen'] = time.monotonic()
+        self.offenders.offer(src_ip)
+    
+    def top_offenders(self, n=10):
+        """Sources with the most flagged packets, decayed every window"""
+        return [{'ip': ip, 'flagged_packets': count, 'error': error}
+                for ip, count, error in self.offenders.top(n)]
+    
+    def sweep(self, now=None):
+        """Evict sources idle for a whole window from the rate counters"""
+        now = time.monotonic() if now is None else now
+        self.scanned_ports.sweep(now)
+        self.syn_counts.sweep(now)
+        
+        cutoff = now - self.window
+        for ip in [ip for ip, entry in self.suspicious_ips.items() if entry['last_seen'] < cutoff]:
+            del self.suspicious_ips[ip]
+        if now >= self._next_decay:
+            self.offenders.decay()
+            self._next_decay = now + self.window
+        if self.baselines is not None:
+            self.baselines.sweep(now)
+        self._next_sweep = now + self._sweep_interval
+    
     def _detect_suspicious_port(self, features):
         """Detect connections to suspicious ports"""
         suspicious_ports = {
@@ -127,10 +464,18 @@ class ThreatDetector:
         """Calculate severity based on threat types"""
         severity_map = {
             'DOS_ATTACK': 1,
+            'BAD_REPUTATION': 2,
             'PORT_SCAN': 2,
             'SQL_INJECTION': 1,
+            'COMMAND_INJECTION': 1,
+            'MALWARE': 1,
+            'XSS': 2,
+            'PATH_TRAVERSAL': 2,
+            'HTTP_RESPONSE_SPLITTING': 2,
             'BRUTE_FORCE': 2,
-            'SUSPICIOUS_PORT': 3
+            'SUSPICIOUS_PORT': 3,
+            'TRAFFIC_ANOMALY': 3,
+            'SUBNET_TRAFFIC_ANOMALY': 3
         }
         
         min_severity = 4
@@ -0,0 +1,99 @@
+"""
+Hierarchical timer wheel
+
+Timers are bucketed by deadline tick into `levels` wheels of `slots`
+buckets each; level n buckets span slots**n ticks. Scheduling and
+cancelling are O(1) set operations, and each tick only touches the
+bucket that is due, cascading a higher-level bucket down whenever a
+lower wheel wraps. Keys are the timer payload: advance() returns the
+keys whose deadlines have passed.
+"""
+
+import math
+import time
+
+
+class TimerWheel:
+    def __init__(self, tick=1.0, slots=64, levels=4, now=None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._timers = {}  # {key: (deadline tick, level, slot)}
+        self._current = self._tick_of(time.monotonic() if now is None else now)
+        self.expired = 0
+
+    def _tick_of(self, now):
+        return int(now / self.tick)
+
+    def schedule(self, key, delay, now=None):
+        """(Re)schedule key to expire delay seconds from now"""
+        if now is not None:
+            self.advance(now)
+        self.cancel(key)
+        deadline = self._current + max(1, math.ceil(delay / self.tick))
+        self._place(key, deadline)
+
+    def cancel(self, key):
+        """Remove key's timer; returns False if none was pending"""
+        entry = self._timers.pop(key, None)
+        if entry is None:
+            return False
+        _deadline, level, slot = entry
+        self._wheels[level][slot].discard(key)
+        return True
+
+    def advance(self, now=None):
+        """Move the wheel to now and return the keys that expired"""
+        target = self._tick_of(time.monotonic() if now is None else now)
+        expired = []
+        while self._current < target:
+            self._current += 1
+            self._cascade()
+
+            bucket = self._wheels[0][self._current % self.slots]
+            if bucket:
+                due = [k for k in bucket if self._timers[k][0] <= self._current]
+                for key in due:
+                    bucket.discard(key)
+                    del self._timers[key]
+                expired.extend(due)
+
+        self.expired += len(expired)
+        return expired
+
+    def _place(self, key, deadline):
+        """Put key in the lowest wheel whose span covers its deadline"""
+        remaining = max(0, deadline - self._current)
+        level = 0
+        span = self.slots
+        while remaining >= span and level < self.levels - 1:
+            level += 1
+            span *= self.slots
+        slot = (deadline // self.slots ** level) % self.slots
+        self._wheels[level][slot].add(key)
+        self._timers[key] = (deadline, level, slot)
+
+    def _cascade(self):
+        """Redistribute higher-level buckets that became current"""
+        for level in range(self.levels - 1, 0, -1):
+            span = self.slots ** level
+            if self._current % span:
+                continue
+            bucket = self._wheels[level][(self._current // span) % self.slots]
+            self._wheels[level][(self._current // span) % self.slots] = set()
+            for key in bucket:
+                self._place(key, self._timers[key][0])
+
+    def deadline(self, key):
+        """Seconds until key expires, or None if not scheduled"""
+        entry = self._timers.get(key)
+        if entry is None:
+            return None
+        return (entry[0] - self._current) * self.tick
+
+    def __contains__(self, key):
+        return key in self._timers
+
+    def __len__(self):
+        return len(self._timers)
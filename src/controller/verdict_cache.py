@@ -0,0 +1,91 @@
+"""
+Per-flow verdict cache
+
+Bounded LRU map from a flow's 5-tuple (src, dst, proto, sport, dport) to
+the verdict of the per-packet detectors that do not depend on traffic
+history (suspicious ports, ML inference). The key also carries the other
+ML inputs (TCP flags and, for flow-stats records, the counters), so a SYN
+and a later ACK of the same flow are classified separately. Entries
+expire after ttl seconds; invalidate() drops everything when the model
+or policy changes.
+"""
+
+import time
+from collections import OrderedDict
+from ..utils.logger import setup_logger
+
+logger = setup_logger('verdict_cache')
+
+
+class VerdictCache:
+    def __init__(self, max_entries=65536, ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # {flow key: (expires_at, verdict)}
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def flow_key(features):
+        """Key for a FlowFeatures record: its 5-tuple plus every other ML input"""
+        return (features.src_ip, features.dst_ip, features.protocol,
+                features.src_port, features.dst_port, features.tcp_flags,
+                features.packet_count, features.byte_count, features.duration)
+
+    def get(self, key, now=None):
+        """Return the cached verdict for key, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        now = time.monotonic() if now is None else now
+        expires_at, verdict = entry
+        if expires_at <= now:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return verdict
+
+    def put(self, key, verdict, now=None):
+        """Cache verdict for key, evicting the least recently used entry"""
+        now = time.monotonic() if now is None else now
+        self._entries[key] = (now + self.ttl, verdict)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, reason=None):
+        """Drop all cached verdicts"""
+        self._entries.clear()
+        self.invalidations += 1
+        if reason:
+            logger.info(f"Verdict cache invalidated: {reason}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_statistics(self):
+        """Get hit ratio and eviction statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations
+        }
@@ -9,11 +9,15 @@ Handles:
 - User interactions
 """
 
-from .app import create_app, socketio
-from .api import api_bp
+from ..utils.lazy_import import lazy_exports
 
-__all__ = [
-    'create_app',
-    'socketio',
-    'api_bp'
-]
+# Imported on first access; see src/utils/lazy_import.py
+_EXPORTS = {
+    'create_app': '.app',
+    'socketio': '.app',
+    'api_bp': '.api'
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
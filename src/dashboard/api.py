@@ -78,6 +78,89 @@ def get_flows():
         'byte_count': flow.byte_count
     } for flow in flows])
 
+@api_bp.route('/flows/cache')
+def get_flow_cache_statistics():
+    """Get flow-install deduplication cache statistics"""
+    if controller_ref:
+        return jsonify(controller_ref.flow_manager.get_statistics())
+    return jsonify({'error': 'Controller not available'}), 503
+
+@api_bp.route('/blocklist')
+def get_blocklist_statistics():
+    """Get aggregated blocklist statistics"""
+    if controller_ref:
+        return jsonify(controller_ref.policy_enforcer.get_statistics())
+    return jsonify({'error': 'Controller not available'}), 503
+
+@api_bp.route('/detection')
+def get_detection_statistics():
+    """Get threat detector and verdict cache statistics"""
+    if controller_ref:
+        return jsonify(controller_ref.threat_detector.get_statistics())
+    return jsonify({'error': 'Controller not available'}), 503
+
+@api_bp.route('/detection/invalidate', methods=['POST'])
+def invalidate_verdicts():
+    """Drop cached verdicts after a detection policy change"""
+    if controller_ref:
+        controller_ref.threat_detector.invalidate_verdicts('requested via API')
+        return jsonify({'success': True})
+    return jsonify({'error': 'Controller not available'}), 503
+
+@api_bp.route('/reputation')
+def get_reputation_statistics():
+    """Get reputation table statistics"""
+    if controller_ref:
+        reputation = controller_ref.threat_detector.reputation
+        if reputation is None:
+            return jsonify({'error': 'Reputation feeds not enabled'}), 404
+        return jsonify(reputation.get_statistics())
+    return jsonify({'error': 'Controller not available'}), 503
+
+@api_bp.route('/reputation/reload', methods=['POST'])
+def reload_reputation():
+    """Rebuild the reputation table from the feeds in the background"""
+    if controller_ref:
+        reputation = controller_ref.threat_detector.reputation
+        if reputation is None:
+            return jsonify({'error': 'Reputation feeds not enabled'}), 404
+        reputation.reload()
+        return jsonify({'success': True})
+    return jsonify({'error': 'Controller not available'}), 503
+
+@api_bp.route('/model')
+def get_model_statistics():
+    """Get the active ML model version and hot-reload statistics"""
+    if controller_ref:
+        registry = controller_ref.threat_detector.model_registry
+        if registry is None:
+            return jsonify({'error': 'Model hot reload not enabled'}), 404
+        return jsonify(registry.get_statistics())
+    return jsonify({'error': 'Controller not available'}), 503
+
+@api_bp.route('/model/reload', methods=['POST'])
+def reload_model():
+    """Load the newest model bundle in the background if it changed"""
+    if controller_ref:
+        registry = controller_ref.threat_detector.model_registry
+        if registry is None:
+            return jsonify({'error': 'Model hot reload not enabled'}), 404
+        registry.reload()
+        return jsonify({'success': True})
+    return jsonify({'error': 'Controller not available'}), 503
+
+@api_bp.route('/model/rollback', methods=['POST'])
+def rollback_model():
+    """Swap the previous ML model back in"""
+    if controller_ref:
+        registry = controller_ref.threat_detector.model_registry
+        if registry is None:
+            return jsonify({'error': 'Model hot reload not enabled'}), 404
+        if not registry.rollback():
+            return jsonify({'error': 'No previous model to roll back to'}), 409
+        return jsonify({'success': True, 'active': registry.get_statistics()['active']})
+    return jsonify({'error': 'Controller not available'}), 503
+
 @api_bp.route('/metrics')
 def get_metrics():
     """Get system metrics"""
@@ -118,8 +201,8 @@ def block_ip():
         return jsonify({'error': 'IP address required'}), 400
     
     if controller_ref:
-        for datapath in controller_ref.datapaths.values():
-            controller_ref.policy_enforcer.block_ip(datapath, ip, duration)
+        controller_ref.policy_enforcer.block_ip_all(
+            list(controller_ref.datapaths.values()), ip, duration)
         
         return jsonify({'success': True, 'ip': ip, 'duration': duration})
     
@@ -135,13 +218,25 @@ def unblock_ip():
         return jsonify({'error': 'IP address required'}), 400
     
     if controller_ref:
-        for datapath in controller_ref.datapaths.values():
-            controller_ref.policy_enforcer.unblock_ip(datapath, ip)
+        controller_ref.policy_enforcer.unblock_ip_all(
+            list(controller_ref.datapaths.values()), ip)
         
         return jsonify({'success': True, 'ip': ip})
     
     return jsonify({'error': 'Controller not available'}), 503
 
+@api_bp.route('/pipeline')
+def get_pipeline_statistics():
+    """Get packet-in pipeline queue and batch statistics"""
+    if controller_ref:
+        return jsonify(controller_ref.packet_pipeline.get_statistics())
+    return jsonify({'error': 'Controller not available'}), 503
+
+@api_bp.route('/database/writer')
+def get_writer_statistics():
+    """Get write-behind backlog and flush latency"""
+    return jsonify(db.writer.get_statistics())
+
 @api_bp.route('/statistics')
 def get_statistics():
     """Get overall statistics"""
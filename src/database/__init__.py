@@ -9,14 +9,18 @@ Handles:
 - User data persistence
 """
 
-from .database import DatabaseManager, db
-from .models import Alert, FlowRule, NetworkFlow, SystemMetrics
+from ..utils.lazy_import import lazy_exports
 
-__all__ = [
-    'DatabaseManager',
-    'db',
-    'Alert',
-    'FlowRule',
-    'NetworkFlow',
-    'SystemMetrics'
-]
+# Imported on first access; see src/utils/lazy_import.py
+_EXPORTS = {
+    'DatabaseManager': '.database',
+    'db': '.database',
+    'Alert': '.models',
+    'FlowRule': '.models',
+    'NetworkFlow': '.models',
+    'SystemMetrics': '.models'
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
@@ -2,19 +2,49 @@ from sqlalchemy import create_engine, desc
 from sqlalchemy.orm import sessionmaker, scoped_session
 from contextlib import contextmanager
 from .models import Base, Alert, FlowRule, NetworkFlow, SystemMetrics
+from .write_behind import WriteBehindWriter
 from ..utils.config import Config
+from datetime import datetime
 import json
+import threading
 
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, url=None):
         self.config = Config()
-        self.engine = create_engine(
-            self.config.get('database.url', 'sqlite:///nidps.db'),
-            echo=False,
-            pool_pre_ping=True
+        self.url = url or self.config.get('database.url', 'sqlite:///nidps.db')
+        # Connecting and creating tables wait for the first query, so
+        # importing the module (and the `db` singleton) costs nothing
+        self._engine = None
+        self._session = None
+        self._init_lock = threading.Lock()
+        self.writer = WriteBehindWriter(
+            self.session_scope,
+            flush_size=self.config.get('database.write_behind.flush_size', 500),
+            flush_interval=self.config.get('database.write_behind.flush_interval', 1.0),
+            max_retries=self.config.get('database.write_behind.max_retries', 5),
+            retry_backoff=self.config.get('database.write_behind.retry_backoff', 0.5),
+            max_backoff=self.config.get('database.write_behind.max_backoff', 30.0)
         )
-        Base.metadata.create_all(self.engine)
-        self.Session = scoped_session(sessionmaker(bind=self.engine))
+    
+    def _initialize(self):
+        with self._init_lock:
+            if self._engine is None:
+                engine = create_engine(self.url, echo=False, pool_pre_ping=True)
+                Base.metadata.create_all(engine)
+                self._session = scoped_session(sessionmaker(bind=engine))
+                self._engine = engine
+    
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._initialize()
+        return self._engine
+    
+    @property
+    def Session(self):
+        if self._engine is None:
+            self._initialize()
+        return self._session
     
     @contextmanager
     def session_scope(self):
@@ -36,6 +66,11 @@ class DatabaseManager:
             session.add(alert)
             return alert.id
     
+    def queue_alert(self, alert_data):
+        """Buffer an alert for the write-behind writer, returning its id"""
+        alert_data.setdefault('timestamp', datetime.utcnow())
+        return self.writer.enqueue(Alert, alert_data)
+    
     def get_recent_alerts(self, limit=100, severity=None):
         """Get recent alerts"""
         with self.session_scope() as session:
@@ -51,6 +86,22 @@ class DatabaseManager:
             session.add(rule)
             return rule.id
     
+    def queue_flow_rule(self, rule_data):
+        """Buffer a flow rule for the write-behind writer, returning its id"""
+        rule_data.setdefault('created_at', datetime.utcnow())
+        return self.writer.enqueue(FlowRule, rule_data)
+    
+    def queue_flow_rules_inactive(self, flow_ids, removed_at=None):
+        """Buffer marking flow rules removed from their switch as inactive"""
+        removed_at = removed_at or datetime.utcnow()
+        for flow_id in flow_ids:
+            self.writer.enqueue_update(FlowRule, flow_id,
+                                       {'active': False, 'expires_at': removed_at})
+    
+    def flush(self):
+        """Write all buffered rows immediately"""
+        return self.writer.flush()
+    
     def get_active_flow_rules(self, switch_id=None):
         """Get active flow rules"""
         with self.session_scope() as session:
@@ -0,0 +1,240 @@
+"""
+Write-behind buffer for high-volume inserts
+
+Rows are appended to in-memory buffers and written by a background
+thread with one bulk_insert_mappings call per model, either when
+flush_size rows are pending or flush_interval seconds have passed.
+Primary keys are allocated when a row is queued so callers still get
+an id back immediately. This assumes the controller is the only
+process inserting into the buffered tables. Updates to rows by primary
+key are buffered the same way, coalesced per row, and applied with
+bulk_update_mappings after the pending inserts.
+
+A failed flush puts its rows back in front of anything queued since, and
+the background thread retries with exponential backoff. After
+max_retries failed attempts the batch is written one row per
+transaction, so a single bad row cannot take the valid ones down with
+it. Only the rows that still fail are logged as dead letters and
+dropped, so a table the database keeps rejecting cannot grow the buffer
+without bound.
+"""
+
+import atexit
+import threading
+import time
+from sqlalchemy import func
+from ..utils.logger import setup_logger
+
+logger = setup_logger('write_behind')
+
+
+class WriteBehindWriter:
+    def __init__(self, session_scope, flush_size=500, flush_interval=1.0,
+                 max_retries=5, retry_backoff=0.5, max_backoff=30.0):
+        self._session_scope = session_scope
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+
+        self._buffers = {}  # {model: [row mappings]}
+        self._updates = {}  # {model: {id: changed columns}}
+        self._next_ids = {}  # {model: next primary key}
+        self._pending = 0
+        self._attempts = 0  # consecutive failed flushes
+        self._retry_at = 0.0  # monotonic time the next retry is due
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.running = False
+
+        # Statistics
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.flush_failures = 0
+        self.retried_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        """Start the background flush thread"""
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"Write-behind writer started: flush_size={self.flush_size}, "
+                    f"flush_interval={self.flush_interval}s")
+
+    def stop(self):
+        """Stop the flush thread and write out everything buffered"""
+        with self._cond:
+            if not self.running:
+                return
+            self.running = False
+            self._cond.notify()
+
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def enqueue(self, model, row):
+        """Buffer a row for model and return its allocated id"""
+        if not self.running:
+            self.start()
+
+        with self._cond:
+            row_id = self._next_ids.get(model)
+            if row_id is None:
+                row_id = self._load_next_id(model)
+            self._next_ids[model] = row_id + 1
+
+            row['id'] = row_id
+            self._buffers.setdefault(model, []).append(row)
+            self._pending += 1
+            if self._pending >= self.flush_size:
+                self._cond.notify()
+
+        return row_id
+
+    def enqueue_update(self, model, row_id, values):
+        """Buffer a column update for an existing (or queued) row"""
+        if not self.running:
+            self.start()
+
+        with self._cond:
+            updates = self._updates.setdefault(model, {})
+            row = updates.get(row_id)
+            if row is None:
+                updates[row_id] = row = {'id': row_id}
+                self._pending += 1
+            row.update(values)
+            if self._pending >= self.flush_size:
+                self._cond.notify()
+
+    def flush(self):
+        """Write all buffered rows now"""
+        with self._flush_lock:
+            with self._cond:
+                buffers = self._buffers
+                updates = self._updates
+                count = self._pending
+                self._buffers = {}
+                self._updates = {}
+                self._pending = 0
+
+            if not count:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                with self._session_scope() as session:
+                    for model, rows in buffers.items():
+                        session.bulk_insert_mappings(model, rows)
+                    session.flush()
+                    for model, rows in updates.items():
+                        session.bulk_update_mappings(model, list(rows.values()))
+            except Exception as e:
+                self._flush_failed(buffers, updates, count, e)
+                return 0
+
+            self._attempts = 0
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.flushed_rows += count
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            return count
+
+    def _flush_failed(self, buffers, updates, count, error):
+        """Re-buffer the rows of a failed flush, or drop them once retries run out"""
+        self.flush_failures += 1
+        self._attempts += 1
+        if self._attempts > self.max_retries:
+            self._attempts = 0
+            logger.error(f"Write-behind flush of {count} rows failed {self.max_retries + 1} "
+                         f"times, writing them one by one: {error}")
+            self._flush_rows_individually(buffers, updates)
+            return
+
+        delay = min(self.retry_backoff * 2 ** (self._attempts - 1), self.max_backoff)
+        logger.warning(f"Write-behind flush of {count} rows failed (attempt {self._attempts}), "
+                       f"retrying in {delay:.1f}s: {error}")
+        with self._cond:
+            # Failed rows go first; updates queued since then win per column
+            for model, rows in self._buffers.items():
+                buffers.setdefault(model, []).extend(rows)
+            for model, rows in self._updates.items():
+                merged = updates.setdefault(model, {})
+                for row_id, values in rows.items():
+                    if row_id in merged:
+                        merged[row_id].update(values)
+                        self._pending -= 1
+                    else:
+                        merged[row_id] = values
+            self._buffers = buffers
+            self._updates = updates
+            self._pending += count
+            self._retry_at = time.monotonic() + delay
+        self.retried_rows += count
+
+    def _flush_rows_individually(self, buffers, updates):
+        """Write each row in its own transaction, dead-lettering the ones that fail"""
+        written = 0
+        writes = [(model, 'insert', row) for model, rows in buffers.items() for row in rows]
+        writes += [(model, 'update', row) for model, rows in updates.items()
+                   for row in rows.values()]
+        for model, kind, row in writes:
+            try:
+                with self._session_scope() as session:
+                    if kind == 'insert':
+                        session.bulk_insert_mappings(model, [row])
+                    else:
+                        session.bulk_update_mappings(model, [row])
+            except Exception as e:
+                self.failed_rows += 1
+                logger.error(f"Dead letter {model.__tablename__} {kind}: {row} ({e})")
+            else:
+                written += 1
+        self.flushed_rows += written
+        return written
+
+    def _flush_loop(self):
+        """Flush on size or time thresholds, backing off after failures"""
+        while self.running:
+            with self._cond:
+                if self.running:
+                    backoff = self._retry_at - time.monotonic()
+                    if backoff > 0:
+                        self._cond.wait(backoff)
+                    elif self._pending < self.flush_size:
+                        self._cond.wait(self.flush_interval)
+            if time.monotonic() >= self._retry_at:
+                self.flush()
+
+    def _load_next_id(self, model):
+        """Read the next free primary key for model"""
+        with self._session_scope() as session:
+            max_id = session.query(func.max(model.id)).scalar()
+        return (max_id or 0) + 1
+
+    def get_statistics(self):
+        """Get backlog and flush latency statistics"""
+        return {
+            'backlog': self._pending,
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+            'failed_rows': self.failed_rows,
+            'flush_failures': self.flush_failures,
+            'retried_rows': self.retried_rows,
+            'last_flush_ms': self.last_flush_ms,
+            'max_flush_ms': self.max_flush_ms,
+            'avg_flush_ms': self._total_flush_ms / self.flushes if self.flushes else 0.0
+        }
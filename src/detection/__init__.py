@@ -8,12 +8,29 @@ Handles:
 - Real-time threat identification
 """
 
-from .suricata_monitor import SuricataMonitor
-from .traffic_analyzer import TrafficAnalyzer
-from .ml_detector import MLDetector
+from ..utils.lazy_import import lazy_exports
 
-__all__ = [
-    'SuricataMonitor',
-    'TrafficAnalyzer',
-    'MLDetector'
-]
+# Imported on first access; see src/utils/lazy_import.py
+_EXPORTS = {
+    'SuricataMonitor': '.suricata_monitor',
+    'TrafficAnalyzer': '.traffic_analyzer',
+    'MLDetector': '.ml_detector',
+    'CompiledForest': '.compiled_forest',
+    'ModelBundle': '.model_bundle',
+    'ModelRegistry': '.model_registry',
+    'InferencePool': '.inference_pool',
+    'FlowFeatures': '.flow_features',
+    'SlidingWindowCounter': '.sliding_window',
+    'SlidingWindowDistinct': '.sliding_window',
+    'CountMinSketch': '.sketches',
+    'DistinctSketch': '.sketches',
+    'HeavyHitters': '.sketches',
+    'PayloadSignatures': '.payload_signatures',
+    'EWMABaseline': '.baselines',
+    'TrafficBaselines': '.baselines',
+    'DestinationMonitor': '.destination_monitor'
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
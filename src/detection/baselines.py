@@ -0,0 +1,319 @@
+"""
+Adaptive traffic baselines
+
+Each host (and each subnet) keeps an exponentially weighted mean and
+variance of its packet rate, byte rate and fan-out (distinct destinations)
+per interval. Packets are accumulated into the current interval; when a
+key's interval closes, the interval's rates are folded into the EWMA with
+
+    delta = x - mean
+    mean += alpha * delta
+    var = (1 - alpha) * (var + alpha * delta ** 2)
+
+so every update is O(1) and a key costs a few floats whatever its
+history. Idle intervals are folded in as zeros (at most MAX_IDLE_FOLDS of
+them, after which the old mean has decayed away). A key is anomalous when
+the rates of its current, still-open interval sit more than z_threshold
+standard deviations above its mean, once it has min_samples intervals of
+history. Because an open interval only grows, the check is conservative
+until the interval closes.
+
+Baselines are saved to a compressed .npz file (one float32 row per key)
+and loaded on start, so a restart does not relearn them.
+"""
+
+import math
+import os
+import socket
+import time
+import numpy as np
+from ..utils.logger import setup_logger
+
+logger = setup_logger('baselines')
+
+METRICS = ('packet_rate', 'byte_rate', 'fan_out')
+MAX_IDLE_FOLDS = 64
+
+# Saved columns: samples, then mean and variance per metric
+_COLUMNS = 1 + 2 * len(METRICS)
+_NO_HISTORY = (0.0,) * len(METRICS)
+
+
+class _Baseline:
+    """EWMA state of one key plus its open interval's accumulators"""
+
+    __slots__ = ('interval_start', 'samples', 'mean', 'var', 'std',
+                 'packets', 'bytes', 'destinations')
+
+    def __init__(self, interval_start):
+        self.interval_start = interval_start
+        self.samples = 0
+        self.mean = self.var = self.std = _NO_HISTORY  # until the first fold
+        self.packets = 0
+        self.bytes = 0
+        self.destinations = set()
+
+
+class EWMABaseline:
+    """Per-key EWMA baselines of packet rate, byte rate and fan-out"""
+
+    def __init__(self, interval=10.0, alpha=0.1, z_threshold=4.0, min_samples=6,
+                 min_stddev_ratio=0.1, max_fan_out=4096, expiry=86400.0):
+        self.interval = interval
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.min_stddev_ratio = min_stddev_ratio
+        self.max_fan_out = max_fan_out
+        self.expiry = expiry
+
+        # Ordered by interval start, which lets sweep() stop at the first live key
+        self.baselines = {}
+
+        # Statistics
+        self.updates = 0
+        self.anomalies = 0
+
+    def update(self, key, destination, size, now=None):
+        """Account one packet; returns the names of the metrics that are anomalous"""
+        now = time.monotonic() if now is None else now
+        baseline = self.baselines.get(key)
+        if baseline is None:
+            baseline = self.baselines[key] = _Baseline(now)
+        elif now - baseline.interval_start >= self.interval:
+            self._close_interval(key, baseline, now)
+
+        self.updates += 1
+        baseline.packets += 1
+        baseline.bytes += size
+        if len(baseline.destinations) < self.max_fan_out:
+            baseline.destinations.add(destination)
+
+        if baseline.samples < self.min_samples:
+            return ()
+        anomalous = tuple(metric for metric, z in zip(METRICS, self._zscores(baseline))
+                          if z > self.z_threshold)
+        if anomalous:
+            self.anomalies += 1
+        return anomalous
+
+    def _rates(self, baseline):
+        interval = self.interval
+        return (baseline.packets / interval, baseline.bytes / interval,
+                float(len(baseline.destinations)))
+
+    def _zscores(self, baseline):
+        return [(x - mean) / std
+                for x, mean, std in zip(self._rates(baseline), baseline.mean, baseline.std)]
+
+    def _close_interval(self, key, baseline, now):
+        """Fold the open interval, and any idle ones after it, into the EWMA"""
+        elapsed = int((now - baseline.interval_start) // self.interval)
+        self._fold(baseline, self._rates(baseline))
+        for _ in range(min(elapsed - 1, MAX_IDLE_FOLDS)):
+            self._fold(baseline, (0.0, 0.0, 0.0))
+
+        baseline.interval_start += elapsed * self.interval
+        baseline.packets = 0
+        baseline.bytes = 0
+        baseline.destinations = set()
+        baseline.std = [max(math.sqrt(var), self.min_stddev_ratio * mean, 1.0)
+                        for mean, var in zip(baseline.mean, baseline.var)]
+
+        # Move to the end to keep the dict ordered by interval start
+        del self.baselines[key]
+        self.baselines[key] = baseline
+
+    def _fold(self, baseline, values):
+        alpha = self.alpha
+        if not baseline.samples:
+            baseline.mean = list(values)
+            baseline.var = [0.0] * len(METRICS)
+        else:
+            for i, x in enumerate(values):
+                delta = x - baseline.mean[i]
+                baseline.mean[i] += alpha * delta
+                baseline.var[i] = (1 - alpha) * (baseline.var[i] + alpha * delta * delta)
+        baseline.samples += 1
+
+    def is_learned(self, key):
+        """True once key has min_samples intervals of history"""
+        baseline = self.baselines.get(key)
+        return baseline is not None and baseline.samples >= self.min_samples
+
+    def zscores(self, key):
+        """{metric: z-score} of key's open interval, or None if unknown"""
+        baseline = self.baselines.get(key)
+        if baseline is None or not baseline.samples:
+            return None
+        return dict(zip(METRICS, self._zscores(baseline)))
+
+    def baseline(self, key):
+        """{metric: (mean, stddev)} learned for key, or None if unknown"""
+        baseline = self.baselines.get(key)
+        if baseline is None or not baseline.samples:
+            return None
+        return {metric: (mean, math.sqrt(var))
+                for metric, mean, var in zip(METRICS, baseline.mean, baseline.var)}
+
+    def sweep(self, now=None):
+        """Forget keys idle for longer than expiry; returns how many"""
+        now = time.monotonic() if now is None else now
+        cutoff = now - self.expiry
+        expired = []
+        for key, baseline in self.baselines.items():
+            if baseline.interval_start >= cutoff:
+                break
+            expired.append(key)
+        for key in expired:
+            del self.baselines[key]
+        return len(expired)
+
+    def __len__(self):
+        return len(self.baselines)
+
+    def __contains__(self, key):
+        return key in self.baselines
+
+    def to_array(self):
+        """(keys, float32 state rows) of the keys with history"""
+        keys = [key for key, b in self.baselines.items() if b.samples]
+        state = np.zeros((len(keys), _COLUMNS), dtype=np.float32)
+        for row, key in zip(state, keys):
+            baseline = self.baselines[key]
+            row[0] = baseline.samples
+            row[1::2] = baseline.mean
+            row[2::2] = baseline.var
+        return keys, state
+
+    def load_array(self, keys, state, now=None):
+        """Restore baselines saved by to_array(); open intervals start now"""
+        now = time.monotonic() if now is None else now
+        for key, row in zip(keys, state.tolist()):
+            baseline = _Baseline(now)
+            baseline.samples = int(row[0])
+            baseline.mean = row[1::2]
+            baseline.var = row[2::2]
+            baseline.std = [max(math.sqrt(var), self.min_stddev_ratio * mean, 1.0)
+                            for mean, var in zip(baseline.mean, baseline.var)]
+            self.baselines[key] = baseline
+
+    def get_statistics(self):
+        """Get key count and anomaly statistics"""
+        return {
+            'keys': len(self.baselines),
+            'learned': sum(1 for b in self.baselines.values() if b.samples >= self.min_samples),
+            'updates': self.updates,
+            'anomalies': self.anomalies
+        }
+
+
+def subnet_of(ip, prefixlen=24):
+    """Network address of ip's /prefixlen as 'a.b.c.d/len', or None if invalid"""
+    try:
+        address = int.from_bytes(socket.inet_aton(ip), 'big')
+    except (OSError, TypeError):
+        return None
+    address &= (0xffffffff << (32 - prefixlen)) & 0xffffffff
+    return f'{socket.inet_ntoa(address.to_bytes(4, "big"))}/{prefixlen}'
+
+
+class TrafficBaselines:
+    """Host and subnet baselines over the packet-in stream"""
+
+    def __init__(self, subnet_prefix=24, state_file=None, save_interval=300, **options):
+        self.subnet_prefix = subnet_prefix
+        self.state_file = state_file
+        self.save_interval = save_interval
+        self.hosts = EWMABaseline(**options)
+        self.subnets = EWMABaseline(**options)
+        self._subnets = {}  # {ip: subnet}
+        self._next_save = time.monotonic() + save_interval
+
+        # Statistics
+        self.saves = 0
+        self.last_save = None
+
+        if state_file:
+            self.load()
+
+    def observe(self, features, now=None):
+        """Account one packet; returns the threat names it raised"""
+        src_ip = features.get('src_ip')
+        if not src_ip:
+            return ()
+        now = time.monotonic() if now is None else now
+        dst_ip = features.get('dst_ip')
+        size = features.get('total_length') or 0
+
+        threats = ()
+        if self.hosts.update(src_ip, dst_ip, size, now):
+            threats = ('TRAFFIC_ANOMALY',)
+        subnet = self._subnets.get(src_ip)
+        if subnet is None:
+            if len(self._subnets) > 65536:
+                self._subnets.clear()
+            subnet = self._subnets[src_ip] = subnet_of(src_ip, self.subnet_prefix)
+        if subnet and self.subnets.update(subnet, dst_ip, size, now):
+            threats += ('SUBNET_TRAFFIC_ANOMALY',)
+        return threats
+
+    def sweep(self, now=None):
+        """Expire idle keys and save the baselines when due"""
+        now = time.monotonic() if now is None else now
+        self.hosts.sweep(now)
+        self.subnets.sweep(now)
+        if self.state_file and now >= self._next_save:
+            self.save()
+            self._next_save = now + self.save_interval
+
+    def save(self, path=None):
+        """Write the learned baselines atomically; False on failure"""
+        path = path or self.state_file
+        host_keys, host_state = self.hosts.to_array()
+        subnet_keys, subnet_state = self.subnets.to_array()
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(
+                    f, metrics=np.array(METRICS),
+                    host_keys=np.array(host_keys, dtype=str), host_state=host_state,
+                    subnet_keys=np.array(subnet_keys, dtype=str), subnet_state=subnet_state)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to save traffic baselines: {e}")
+            return False
+        self.saves += 1
+        self.last_save = time.time()
+        return True
+
+    def load(self, path=None):
+        """Restore baselines from a file written by save(); False if unavailable"""
+        path = path or self.state_file
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as saved:
+                if tuple(saved['metrics'].tolist()) != METRICS:
+                    logger.warning(f"Ignoring traffic baselines with other metrics: {path}")
+                    return False
+                self.hosts.load_array(saved['host_keys'].tolist(), saved['host_state'])
+                self.subnets.load_array(saved['subnet_keys'].tolist(), saved['subnet_state'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to load traffic baselines: {e}")
+            return False
+        logger.info(f"Loaded traffic baselines: {len(self.hosts)} hosts, "
+                    f"{len(self.subnets)} subnets")
+        return True
+
+    def get_statistics(self):
+        """Get host and subnet baseline statistics"""
+        return {
+            'hosts': self.hosts.get_statistics(),
+            'subnets': self.subnets.get_statistics(),
+            'subnet_prefix': self.subnet_prefix,
+            'state_file': self.state_file,
+            'saves': self.saves,
+            'last_save': self.last_save
+        }
@@ -0,0 +1,214 @@
+"""
+Compiled random-forest inference
+
+sklearn's RandomForestClassifier.predict_proba validates its input,
+dispatches one job per tree through joblib and calls each tree's Cython
+predict on its own; for the few rows of a packet batch that overhead is
+nearly all of the cost. CompiledForest flattens every tree of a fitted
+forest into contiguous NumPy arrays (split feature, threshold, children
+and leaf class fractions, with all trees' nodes in one index space) and
+evaluates a batch on all trees at once, one tree level per step:
+
+    node = children[2 * node + (x[feature[node]] > threshold[node])]
+
+for an N x n_trees array of node indices. Leaves are their own children,
+so finished trees stay put while deeper ones descend, and max_depth steps
+reach every leaf. The leaf fractions are then summed tree by tree and
+divided by the tree count, exactly as sklearn accumulates them. Inputs are
+cast to float32 as sklearn does, so the probabilities are bit-for-bit
+those of a single-threaded predict_proba.
+
+fold_scaling() maps the thresholds of a forest trained on standardized
+inputs back to raw feature units. The folded forest compares raw float64
+inputs, so it agrees with scaling then predicting except for inputs
+within rounding error of a threshold.
+
+Compiled forests are saved as a directory of .npy files plus meta.json
+and memory-mapped when loaded: that needs neither sklearn nor unpickling,
+pages in only the nodes inference touches, and controllers on one host
+share the pages of the same file.
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+from ..utils.logger import setup_logger
+
+logger = setup_logger('compiled_forest')
+
+FORMAT_VERSION = 2
+
+_ARRAYS = ('feature', 'threshold', 'children', 'missing_left', 'value', 'roots', 'classes')
+
+
+class CompiledForest:
+    """A fitted random forest flattened into arrays for vectorized inference"""
+
+    def __init__(self, feature, threshold, children, missing_left, value, roots, classes,
+                 max_depth, n_features, input_dtype=np.float32):
+        self.feature = feature            # int64 per node, 0 at leaves
+        self.threshold = threshold        # float64 per node
+        self.children = children          # int64 per node: left, right; a leaf's are itself
+        self.missing_left = missing_left  # bool per node: NaN goes left
+        self.value = value                # float64 per node x class: leaf class fractions
+        self.roots = roots                # int64 root node of each tree
+        self.classes = classes
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.input_dtype = np.dtype(input_dtype)
+        self.meta = {}  # extra metadata saved alongside, see save()
+
+    @classmethod
+    def from_model(cls, model):
+        """Flatten a fitted single-output RandomForestClassifier"""
+        estimators = getattr(model, 'estimators_', None)
+        if not estimators or getattr(model, 'n_outputs_', 1) != 1:
+            raise ValueError("Not a fitted single-output random forest")
+
+        n_classes = len(model.classes_)
+        features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left < 0
+            roots.append(offset)
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, 0.0, tree.threshold))
+            lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+            missing.append(getattr(tree, 'missing_go_to_left',
+                                   np.zeros(tree.node_count, dtype=np.uint8)).astype(bool))
+            # Older sklearn stores weighted class counts, newer fractions;
+            # normalize per node as DecisionTreeClassifier.predict_proba does
+            value = tree.value[:, 0, :n_classes]
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += tree.node_count
+
+        children = np.empty(2 * offset, dtype=np.int64)
+        children[0::2] = np.concatenate(lefts)
+        children[1::2] = np.concatenate(rights)
+        return cls(
+            feature=np.concatenate(features).astype(np.int64),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=children,
+            missing_left=np.concatenate(missing),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.array(roots, dtype=np.int64),
+            classes=np.asarray(model.classes_),
+            max_depth=max_depth,
+            n_features=model.n_features_in_
+        )
+
+    def fold_scaling(self, mean, scale):
+        """Forest taking raw inputs, for one trained on (x - mean) / scale"""
+        mean = np.asarray(mean, dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
+        if mean.shape != (self.n_features,) or scale.shape != (self.n_features,):
+            raise ValueError(f"Scaling must have {self.n_features} features")
+        if (scale <= 0).any():
+            raise ValueError("Scaling factors must be positive")
+        # Leaves keep threshold 0 on feature 0; they are never compared
+        threshold = self.threshold * scale[self.feature] + mean[self.feature]
+        return CompiledForest(self.feature, threshold, self.children, self.missing_left,
+                              self.value, self.roots, self.classes, self.max_depth,
+                              self.n_features, input_dtype=np.float64)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def apply(self, X):
+        """N x n_trees array of the leaf each row reaches in each tree"""
+        X = np.asarray(X, dtype=self.input_dtype)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+
+        n = len(X)
+        flat = X.ravel()
+        base = (np.arange(n, dtype=np.int64) * self.n_features)[:, None]
+        nodes = np.tile(self.roots, (n, 1))
+        has_missing = bool(np.isnan(flat).any())
+        feature, threshold, children = self.feature, self.threshold, self.children
+        for _ in range(self.max_depth):
+            x = flat[base + feature[nodes]]
+            right = x > threshold[nodes]
+            if has_missing:
+                # NaN compares false either way; it follows the node's learned side
+                right |= np.isnan(x) & ~self.missing_left[nodes]
+            nodes = children[2 * nodes + right]
+        return nodes
+
+    def predict_proba(self, X):
+        """Class probabilities, columns in classes order"""
+        leaves = self.apply(X)
+        proba = np.zeros((len(leaves), self.value.shape[1]))
+        # Tree by tree, in sklearn's order of accumulation
+        for tree in range(self.n_trees):
+            proba += self.value[leaves[:, tree]]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes.take(self.predict_proba(X).argmax(axis=1))
+
+    @property
+    def memory_mapped(self):
+        return isinstance(self.feature.base, np.memmap)
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in _ARRAYS)
+
+    def save(self, directory, **meta):
+        """Write each array to directory as .npy, plus meta.json with meta; atomic"""
+        directory = str(directory)
+        tmp_directory = f'{directory}.tmp'
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        for name in _ARRAYS:
+            np.save(os.path.join(tmp_directory, f'{name}.npy'), getattr(self, name),
+                    allow_pickle=False)
+        meta = dict(meta, format=FORMAT_VERSION, max_depth=self.max_depth,
+                    n_features=self.n_features, input_dtype=self.input_dtype.str)
+        with open(os.path.join(tmp_directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_directory, directory)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Load a forest written by save(), memory-mapping its arrays by default"""
+        directory = str(directory)
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled forest format {meta.get('format')}")
+        # asarray drops the memmap subclass but keeps the mapping alive
+        arrays = {name: np.asarray(np.load(os.path.join(directory, f'{name}.npy'),
+                                           mmap_mode=mmap_mode, allow_pickle=False))
+                  for name in _ARRAYS}
+        forest = cls(max_depth=meta['max_depth'], n_features=meta['n_features'],
+                     input_dtype=meta['input_dtype'], **arrays)
+        forest.meta = meta
+        return forest
+
+    def get_statistics(self):
+        """Get forest size statistics"""
+        return {
+            'trees': self.n_trees,
+            'nodes': self.n_nodes,
+            'max_depth': self.max_depth,
+            'memory_bytes': self.nbytes(),
+            'memory_mapped': self.memory_mapped
+        }
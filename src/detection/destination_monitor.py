@@ -0,0 +1,273 @@
+"""
+Destination-centric DDoS detection
+
+The per-source detectors miss floods spread over many (often spoofed)
+sources that each send only a handful of packets. DestinationMonitor
+aggregates traffic per destination instead: packet and SYN counts,
+distinct sources (a small HyperLogLog per destination) and a histogram of
+hashed sources from which the normalized source entropy is computed. All
+of it is kept per bucket of a sliding window in fixed-size NumPy arrays
+indexed by a destination slot, and updated with a handful of vectorized
+operations per packet batch rather than per packet. Window totals of the
+packet and SYN counts are maintained as buckets rotate, so the costlier
+cardinality and entropy estimates are only computed for destinations
+whose rate is already over a threshold.
+
+A destination is reported as a victim when its packet or SYN rate over
+the window crosses a threshold and the traffic is distributed: enough
+distinct sources, or a source entropy near that of uniformly random
+addresses. A victim is reported again only after hold_time, so its
+mitigation is applied once rather than per batch.
+"""
+
+import math
+import time
+import numpy as np
+from .flow_features import FlowFeatures
+from ..utils.logger import setup_logger
+
+logger = setup_logger('destination_monitor')
+
+_FMIX1 = np.uint64(0xff51afd7ed558ccd)
+_FMIX2 = np.uint64(0xc4ceb9fe1a85ec53)
+_SHIFT33 = np.uint64(33)
+
+
+def _mix(values):
+    """MurmurHash3 fmix64 over an array of int64 hashes, as uint64"""
+    h = np.asarray(values, dtype=np.int64).view(np.uint64)
+    h = h ^ (h >> _SHIFT33)
+    h = h * _FMIX1
+    h = h ^ (h >> _SHIFT33)
+    h = h * _FMIX2
+    return h ^ (h >> _SHIFT33)
+
+
+class DestinationMonitor:
+    """Sliding-window per-destination rate, source cardinality and entropy"""
+
+    def __init__(self, window=10.0, buckets=5, max_destinations=1024, precision=6,
+                 entropy_bins=64, packet_rate_threshold=5000, syn_rate_threshold=1000,
+                 min_sources=100, entropy_threshold=0.95, hold_time=60):
+        self.window = window
+        self.buckets = buckets
+        self.max_destinations = max_destinations
+        self.precision = precision
+        self.entropy_bins = entropy_bins
+        self.packet_rate_threshold = packet_rate_threshold
+        self.syn_rate_threshold = syn_rate_threshold
+        self.min_sources = min_sources
+        self.entropy_threshold = entropy_threshold
+        self.hold_time = hold_time
+
+        registers = 1 << precision
+        self._registers = registers
+        self._hll_alpha = 0.7213 / (1 + 1.079 / registers)
+        self._bucket_width = window / buckets
+        self._bucket = None  # absolute index of the current bucket
+
+        # Per bucket and destination slot
+        self.packets = np.zeros((buckets, max_destinations), dtype=np.int64)
+        self.syns = np.zeros((buckets, max_destinations), dtype=np.int64)
+        self.sources = np.zeros((buckets, max_destinations, registers), dtype=np.uint8)
+        self.histogram = np.zeros((buckets, max_destinations, entropy_bins), dtype=np.uint32)
+        self.window_packets = np.zeros(max_destinations, dtype=np.int64)
+        self.window_syns = np.zeros(max_destinations, dtype=np.int64)
+
+        self._slots = {}  # {dst_ip: slot}
+        self._slot_ips = [None] * max_destinations
+        self._last_seen = np.full(max_destinations, -np.inf)
+        self.victims = {}  # {dst_ip: time its hold ends}
+
+        # Statistics
+        self.batches = 0
+        self.packets_seen = 0
+        self.evictions = 0
+        self.untracked = 0
+        self.detections = 0
+
+    def _advance(self, now):
+        """Rotate to now's bucket, clearing the buckets that left the window"""
+        bucket = int(now // self._bucket_width)
+        if self._bucket is None:
+            self._bucket = bucket
+            return
+        for index in range(max(self._bucket + 1, bucket - self.buckets + 1), bucket + 1):
+            row = index % self.buckets
+            self.window_packets -= self.packets[row]
+            self.window_syns -= self.syns[row]
+            self.packets[row] = 0
+            self.syns[row] = 0
+            self.sources[row] = 0
+            self.histogram[row] = 0
+        self._bucket = max(self._bucket, bucket)
+
+    def _slot(self, dst_ip, now):
+        """Slot of dst_ip, evicting the least recently seen destination if full.
+
+        Returns -1 if every slot is in use by this batch.
+        """
+        slot = self._slots.get(dst_ip)
+        if slot is not None:
+            return slot
+        if len(self._slots) < self.max_destinations:
+            slot = len(self._slots)
+        else:
+            slot = int(np.argmin(self._last_seen))
+            if self._last_seen[slot] >= now:
+                return -1
+            del self._slots[self._slot_ips[slot]]
+            self.packets[:, slot] = 0
+            self.syns[:, slot] = 0
+            self.sources[:, slot] = 0
+            self.histogram[:, slot] = 0
+            self.window_packets[slot] = 0
+            self.window_syns[slot] = 0
+            self.evictions += 1
+        self._slots[dst_ip] = slot
+        self._slot_ips[slot] = dst_ip
+        self._last_seen[slot] = now
+        return slot
+
+    def update(self, features_batch, now=None):
+        """Account a batch of packets; returns the destinations newly under attack"""
+        now = time.monotonic() if now is None else now
+        self._advance(now)
+        self.batches += 1
+
+        slots = []
+        source_hashes = []
+        syn_flags = []
+        slot_of = self._slot
+        for features in features_batch:
+            features = FlowFeatures.coerce(features)
+            dst_ip = features.dst_ip
+            src_ip = features.src_ip
+            if not dst_ip or not src_ip:
+                continue
+            slot = slot_of(dst_ip, now)
+            if slot < 0:
+                self.untracked += 1
+                continue
+            slots.append(slot)
+            source_hashes.append(hash(src_ip))
+            syn_flags.append(features.protocol == 6 and (features.tcp_flags or 0) & 0x12 == 0x02)
+        if not slots:
+            return []
+        self.packets_seen += len(slots)
+
+        slots = np.array(slots, dtype=np.int64)
+        hashes = _mix(source_hashes)
+        row = self._bucket % self.buckets
+        self._last_seen[slots] = now
+
+        # Unbuffered updates touch only the batch's slots, not whole rows
+        syn_flags = np.array(syn_flags, dtype=np.int64)
+        np.add.at(self.packets[row], slots, 1)
+        np.add.at(self.syns[row], slots, syn_flags)
+        np.add.at(self.window_packets, slots, 1)
+        np.add.at(self.window_syns, slots, syn_flags)
+
+        # HyperLogLog: low bits pick the register, the top 32 bits give the rank
+        registers = self._registers
+        register = (hashes & np.uint64(registers - 1)).astype(np.int64)
+        top = (hashes >> np.uint64(32)).astype(np.float64)
+        rank = (33 - np.frexp(top)[1]).astype(np.uint8)
+        np.maximum.at(self.sources[row].reshape(-1), slots * registers + register, rank)
+
+        bins = self.entropy_bins
+        source_bin = ((hashes >> np.uint64(16)) % np.uint64(bins)).astype(np.int64)
+        np.add.at(self.histogram[row].reshape(-1), slots * bins + source_bin, 1)
+
+        over = ((self.window_packets[slots] >= self.packet_rate_threshold * self.window) |
+                (self.window_syns[slots] >= self.syn_rate_threshold * self.window))
+        if not over.any():
+            return []
+        return self._evaluate(np.unique(slots[over]), now)
+
+    def _window_stats(self, slots):
+        """(packet rate, SYN rate, distinct sources, entropy) arrays for slots"""
+        packet_rate = self.window_packets[slots] / self.window
+        syn_rate = self.window_syns[slots] / self.window
+
+        registers = self.sources[:, slots, :].max(axis=0).astype(np.float64)
+        m = self._registers
+        estimate = self._hll_alpha * m * m / np.exp2(-registers).sum(axis=1)
+        zeros = (registers == 0).sum(axis=1)
+        small = (estimate <= 2.5 * m) & (zeros > 0)
+        estimate[small] = m * np.log(m / zeros[small])
+
+        counts = self.histogram[:, slots, :].sum(axis=0).astype(np.float64)
+        totals = counts.sum(axis=1, keepdims=True)
+        p = np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+        entropy = -(p * np.log(p, out=np.zeros_like(p), where=p > 0)).sum(axis=1)
+        entropy /= math.log(self.entropy_bins)
+        return packet_rate, syn_rate, estimate, entropy
+
+    def _evaluate(self, slots, now):
+        """Report the slots whose traffic is distributed and not already on hold"""
+        slots = np.array([slot for slot in slots
+                          if self.victims.get(self._slot_ips[slot], 0) <= now], dtype=np.int64)
+        if not len(slots):
+            return []
+        packet_rate, syn_rate, sources, entropy = self._window_stats(slots)
+        attacked = (((packet_rate >= self.packet_rate_threshold) |
+                     (syn_rate >= self.syn_rate_threshold)) &
+                    ((sources >= self.min_sources) | (entropy >= self.entropy_threshold)))
+
+        victims = []
+        for index in np.flatnonzero(attacked):
+            dst_ip = self._slot_ips[slots[index]]
+            self.victims[dst_ip] = now + self.hold_time
+            self.detections += 1
+            victim = {
+                'dst_ip': dst_ip,
+                'packet_rate': float(packet_rate[index]),
+                'syn_rate': float(syn_rate[index]),
+                'sources': int(round(sources[index])),
+                'entropy': round(float(entropy[index]), 3)
+            }
+            victims.append(victim)
+            logger.warning(f"Distributed attack on {dst_ip}: {victim['packet_rate']:.0f} pps, "
+                           f"{victim['syn_rate']:.0f} SYN/s from ~{victim['sources']} sources "
+                           f"(entropy {victim['entropy']})")
+        return victims
+
+    def destination_stats(self, dst_ip):
+        """Window statistics of one destination, or None if not tracked"""
+        slot = self._slots.get(dst_ip)
+        if slot is None:
+            return None
+        packet_rate, syn_rate, sources, entropy = self._window_stats(np.array([slot]))
+        return {
+            'dst_ip': dst_ip,
+            'packet_rate': float(packet_rate[0]),
+            'syn_rate': float(syn_rate[0]),
+            'sources': int(round(sources[0])),
+            'entropy': round(float(entropy[0]), 3)
+        }
+
+    def active_victims(self, now=None):
+        """Destinations still within their mitigation hold"""
+        now = time.monotonic() if now is None else now
+        for dst_ip in [ip for ip, until in self.victims.items() if until <= now]:
+            del self.victims[dst_ip]
+        return sorted(self.victims)
+
+    def memory_bytes(self):
+        return (self.packets.nbytes + self.syns.nbytes + self.sources.nbytes +
+                self.histogram.nbytes + self._last_seen.nbytes)
+
+    def get_statistics(self):
+        """Get tracking and detection statistics"""
+        return {
+            'destinations': len(self._slots),
+            'max_destinations': self.max_destinations,
+            'memory_bytes': self.memory_bytes(),
+            'batches': self.batches,
+            'packets': self.packets_seen,
+            'evictions': self.evictions,
+            'untracked': self.untracked,
+            'detections': self.detections,
+            'victims': self.active_victims()
+        }
@@ -0,0 +1,124 @@
+"""
+Compact per-packet flow feature record
+
+FlowFeatures replaces the per-packet feature dict produced by the
+controller. It uses __slots__ so each packet-in allocates one small
+fixed-layout object instead of a hash table, and converts to the ML
+feature vector without intermediate lists.
+"""
+
+import numpy as np
+
+# Order of the feature vector consumed by the ML model
+ML_FEATURE_NAMES = (
+    'packet_count', 'byte_count', 'duration',
+    'packets_per_second', 'bytes_per_packet',
+    'protocol', 'src_port', 'dst_port', 'tcp_flags'
+)
+
+
+class FlowFeatures:
+    """Features extracted from a single packet-in.
+
+    Fields (None when absent from the packet):
+        switch_id (int), in_port (int), timestamp (float),
+        eth_src (str), eth_dst (str), eth_type (int),
+        src_ip (str), dst_ip (str), protocol (int), protocol_name (str),
+        ttl (int), total_length (int),
+        src_port (int), dst_port (int), tcp_flags (int),
+        packet_count (int), byte_count (int), duration (float),
+        payload (bytes-like, TCP payload of the frame)
+
+    Supports read-only mapping style access (get, [], in) so code written
+    against the old feature dicts keeps working.
+    """
+
+    __slots__ = (
+        'switch_id', 'in_port', 'timestamp',
+        'eth_src', 'eth_dst', 'eth_type',
+        'src_ip', 'dst_ip', 'protocol', 'protocol_name',
+        'ttl', 'total_length',
+        'src_port', 'dst_port', 'tcp_flags',
+        'packet_count', 'byte_count', 'duration', 'payload'
+    )
+
+    def __init__(self, switch_id=None, in_port=None, timestamp=None,
+                 eth_src=None, eth_dst=None, eth_type=None,
+                 src_ip=None, dst_ip=None, protocol=None, protocol_name=None,
+                 ttl=None, total_length=None,
+                 src_port=None, dst_port=None, tcp_flags=None,
+                 packet_count=None, byte_count=None, duration=None, payload=None):
+        self.switch_id = switch_id
+        self.in_port = in_port
+        self.timestamp = timestamp
+        self.eth_src = eth_src
+        self.eth_dst = eth_dst
+        self.eth_type = eth_type
+        self.src_ip = src_ip
+        self.dst_ip = dst_ip
+        self.protocol = protocol
+        self.protocol_name = protocol_name
+        self.ttl = ttl
+        self.total_length = total_length
+        self.src_port = src_port
+        self.dst_port = dst_port
+        self.tcp_flags = tcp_flags
+        self.packet_count = packet_count
+        self.byte_count = byte_count
+        self.duration = duration
+        self.payload = payload
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a legacy feature dict"""
+        return cls(**{k: v for k, v in data.items() if k in cls.__slots__})
+
+    @classmethod
+    def coerce(cls, features):
+        """Return features as a FlowFeatures, converting dicts"""
+        if isinstance(features, cls):
+            return features
+        return cls.from_dict(features)
+
+    def to_dict(self):
+        """Return the populated fields as a dict"""
+        return {name: getattr(self, name) for name in self.__slots__
+                if getattr(self, name) is not None}
+
+    def get(self, key, default=None):
+        """Dict-style field access; unset fields return default"""
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None
+
+    def to_row(self):
+        """Return the ML feature vector (ML_FEATURE_NAMES order)"""
+        packet_count = self.packet_count or 0
+        byte_count = self.byte_count or 0
+        duration = self.duration
+
+        # Derived rates use the same guards as the original extractor
+        divisor = 1 if duration is None else max(duration, 0.001)
+
+        return np.array((
+            packet_count,
+            byte_count,
+            duration or 0,
+            packet_count / divisor,
+            byte_count / max(packet_count, 1),
+            self.protocol or 0,
+            self.src_port or 0,
+            self.dst_port or 0,
+            self.tcp_flags or 0
+        ), dtype=np.float64)
+
+    def __repr__(self):
+        return f"FlowFeatures({self.to_dict()!r})"
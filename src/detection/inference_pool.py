@@ -0,0 +1,344 @@
+"""
+Out-of-process ML inference
+
+MLDetector.predict_batch runs on the calling thread. Under Ryu that thread
+is a green thread on the one OS thread serving every switch, so a large
+batch stalls all OpenFlow processing for as long as the model runs, and
+holds the GIL either way. InferencePool moves the model into worker
+processes and returns verdicts asynchronously.
+
+Batches are not pickled. The pool allocates one shared-memory block with
+`slots` fixed-size regions, each holding up to max_batch feature rows and
+their results. submit() copies a feature matrix into a free slot and
+queues only (request id, slot, rows, model file, model version) to the
+least busy worker. The worker classifies the rows in place and reports
+back, and a collector thread calls the submitter's callback with
+predict_batch's result. When every slot is busy the batch is refused and
+counted, and the caller keeps its heuristic verdict, so a slow model
+bounds memory instead of building a backlog.
+
+Workers are spawned, not forked, since forking a process running green
+threads duplicates the hub's state. They load the detector's model bundle
+from its file. A compiled forest is memory-mapped, so every worker shares
+the same page-cache copy of the model. A model change is sent to every
+worker as it happens, and a bundle that was never saved has no file for
+workers to load, so the pool reports itself unavailable and callers
+classify in-process. A worker that dies fails its pending batches and is
+replaced.
+"""
+
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+from ..utils.logger import setup_logger
+
+logger = setup_logger('inference_pool')
+
+
+def _slot_arrays(buffer, slots, max_batch, n_features):
+    """(features, prediction, confidence) arrays laid over the shared block"""
+    features = np.ndarray((slots, max_batch, n_features), dtype=np.float64, buffer=buffer)
+    prediction = np.ndarray((slots, max_batch), dtype=np.int64, buffer=buffer,
+                            offset=features.nbytes)
+    confidence = np.ndarray((slots, max_batch), dtype=np.float64, buffer=buffer,
+                            offset=features.nbytes + prediction.nbytes)
+    return features, prediction, confidence
+
+
+def _block_size(slots, max_batch, n_features):
+    return slots * max_batch * (n_features + 2) * 8
+
+
+def _worker_main(index, shm_name, slots, max_batch, n_features, tasks, results):
+    """Worker process: classify the slots named by tasks until told to stop"""
+    from .model_bundle import ModelBundle
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    features, prediction, confidence = _slot_arrays(shm.buf, slots, max_batch, n_features)
+    bundle = None
+    loaded = None  # (path, version) of bundle
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            kind, request_id, slot, rows, path, version = task
+            start = time.perf_counter()
+            try:
+                if loaded != (path, version):
+                    bundle = None
+                    candidate = ModelBundle.load(path)
+                    candidate.compile()
+                    if candidate.version != version:
+                        raise ValueError(f"{path} holds version {candidate.version}, "
+                                         f"not {version}")
+                    bundle, loaded = candidate, (path, version)
+                if kind == 'classify':
+                    labels, probability = bundle.classify(features[slot, :rows])
+                    prediction[slot, :rows] = labels
+                    confidence[slot, :rows] = probability
+                error = None
+            except Exception as e:
+                loaded = None
+                error = f"{type(e).__name__}: {e}"
+            if kind == 'classify':
+                results.put((index, request_id, error, (time.perf_counter() - start) * 1000))
+            elif error:
+                results.put((index, None, error, 0.0))
+    finally:
+        del features, prediction, confidence
+        shm.close()
+
+
+class InferencePool:
+    """Classifies feature batches in worker processes, delivering verdicts by callback"""
+
+    def __init__(self, ml_detector, workers=2, max_batch=256, slots=None, poll_interval=0.002):
+        self.ml_detector = ml_detector
+        self.workers = workers
+        self.max_batch = max_batch
+        self.slots = slots or 4 * workers
+        self.poll_interval = poll_interval
+        self.n_features = len(ml_detector.feature_names)
+
+        self._context = multiprocessing.get_context('spawn')
+        self._shm = None
+        self._features = self._prediction = self._confidence = None
+        self._processes = []   # per worker
+        self._tasks = []       # per worker task queue
+        self._results = None
+        self._free = []        # free slot indices
+        self._pending = {}     # {request id: (worker, slot, rows, bundle, callback, submitted)}
+        self._next_request = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.running = False
+
+        # Statistics
+        self.submitted = 0
+        self.submitted_rows = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.worker_restarts = 0
+        self.max_pending = 0
+        self.last_error = None
+        self._latencies = deque(maxlen=1024)   # submit to callback, ms
+        self._inference = deque(maxlen=1024)   # in the worker, ms
+
+    def start(self):
+        """Spawn the workers and the result collector"""
+        if self.running:
+            return
+        size = _block_size(self.slots, self.max_batch, self.n_features)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._features, self._prediction, self._confidence = _slot_arrays(
+            self._shm.buf, self.slots, self.max_batch, self.n_features)
+        self._free = list(range(self.slots))
+        self._results = self._context.Queue()
+        self._tasks = [None] * self.workers
+        self._processes = [None] * self.workers
+        for index in range(self.workers):
+            self._spawn(index)
+
+        self.running = True
+        self.ml_detector.add_model_listener(self._preload)
+        self._preload()
+        self._thread = threading.Thread(target=self._collect_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"Inference pool started: {self.workers} workers, {self.slots} slots "
+                    f"of {self.max_batch} rows ({size // 1024} KB shared)")
+
+    def _spawn(self, index):
+        self._tasks[index] = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main, name=f'inference-{index}', daemon=True,
+            args=(index, self._shm.name, self.slots, self.max_batch, self.n_features,
+                  self._tasks[index], self._results))
+        process.start()
+        self._processes[index] = process
+
+    def stop(self):
+        """Stop the workers and release the shared memory; pending batches are dropped"""
+        if not self.running:
+            return
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=5)
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        with self._lock:
+            self._pending.clear()
+            self._free = []
+        self._features = self._prediction = self._confidence = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        logger.info("Inference pool stopped")
+
+    def _model(self):
+        """(bundle, path, version) workers can load, or None"""
+        bundle = self.ml_detector.bundle
+        if bundle is None or bundle.path is None:
+            return None
+        return bundle, str(bundle.path), bundle.version
+
+    def available(self):
+        """True if submit() can take batches for the current model"""
+        return self.running and self._model() is not None
+
+    def _preload(self):
+        """Have every worker load the current model before batches need it"""
+        model = self._model()
+        if not self.running or model is None:
+            return
+        _bundle, path, version = model
+        for tasks in self._tasks:
+            tasks.put(('load', None, None, 0, path, version))
+
+    def submit(self, features_matrix, callback):
+        """Classify up to max_batch rows in a worker; False if not accepted.
+
+        callback(result) is called from the collector thread with
+        predict_batch's result for the rows.
+        """
+        model = self._model()
+        rows = len(features_matrix)
+        if not self.running or model is None or not 0 < rows <= self.max_batch:
+            return False
+        bundle, path, version = model
+
+        with self._lock:
+            if not self._free:
+                self.rejected += 1
+                return False
+            slot = self._free.pop()
+            request_id = self._next_request
+            self._next_request += 1
+            load = [0] * self.workers
+            for worker, *_rest in self._pending.values():
+                load[worker] += 1
+            worker = min((i for i in range(self.workers) if self._processes[i].is_alive()),
+                         key=load.__getitem__, default=0)
+            self._features[slot, :rows] = features_matrix
+            self._pending[request_id] = (worker, slot, rows, bundle, callback,
+                                         time.perf_counter())
+            self.max_pending = max(self.max_pending, len(self._pending))
+            self.submitted += 1
+            self.submitted_rows += rows
+
+        self.ml_detector.last_batch = features_matrix
+        self._tasks[worker].put(('classify', request_id, slot, rows, path, version))
+        return True
+
+    def _collect_loop(self):
+        next_check = 0.0
+        while self.running:
+            try:
+                delivered = self.collect()
+                now = time.monotonic()
+                if now >= next_check:
+                    self._check_workers()
+                    next_check = now + 1.0
+            except Exception as e:
+                logger.error(f"Inference result collection failed: {e}")
+                delivered = 0
+            if not delivered:
+                time.sleep(self.poll_interval)
+
+    def collect(self):
+        """Deliver every finished batch to its callback; returns how many"""
+        delivered = 0
+        while True:
+            try:
+                worker, request_id, error, inference_ms = self._results.get_nowait()
+            except queue.Empty:
+                return delivered
+            if request_id is None:
+                self._fail(None, error)
+                continue
+            with self._lock:
+                pending = self._pending.pop(request_id, None)
+                if pending is None:
+                    continue  # failed when its worker died
+                _worker, slot, rows, bundle, callback, submitted = pending
+                prediction = self._prediction[slot, :rows].copy()
+                confidence = self._confidence[slot, :rows].copy()
+                self._free.append(slot)
+            if error:
+                self._fail(request_id, error)
+                continue
+
+            self.completed += 1
+            self._inference.append(inference_ms)
+            self._latencies.append((time.perf_counter() - submitted) * 1000)
+            delivered += 1
+            try:
+                callback(self.ml_detector.batch_result(bundle, prediction, confidence))
+            except Exception as e:
+                logger.error(f"Inference callback failed: {e}")
+
+    def _fail(self, request_id, error):
+        self.errors += 1
+        self.last_error = error
+        if request_id is None:
+            logger.error(f"Inference worker could not load the model: {error}")
+        else:
+            logger.error(f"Inference batch {request_id} failed: {error}")
+
+    def _check_workers(self):
+        """Replace dead workers, failing the batches they held"""
+        for index, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            with self._lock:
+                lost = [request_id for request_id, pending in self._pending.items()
+                        if pending[0] == index]
+                for request_id in lost:
+                    self._free.append(self._pending.pop(request_id)[1])
+            for request_id in lost:
+                self._fail(request_id, f"worker {index} exited ({process.exitcode})")
+            self.worker_restarts += 1
+            logger.error(f"Inference worker {index} exited ({process.exitcode}); restarting")
+            self._spawn(index)
+            self._preload()
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return {'avg': None, 'p50': None, 'p99': None}
+        values = np.fromiter(samples, dtype=np.float64)
+        return {'avg': round(float(values.mean()), 3),
+                'p50': round(float(np.percentile(values, 50)), 3),
+                'p99': round(float(np.percentile(values, 99)), 3)}
+
+    def get_statistics(self):
+        """Get queue depth, throughput and latency statistics"""
+        return {
+            'workers': self.workers,
+            'workers_alive': sum(1 for p in self._processes if p is not None and p.is_alive()),
+            'available': self.available(),
+            'slots': self.slots,
+            'max_batch': self.max_batch,
+            'pending': len(self._pending),
+            'max_pending': self.max_pending,
+            'submitted': self.submitted,
+            'submitted_rows': self.submitted_rows,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'worker_restarts': self.worker_restarts,
+            'last_error': self.last_error,
+            'latency_ms': self._summary(self._latencies),
+            'inference_ms': self._summary(self._inference)
+        }
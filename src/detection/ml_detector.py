@@ -1,58 +1,93 @@
 import numpy as np
-import joblib
 from pathlib import Path
 from ..utils.logger import setup_logger
 from ..utils.config import config
+from .flow_features import FlowFeatures, ML_FEATURE_NAMES
+from .model_bundle import ModelBundle, ATTACK_TYPES
 
 logger = setup_logger('ml_detector')
 
 class MLDetector:
     def __init__(self):
-        self.model = None
-        self.feature_names = [
-            'packet_count', 'byte_count', 'duration', 
-            'packets_per_second', 'bytes_per_packet',
-            'protocol', 'src_port', 'dst_port', 'tcp_flags'
-        ]
-        self.attack_types = [
-            'BENIGN', 'DOS', 'PROBE', 'R2L', 'U2R'
-        ]
+        self.bundle = None  # ModelBundle: model, feature schema and scaling
+        self.last_batch = None  # most recent feature matrix, to warm up new models
+        self.feature_names = list(ML_FEATURE_NAMES)
+        self.attack_types = list(ATTACK_TYPES)
+        self._model_listeners = []
         self._load_model()
     
+    @property
+    def model(self):
+        return None if self.bundle is None else self.bundle.model
+    
+    @model.setter
+    def model(self, model):
+        """Use a bare estimator that takes unscaled features"""
+        self.bundle = None if model is None else ModelBundle(model)
+    
+    @property
+    def forest(self):
+        """CompiledForest of the model with its scaling folded in, or None"""
+        return None if self.bundle is None else self.bundle.compile()
+    
+    def use_bundle(self, bundle):
+        """Switch to a loaded or trained model bundle"""
+        self.bundle = bundle
+        self.attack_types = list(bundle.attack_types)
+        forest = bundle.compile()
+        if forest is not None:
+            logger.info(f"ML model compiled: {forest.n_trees} trees, {forest.n_nodes} nodes"
+                        f"{', scaling folded in' if bundle.scaled else ''}"
+                        f"{', memory-mapped' if forest.memory_mapped else ''}")
+        self._notify_model_change()
+    
+    def add_model_listener(self, callback):
+        """Call callback() whenever a different model is loaded or trained"""
+        self._model_listeners.append(callback)
+    
+    def _notify_model_change(self):
+        """Tell listeners that predictions may have changed"""
+        for callback in self._model_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Model change listener failed: {e}")
+    
     def _load_model(self):
         """Load pre-trained ML model"""
         model_path = Path(config.get('detection.model_path', 'models/traffic_classifier.pkl'))
         
         if model_path.exists():
             try:
-                self.model = joblib.load(model_path)
-                logger.info(f"ML model loaded: {model_path}")
+                bundle = ModelBundle.load(model_path)
+                logger.info(f"ML model loaded: {model_path} (version {bundle.version})")
+                self.use_bundle(bundle)
             except Exception as e:
                 logger.error(f"Failed to load ML model: {e}")
-                self.model = None
+                self.bundle = None
         else:
             logger.warning(f"ML model not found: {model_path}")
             logger.info("ML-based detection disabled")
     
     def is_loaded(self):
         """Check if model is loaded"""
-        return self.model is not None
+        return self.bundle is not None
     
     def predict(self, flow_features):
         """Predict if flow is malicious"""
-        if not self.is_loaded():
+        # One read, so a model swapped in mid-call is not mixed with the old one
+        bundle = self.bundle
+        if bundle is None:
             return {'is_malicious': False, 'confidence': 0.0}
         
         try:
-            # Extract and normalize features
+            # One predict_proba call gives both the class and its confidence
             feature_vector = self._extract_features(flow_features)
-            
-            # Make prediction
-            prediction = self.model.predict([feature_vector])[0]
-            probabilities = self.model.predict_proba([feature_vector])[0]
-            
-            attack_type = self.attack_types[prediction]
-            confidence = probabilities[prediction]
+            probabilities = bundle.predict_proba(feature_vector.reshape(1, -1))[0]
+            labels = bundle.class_labels()
+            index = int(np.argmax(probabilities))
+            attack_type = bundle.attack_types[labels[index]]
+            confidence = probabilities[index]
             
             threshold = config.get('detection.threshold', 0.7)
             
@@ -61,37 +96,59 @@ class MLDetector:
                 'attack_type': attack_type,
                 'confidence': float(confidence),
                 'probabilities': {
-                    self.attack_types[i]: float(probabilities[i]) 
-                    for i in range(len(self.attack_types))
+                    bundle.attack_types[label]: float(probabilities[i])
+                    for i, label in enumerate(labels)
                 }
             }
         except Exception as e:
             logger.error(f"ML prediction failed: {e}")
             return {'is_malicious': False, 'confidence': 0.0}
     
-    def _extract_features(self, flow_features):
-        """Extract and normalize features for ML model"""
-        features = []
+    def predict_batch(self, features_matrix):
+        """Classify an N x len(feature_names) matrix in one model call.
         
-        # Extract numerical features
-        features.append(flow_features.get('packet_count', 0))
-        features.append(flow_features.get('byte_count', 0))
-        features.append(flow_features.get('duration', 0))
+        Returns a dict of length-N arrays: 'is_malicious' (bool),
+        'prediction' (index into attack_types) and 'confidence' (float),
+        or None if no model is loaded or inference failed.
+        """
+        bundle = self.bundle
+        if bundle is None:
+            return None
         
-        # Calculate derived features
-        duration = max(flow_features.get('duration', 1), 0.001)
-        packet_count = max(flow_features.get('packet_count', 1), 1)
-        
-        features.append(flow_features.get('packet_count', 0) / duration)  # pps
-        features.append(flow_features.get('byte_count', 0) / packet_count)  # bpp
-        
-        # Protocol features
-        features.append(flow_features.get('protocol', 0))
-        features.append(flow_features.get('src_port', 0))
-        features.append(flow_features.get('dst_port', 0))
-        features.append(flow_features.get('tcp_flags', 0))
-        
-        return np.array(features)
+        try:
+            features_matrix = np.asarray(features_matrix, dtype=np.float64)
+            if features_matrix.ndim == 1:
+                features_matrix = features_matrix.reshape(1, -1)
+            self.last_batch = features_matrix
+            prediction, confidence = bundle.classify(features_matrix)
+            return self.batch_result(bundle, prediction, confidence)
+        except Exception as e:
+            logger.error(f"ML batch prediction failed: {e}")
+            return None
+    
+    def batch_result(self, bundle, prediction, confidence):
+        """predict_batch's result for the classes and confidences bundle returned"""
+        threshold = config.get('detection.threshold', 0.7)
+        benign = bundle.attack_types.index('BENIGN')
+        return {
+            'is_malicious': (prediction != benign) & (confidence > threshold),
+            'prediction': prediction,
+            'confidence': confidence
+        }
+    
+    def feature_matrix(self, features_batch):
+        """Stack the feature vectors of several packets or flows"""
+        if not features_batch:
+            return np.empty((0, len(self.feature_names)))
+        return np.vstack([self._extract_features(f) for f in features_batch])
+    
+    def get_model_info(self):
+        """Version and schema of the loaded model, or None"""
+        return None if self.bundle is None else self.bundle.get_info()
+    
+    def _extract_features(self, flow_features):
+        """Extract and normalize features for ML model"""
+        return FlowFeatures.coerce(flow_features).to_row()
     
     def train_model(self, training_data, labels):
         """Train new model (for future use)"""
@@ -103,17 +160,18 @@ class MLDetector:
         X_scaled = scaler.fit_transform(training_data)
         
         # Train model
-        self.model = RandomForestClassifier(
+        model = RandomForestClassifier(
             n_estimators=100,
             max_depth=20,
             random_state=42,
             n_jobs=-1
         )
-        self.model.fit(X_scaled, labels)
+        model.fit(X_scaled, labels)
         
-        # Save model
+        # Save the model together with its scaler and feature schema
+        bundle = ModelBundle.from_training(model, scaler, self.feature_names, self.attack_types)
         model_path = Path(config.get('detection.model_path', 'models/traffic_classifier.pkl'))
-        model_path.parent.mkdir(parents=True, exist_ok=True)
-        joblib.dump(self.model, model_path)
+        bundle.save(model_path)
         
-        logger.info(f"Model trained and saved: {model_path}")
+        logger.info(f"Model trained and saved: {model_path} (version {bundle.version})")
+        self.use_bundle(bundle)
@@ -0,0 +1,252 @@
+"""
+Versioned ML model bundle
+
+A bundle keeps the feature schema, the StandardScaler parameters and the
+fitted classifier together in one file. The trainer writes it and
+MLDetector reads it, so the scaling the model was trained with cannot be
+lost or paired with the wrong model. A bundle whose feature schema differs
+from ML_FEATURE_NAMES is refused rather than fed misordered features.
+
+The scaling is folded into the compiled forest rather than applied per
+request. A split on a standardized feature, (x - mean) / scale <= t, is
+the split x <= t * scale + mean on the raw feature, so every threshold is
+mapped back once at compile time and raw feature vectors go straight to
+the trees. Models that cannot be compiled fall back to transform() and
+the model's own predict_proba.
+
+Bundles are joblib files of a plain dict (see to_dict()). A file holding
+a bare estimator, as written before bundles existed, still loads as an
+unscaled bundle.
+
+save() also writes the compiled forest, scaling folded in, next to the
+pickle as <name>.forest/ (see CompiledForest.save) with the bundle's
+metadata and the size and mtime of the pickle it was compiled from. When
+that directory matches the pickle, load() memory-maps it instead of
+unpickling: no scikit-learn import, no object graph to rebuild. The
+estimator itself is only unpickled if something asks for .model.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from ..utils.logger import setup_logger
+from .flow_features import ML_FEATURE_NAMES
+from .compiled_forest import CompiledForest
+
+logger = setup_logger('model_bundle')
+
+BUNDLE_FORMAT = 1
+ATTACK_TYPES = ('BENIGN', 'DOS', 'PROBE', 'R2L', 'U2R')
+
+
+def _joblib():
+    # joblib is only needed to read or write pickles, which mapped loads skip
+    import joblib
+    return joblib
+
+
+def forest_path(path):
+    """Directory holding the compiled forest of the bundle at path"""
+    return str(Path(path).with_suffix('.forest'))
+
+
+def new_version():
+    """Version label of a model trained now"""
+    return datetime.now().strftime('%Y%m%d-%H%M%S')
+
+
+class ModelBundle:
+    """A classifier with its feature schema and input scaling"""
+
+    def __init__(self, model, feature_names=ML_FEATURE_NAMES, attack_types=ATTACK_TYPES,
+                 scaler_mean=None, scaler_scale=None, version=None, created=None, metrics=None,
+                 forest=None, path=None):
+        self._model = model
+        self.path = path  # file to unpickle the model from if it was not loaded
+        self.feature_names = tuple(feature_names)
+        self.attack_types = tuple(attack_types)
+        self.scaler_mean = None if scaler_mean is None else np.asarray(scaler_mean, float)
+        self.scaler_scale = None if scaler_scale is None else np.asarray(scaler_scale, float)
+        self.version = version
+        self.created = created
+        self.metrics = metrics or {}
+        self._forest = forest  # already compiled, scaling folded in
+        self._compiled = forest is not None
+
+    @classmethod
+    def from_training(cls, model, scaler=None, feature_names=ML_FEATURE_NAMES,
+                      attack_types=ATTACK_TYPES, metrics=None):
+        """Bundle a freshly trained model with the fitted StandardScaler, if any"""
+        n_features = getattr(model, 'n_features_in_', len(feature_names))
+        if n_features != len(feature_names):
+            raise ValueError(f"Model has {n_features} features, schema {len(feature_names)}")
+        mean = scale = None
+        if scaler is not None:
+            n = len(feature_names)
+            mean = getattr(scaler, 'mean_', None)
+            scale = getattr(scaler, 'scale_', None)
+            mean = np.zeros(n) if mean is None else mean
+            scale = np.ones(n) if scale is None else scale
+        return cls(model, feature_names, attack_types, mean, scale, version=new_version(),
+                   created=time.time(), metrics=metrics)
+
+    @property
+    def model(self):
+        if self._model is None and self.path is not None:
+            saved = _joblib().load(self.path)
+            self._model = saved['model'] if isinstance(saved, dict) else saved
+        return self._model
+
+    @property
+    def scaled(self):
+        return self.scaler_mean is not None
+
+    def transform(self, features_matrix):
+        """Standardize raw feature rows as the model was trained"""
+        if not self.scaled:
+            return features_matrix
+        return (features_matrix - self.scaler_mean) / self.scaler_scale
+
+    def compile(self):
+        """CompiledForest of the model taking raw features, or None if not a forest"""
+        if not self._compiled:
+            self._compiled = True
+            try:
+                forest = CompiledForest.from_model(self.model)
+            except (AttributeError, TypeError, ValueError) as e:
+                logger.debug(f"Model not compiled, using its own predict_proba: {e}")
+                return None
+            if self.scaled:
+                forest = forest.fold_scaling(self.scaler_mean, self.scaler_scale)
+            self._forest = forest
+        return self._forest
+
+    def predict_proba(self, features_matrix):
+        """Class probabilities for raw feature rows"""
+        forest = self.compile()
+        if forest is None:
+            return self.model.predict_proba(self.transform(features_matrix))
+        return forest.predict_proba(features_matrix)
+
+    def classify(self, features_matrix):
+        """attack_types index and probability of each row's most likely class"""
+        probabilities = self.predict_proba(features_matrix)
+        best = probabilities.argmax(axis=1)
+        labels = np.asarray(self.class_labels(), dtype=np.int64)
+        return labels[best], probabilities[np.arange(len(best)), best]
+
+    def class_labels(self):
+        """attack_types index of each predict_proba column"""
+        if self._forest is not None:
+            classes = self._forest.classes
+        else:
+            classes = getattr(self.model, 'classes_', None)
+        if classes is None:
+            return range(len(self.attack_types))
+        return [int(c) for c in classes]
+
+    def metadata(self):
+        """Everything but the model, JSON-serializable"""
+        return {
+            'format': BUNDLE_FORMAT,
+            'version': self.version,
+            'created': self.created,
+            'feature_names': list(self.feature_names),
+            'attack_types': list(self.attack_types),
+            'scaler': None if not self.scaled else {
+                'mean': self.scaler_mean.tolist(), 'scale': self.scaler_scale.tolist()},
+            'metrics': self.metrics
+        }
+
+    def to_dict(self):
+        return dict(self.metadata(), model=self.model)
+
+    def save(self, path):
+        """Write the bundle atomically, then its compiled forest if it has one"""
+        path = str(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        _joblib().dump(self.to_dict(), tmp_path)
+        os.replace(tmp_path, path)
+        self.path = path
+
+        forest = self.compile()
+        if forest is not None:
+            stat = os.stat(path)
+            forest.save(forest_path(path), bundle=self.metadata(),
+                        source={'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a bundle (or a bare legacy estimator); ValueError on schema mismatch.
+
+        With mmap, a compiled forest saved with the bundle is memory-mapped
+        and the model itself is unpickled only when accessed.
+        """
+        path = str(path)
+        if mmap:
+            bundle = cls._load_compiled(path)
+            if bundle is not None:
+                return bundle
+
+        saved = _joblib().load(path)
+        if not isinstance(saved, dict):
+            logger.warning(f"{path} holds a bare model without schema or scaler; "
+                           "retrain to get a bundle")
+            return cls(saved, path=path)
+        return cls._from_metadata(saved, saved['model'], path=path)
+
+    @classmethod
+    def _from_metadata(cls, saved, model, **kwargs):
+        if saved.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported model bundle format {saved.get('format')}")
+        feature_names = tuple(saved['feature_names'])
+        if feature_names != ML_FEATURE_NAMES:
+            raise ValueError(f"Model expects features {feature_names}, "
+                             f"extractor produces {ML_FEATURE_NAMES}")
+        scaler = saved.get('scaler') or {}
+        return cls(model, feature_names, saved['attack_types'],
+                   scaler.get('mean'), scaler.get('scale'), version=saved.get('version'),
+                   created=saved.get('created'), metrics=saved.get('metrics'), **kwargs)
+
+    @classmethod
+    def _load_compiled(cls, path):
+        """Bundle around the memory-mapped forest saved with path, or None if stale"""
+        directory = forest_path(path)
+        try:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        source = meta.get('source') or {}
+        if (source.get('size'), source.get('mtime_ns')) != (stat.st_size, stat.st_mtime_ns):
+            logger.info(f"Compiled forest {directory} is stale, unpickling {path}")
+            return None
+        try:
+            forest = CompiledForest.load(directory)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Cannot map compiled forest {directory}, unpickling {path}: {e}")
+            return None
+        return cls._from_metadata(meta['bundle'], None, forest=forest, path=path)
+
+    def get_info(self):
+        """Version and schema summary"""
+        forest = self.compile()
+        try:
+            classes = [self.attack_types[label] for label in self.class_labels()]
+        except (TypeError, ValueError, IndexError):
+            classes = None  # not a fitted classifier
+        return {
+            'version': self.version,
+            'created': self.created,
+            'features': list(self.feature_names),
+            'classes': classes,
+            'scaled': self.scaled,
+            'compiled': forest is not None,
+            'memory_mapped': forest is not None and forest.memory_mapped,
+            'metrics': self.metrics
+        }
@@ -0,0 +1,241 @@
+"""
+Hot-reloadable ML models
+
+ModelRegistry watches the model directory for model bundles (*.pkl) and
+switches MLDetector to the newest one without a controller restart. A new
+or rewritten bundle is loaded, compiled and warmed up on a sample batch
+(the detector's most recent feature matrix, or zeros before any traffic)
+before it is used, so the first packets after a swap pay no compilation
+or cold-cache cost. A bundle that fails to load, has another feature
+schema or returns malformed probabilities during warm-up is rejected, and
+the active model stays in place.
+
+Unpickling and compiling a forest take from tens of milliseconds to
+seconds of CPU. Under Ryu all threads are green and would stall OpenFlow
+processing for that long, so that work runs in a native OS thread while
+the calling (green) thread waits with sleeps that yield to the hub. The
+swap itself is a single reference assignment in MLDetector, which
+predictions read once per call.
+
+The previous bundle is kept in memory for an instant rollback(). The
+version rolled back from is not reloaded until its file changes again.
+"""
+
+import glob
+import os
+import sys
+import threading
+import time
+import numpy as np
+from ..utils.logger import setup_logger
+from .model_bundle import ModelBundle
+
+logger = setup_logger('model_registry')
+
+
+def _native_thread_class():
+    """threading.Thread as it was before eventlet monkey patching, if it was"""
+    if 'eventlet' not in sys.modules:
+        return threading.Thread  # nothing is green; don't pay for importing eventlet
+    from eventlet import patcher
+    return patcher.original('threading').Thread
+
+
+def _run_native(function, *args):
+    """Run function in a native thread; waits without blocking green threads"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = function(*args)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = _native_thread_class()(target=target, daemon=True)
+    thread.start()
+    while thread.is_alive():
+        time.sleep(0.01)
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+class ModelRegistry:
+    """Watches the model directory and hot-swaps MLDetector's model"""
+
+    def __init__(self, ml_detector, model_dir='models', model_path=None,
+                 poll_interval=10, warmup_rows=256):
+        self.ml_detector = ml_detector
+        self.model_dir = model_dir
+        self.poll_interval = poll_interval
+        self.warmup_rows = warmup_rows
+
+        self.active = None    # {'version', 'path', 'mtime', 'loaded_at', 'load_ms', 'warmup_ms'}
+        self.previous = None  # (bundle, info) to roll back to
+        self._rejected = set()  # (path, mtime) not to load again
+        self._load_lock = threading.Lock()
+        self._thread = None
+        self.running = False
+
+        # Statistics
+        self.loads = 0
+        self.load_failures = 0
+        self.rollbacks = 0
+        self.last_error = None
+
+        if model_path and ml_detector.is_loaded():
+            # The detector loaded it at startup
+            self.active = {
+                'version': ml_detector.bundle.version,
+                'path': os.path.normpath(model_path),
+                'mtime': self._mtime(model_path),
+                'loaded_at': time.time(),
+                'load_ms': None,
+                'warmup_ms': None
+            }
+
+    def start(self):
+        """Watch the model directory in the background"""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._watch_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching the model directory"""
+        self.running = False
+
+    def _watch_loop(self):
+        while self.running:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Model directory check failed: {e}")
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _candidate(self):
+        """(path, mtime) of the newest bundle not active or rejected, or None"""
+        newest = None
+        for path in glob.glob(os.path.join(self.model_dir, '*.pkl')):
+            path = os.path.normpath(path)
+            mtime = self._mtime(path)
+            if mtime is not None and (newest is None or mtime > newest[1]):
+                newest = (path, mtime)
+        if newest is None or newest in self._rejected:
+            return None
+        if self.active and (self.active['path'], self.active['mtime']) == newest:
+            return None
+        return newest
+
+    def check(self):
+        """Load the newest bundle if it changed; True if a new model was swapped in"""
+        candidate = self._candidate()
+        if candidate is None:
+            return False
+        return self.load(*candidate)
+
+    def reload(self):
+        """Check for a new bundle in the background; returns the thread"""
+        thread = threading.Thread(target=self.check, daemon=True)
+        thread.start()
+        return thread
+
+    def _warmup_batch(self):
+        batch = self.ml_detector.last_batch
+        if batch is None or not len(batch):
+            return np.zeros((self.warmup_rows, len(self.ml_detector.feature_names)))
+        return batch[:self.warmup_rows]
+
+    def _prepare(self, path, sample):
+        """Load, compile and warm up a bundle; returns (bundle, load_ms, warmup_ms)"""
+        start = time.perf_counter()
+        bundle = ModelBundle.load(path)
+        bundle.compile()
+        loaded = time.perf_counter()
+
+        probabilities = np.asarray(bundle.predict_proba(sample))
+        classes = len(bundle.class_labels())
+        if probabilities.shape != (len(sample), classes):
+            raise ValueError(f"Warm-up returned shape {probabilities.shape}, "
+                             f"expected {(len(sample), classes)}")
+        if not np.isfinite(probabilities).all():
+            raise ValueError("Warm-up returned non-finite probabilities")
+        return bundle, (loaded - start) * 1000, (time.perf_counter() - loaded) * 1000
+
+    def load(self, path, mtime=None):
+        """Prepare the bundle at path off the event loop and swap it in; False if rejected"""
+        path = os.path.normpath(path)
+        mtime = self._mtime(path) if mtime is None else mtime
+        with self._load_lock:
+            try:
+                bundle, load_ms, warmup_ms = _run_native(self._prepare, path,
+                                                         self._warmup_batch())
+            except Exception as e:
+                self._rejected.add((path, mtime))
+                self.load_failures += 1
+                self.last_error = f"{os.path.basename(path)}: {e}"
+                logger.error(f"Rejected ML model {path}: {e}")
+                return False
+
+            info = {
+                'version': bundle.version,
+                'path': path,
+                'mtime': mtime,
+                'loaded_at': time.time(),
+                'load_ms': round(load_ms, 1),
+                'warmup_ms': round(warmup_ms, 1)
+            }
+            if self.ml_detector.is_loaded():
+                self.previous = (self.ml_detector.bundle, self.active)
+            self.ml_detector.use_bundle(bundle)
+            self.active = info
+            self.loads += 1
+
+        logger.info(f"ML model {bundle.version} from {path} swapped in "
+                    f"(load {load_ms:.0f}ms, warm-up {warmup_ms:.0f}ms)")
+        return True
+
+    def rollback(self):
+        """Swap the previous model back in; False if there is none"""
+        with self._load_lock:
+            if self.previous is None:
+                return False
+            bundle, info = self.previous
+            current = self.active
+            self.previous = (self.ml_detector.bundle, current)
+            self.ml_detector.use_bundle(bundle)
+            self.active = info
+            self.rollbacks += 1
+            if current:
+                # Stay on the rolled-back-to model until the file is rewritten
+                self._rejected.add((current['path'], current['mtime']))
+
+        logger.warning(f"ML model rolled back from {current and current['version']} "
+                       f"to {info and info['version']}")
+        return True
+
+    @staticmethod
+    def _public(info):
+        if info is None:
+            return None
+        return {key: value for key, value in info.items() if key != 'mtime'}
+
+    def get_statistics(self):
+        """Get active and previous versions and load statistics"""
+        return {
+            'model_dir': self.model_dir,
+            'active': self._public(self.active),
+            'previous': self._public(self.previous[1]) if self.previous else None,
+            'loads': self.loads,
+            'load_failures': self.load_failures,
+            'rollbacks': self.rollbacks,
+            'last_error': self.last_error
+        }
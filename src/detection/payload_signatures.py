@@ -0,0 +1,182 @@
+"""
+Payload signature matching
+
+Signatures are literal byte strings loaded once from a signature file and
+compiled into an Aho-Corasick automaton, so a payload is scanned in a
+single pass however many signatures there are. The automaton is stored as
+a dense transition table: one 257-slot row per state whose first 256
+slots reference the next state's row, and whose last slot holds the
+signatures that end in that state. Case-insensitive signatures go in a
+second automaton that scans the lowercased payload.
+
+Signature file format, one per line:
+
+    THREAT_TYPE "content" [nocase]
+
+Content may use Suricata-style |hex| escapes ("|0d 0a|"); "#" starts a
+comment line.
+"""
+
+import re
+from collections import deque
+from ..utils.logger import setup_logger
+
+logger = setup_logger('payload_signatures')
+
+_LINE = re.compile(r'^(\S+)\s+"((?:[^"\\]|\\.)*)"\s*(.*)$')
+_HEX = re.compile(r'\|([0-9A-Fa-f ]*)\|')
+
+
+def parse_content(text):
+    """Signature content with |hex| escapes to bytes"""
+    parts = []
+    position = 0
+    for match in _HEX.finditer(text):
+        parts.append(text[position:match.start()].replace('\\"', '"').encode())
+        parts.append(bytes.fromhex(match.group(1)))
+        position = match.end()
+    parts.append(text[position:].replace('\\"', '"').encode())
+    return b''.join(parts)
+
+
+def load_signatures(path):
+    """Read (threat_type, content, nocase) tuples from a signature file"""
+    signatures = []
+    with open(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            match = _LINE.match(line)
+            content = parse_content(match.group(2)) if match else b''
+            if not content:
+                logger.warning(f"Skipping invalid signature at {path}:{number}")
+                continue
+            signatures.append((match.group(1), content, 'nocase' in match.group(3).split()))
+    return signatures
+
+
+class AhoCorasick:
+    """Multi-pattern byte matcher"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+
+        # Trie of goto edges; outputs collect pattern ids ending at a state
+        goto = [{}]
+        outputs = [set()]
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for byte in pattern:
+                next_state = goto[state].get(byte)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][byte] = next_state
+                    goto.append({})
+                    outputs.append(set())
+                state = next_state
+            outputs[state].add(pattern_id)
+
+        # Breadth-first failure links, folded into a dense transition table
+        rows = [[None] * 257 for _ in goto]
+        fail = [0] * len(goto)
+        root = rows[0]
+        for byte in range(256):
+            root[byte] = rows[goto[0].get(byte, 0)]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            row = rows[state]
+            fallback = rows[fail[state]]
+            outputs[state] |= outputs[fail[state]]
+            for byte in range(256):
+                next_state = goto[state].get(byte)
+                if next_state is None:
+                    row[byte] = fallback[byte]
+                else:
+                    if state:
+                        link = fail[state]
+                        while link and byte not in goto[link]:
+                            link = fail[link]
+                        fail[next_state] = goto[link].get(byte, 0)
+                    row[byte] = rows[next_state]
+                    queue.append(next_state)
+        for state, row in enumerate(rows):
+            row[256] = tuple(sorted(outputs[state]))
+
+        self._root = root
+        self.states = len(rows)
+
+    def scan(self, data):
+        """Ids of the patterns occurring in data"""
+        found = set()
+        row = self._root
+        for byte in data:
+            row = row[byte]
+            if row[256]:
+                found.update(row[256])
+        return found
+
+
+class PayloadSignatures:
+    """Signature file compiled into case-sensitive and nocase automata"""
+
+    def __init__(self, path=None, signatures=None, max_scan_bytes=1500):
+        self.path = path
+        self.max_scan_bytes = max_scan_bytes
+        self.signatures = list(signatures) if signatures is not None else load_signatures(path)
+
+        self._exact = [i for i, (_t, _c, nocase) in enumerate(self.signatures) if not nocase]
+        self._nocase = [i for i, (_t, _c, nocase) in enumerate(self.signatures) if nocase]
+        self._exact_matcher = (AhoCorasick(self.signatures[i][1] for i in self._exact)
+                               if self._exact else None)
+        self._nocase_matcher = (AhoCorasick(self.signatures[i][1].lower() for i in self._nocase)
+                                if self._nocase else None)
+
+        # Statistics
+        self.scans = 0
+        self.bytes_scanned = 0
+        self.matches = 0
+
+        logger.info(f"Loaded {len(self.signatures)} payload signatures "
+                    f"({self.states} automaton states)")
+
+    @property
+    def states(self):
+        return sum(m.states for m in (self._exact_matcher, self._nocase_matcher) if m)
+
+    def scan(self, payload):
+        """Indexes of the signatures found in payload"""
+        if not payload:
+            return set()
+        data = bytes(payload[:self.max_scan_bytes])
+        self.scans += 1
+        self.bytes_scanned += len(data)
+
+        found = set()
+        if self._exact_matcher:
+            found.update(self._exact[i] for i in self._exact_matcher.scan(data))
+        if self._nocase_matcher:
+            found.update(self._nocase[i] for i in self._nocase_matcher.scan(data.lower()))
+        if found:
+            self.matches += 1
+        return found
+
+    def match(self, payload):
+        """Threat types of the signatures found in payload, in file order"""
+        threats = []
+        for index in sorted(self.scan(payload)):
+            threat = self.signatures[index][0]
+            if threat not in threats:
+                threats.append(threat)
+        return tuple(threats)
+
+    def get_statistics(self):
+        """Get signature and scan statistics"""
+        return {
+            'signatures': len(self.signatures),
+            'states': self.states,
+            'scans': self.scans,
+            'bytes_scanned': self.bytes_scanned,
+            'matches': self.matches
+        }
@@ -0,0 +1,293 @@
+"""
+Fixed-memory sketches for per-source rate detection
+
+Drop-in replacements for the sliding-window counters when the number of
+sources is unbounded (wide scans, spoofed-source floods):
+
+- CountMinSketch counts events per key (SYNs per source).
+- DistinctSketch counts distinct items per key (destination ports per
+  source) with a Count-Min-shaped grid of HyperLogLog cells.
+- HeavyHitters (Space-Saving) names the keys with the largest counts.
+
+Both windowed sketches split the window into `generations` time slices
+and zero the oldest slice as time moves on, so an estimate covers the
+last window minus at most one slice. Memory is allocated up front and
+never grows.
+
+Error bounds (w = width, d = depth, m = 2**precision registers, N = events
+in the window):
+- CountMinSketch never underestimates within the window and overestimates
+  by at most e*N/w with probability 1 - exp(-d).
+- DistinctSketch has HyperLogLog's ~1.04/sqrt(m) relative standard error
+  (linear counting below 2.5*m) and overestimates when other sources
+  share a source's cell in every row.
+- HeavyHitters overestimates a count by at most the reported error, and
+  every key with more than N/k events is kept.
+"""
+
+import math
+import time
+import heapq
+import numpy as np
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(value):
+    """64-bit hash, stable for the life of the process"""
+    # Python hashes small ints to themselves and sequential tuples to
+    # nearby values, so finish with the MurmurHash3 fmix64 avalanche
+    h = hash(value) & _MASK64
+    h = ((h ^ (h >> 33)) * 0xff51afd7ed558ccd) & _MASK64
+    h = ((h ^ (h >> 33)) * 0xc4ceb9fe1a85ec53) & _MASK64
+    return h ^ (h >> 33)
+
+
+class _WindowedSketch:
+    """Rotates generation slices of a table along the time axis"""
+
+    def __init__(self, window, generations):
+        self.window = window
+        self.generations = generations
+        self.span = window / generations
+        self._generation = None
+
+    def _rotate(self, now):
+        """Zero slices that fell out of the window; True if any did"""
+        generation = int((time.monotonic() if now is None else now) / self.span)
+        if self._generation is None:
+            self._generation = generation
+            return False
+        if generation <= self._generation:
+            return False
+
+        for step in range(1, min(generation - self._generation, self.generations) + 1):
+            self._clear_slice((self._generation + step) % self.generations)
+        self._generation = generation
+        self._rebuild()
+        return True
+
+    def _current(self):
+        return self._generation % self.generations
+
+    def sweep(self, now=None):
+        """Advance the window; memory is fixed so nothing is evicted"""
+        self._rotate(now)
+        return 0
+
+
+class CountMinSketch(_WindowedSketch):
+    """Windowed Count-Min Sketch of event counts per key"""
+
+    def __init__(self, width=16384, depth=4, window=60.0, generations=4):
+        super().__init__(window, generations)
+        self.width = width
+        self.depth = depth
+        self._table = np.zeros((generations, depth, width), dtype=np.uint32)
+        self._totals = np.zeros((depth, width), dtype=np.int64)
+        self.events = 0
+
+    @classmethod
+    def with_memory(cls, memory_bytes, depth=4, window=60.0, generations=4):
+        """Widest sketch that fits in memory_bytes"""
+        per_column = depth * (generations * 4 + 8)
+        return cls(max(1, memory_bytes // per_column), depth, window, generations)
+
+    def _cells(self, key):
+        """Double-hashed column per row"""
+        h = _hash64(key)
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        return [(h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def _clear_slice(self, index):
+        self._table[index] = 0
+
+    def _rebuild(self):
+        self._totals = self._table.sum(axis=0, dtype=np.int64)
+
+    def add(self, key, amount=1, now=None):
+        """Count amount events for key; returns the window estimate"""
+        self._rotate(now)
+        table = self._table[self._current()]
+        totals = self._totals
+        estimate = None
+        for row, cell in enumerate(self._cells(key)):
+            table[row, cell] += amount
+            total = totals[row, cell] = totals[row, cell] + amount
+            if estimate is None or total < estimate:
+                estimate = total
+        self.events += amount
+        return int(estimate)
+
+    def count(self, key, now=None):
+        """Estimated events for key within the window"""
+        self._rotate(now)
+        totals = self._totals
+        return int(min(totals[row, cell] for row, cell in enumerate(self._cells(key))))
+
+    def memory_bytes(self):
+        return self._table.nbytes + self._totals.nbytes
+
+    def get_statistics(self):
+        """Get sketch dimensions and error bound"""
+        return {
+            'type': 'count_min',
+            'width': self.width,
+            'depth': self.depth,
+            'generations': self.generations,
+            'memory_bytes': self.memory_bytes(),
+            'error_fraction': math.e / self.width,
+            'confidence': 1 - math.exp(-self.depth)
+        }
+
+
+class DistinctSketch(_WindowedSketch):
+    """Windowed grid of HyperLogLog cells counting distinct items per key"""
+
+    def __init__(self, width=1024, depth=3, precision=6, window=60.0, generations=4):
+        super().__init__(window, generations)
+        self.width = width
+        self.depth = depth
+        self.precision = precision
+        self.registers = 1 << precision
+        self._table = np.zeros((generations, depth, width, self.registers), dtype=np.uint8)
+        self._merged = np.zeros((depth, width, self.registers), dtype=np.uint8)
+
+        # Per-cell sum of 2**-register and zero-register count over the
+        # merged registers, kept current so an estimate is O(depth)
+        self._inverse_sums = np.full((depth, width), float(self.registers))
+        self._zeros = np.full((depth, width), self.registers, dtype=np.int32)
+
+        m = self.registers
+        self._alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697}.get(m, 0.709)
+
+    @classmethod
+    def with_memory(cls, memory_bytes, depth=3, precision=6, window=60.0, generations=4):
+        """Widest sketch that fits in memory_bytes"""
+        per_column = depth * ((generations + 1) * (1 << precision) + 12)
+        return cls(max(1, memory_bytes // per_column), depth, precision, window, generations)
+
+    def _cells(self, key):
+        """Double-hashed column per row"""
+        h = _hash64(key)
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        return [(h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def _clear_slice(self, index):
+        self._table[index] = 0
+
+    def _rebuild(self):
+        self._merged = self._table.max(axis=0)
+        self._inverse_sums = np.ldexp(1.0, -self._merged.astype(np.int32)).sum(axis=2)
+        self._zeros = (self._merged == 0).sum(axis=2, dtype=np.int32)
+
+    def _estimate(self, row, cell):
+        m = self.registers
+        raw = self._alpha * m * m / self._inverse_sums[row, cell]
+        zeros = self._zeros[row, cell]
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return raw
+
+    def add(self, key, item, now=None):
+        """Record item for key; returns the estimated distinct count"""
+        self._rotate(now)
+        current = self._current()
+
+        # Hash the item alone: keys sharing a cell then count the union of
+        # their items (e.g. the one port of a spoofed flood) instead of
+        # every (key, item) pair
+        h = _hash64(item)
+        register = h & (self.registers - 1)
+        rest = h >> self.precision
+        rank = (64 - self.precision) - rest.bit_length() + 1
+
+        estimate = None
+        for row, cell in enumerate(self._cells(key)):
+            if rank > self._table[current, row, cell, register]:
+                self._table[current, row, cell, register] = rank
+            merged = int(self._merged[row, cell, register])
+            if rank > merged:
+                self._merged[row, cell, register] = rank
+                self._inverse_sums[row, cell] += 2.0 ** -rank - 2.0 ** -merged
+                if merged == 0:
+                    self._zeros[row, cell] -= 1
+            row_estimate = self._estimate(row, cell)
+            if estimate is None or row_estimate < estimate:
+                estimate = row_estimate
+        return int(round(estimate))
+
+    def count(self, key, now=None):
+        """Estimated distinct items for key within the window"""
+        self._rotate(now)
+        return int(round(min(self._estimate(row, cell)
+                             for row, cell in enumerate(self._cells(key)))))
+
+    def memory_bytes(self):
+        return (self._table.nbytes + self._merged.nbytes +
+                self._inverse_sums.nbytes + self._zeros.nbytes)
+
+    def get_statistics(self):
+        """Get sketch dimensions and error bound"""
+        return {
+            'type': 'hyperloglog_grid',
+            'width': self.width,
+            'depth': self.depth,
+            'registers': self.registers,
+            'generations': self.generations,
+            'memory_bytes': self.memory_bytes(),
+            'relative_std_error': 1.04 / math.sqrt(self.registers)
+        }
+
+
+class HeavyHitters:
+    """Space-Saving top-k counter"""
+
+    def __init__(self, k=100):
+        self.k = k
+        self._counts = {}  # {key: [count, error]}
+        self._heap = []  # lazy min-heap of (count, key)
+        self.total = 0
+
+    def offer(self, key, amount=1):
+        """Count key; returns its (over)estimated count"""
+        self.total += amount
+        entry = self._counts.get(key)
+        if entry is None:
+            if len(self._counts) < self.k:
+                entry = self._counts[key] = [0, 0]
+            else:
+                # Replace the smallest counter, inheriting its count as error
+                floor, victim = self._pop_min()
+                del self._counts[victim]
+                entry = self._counts[key] = [floor, floor]
+        entry[0] += amount
+        heapq.heappush(self._heap, (entry[0], key))
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(c, k) for k, (c, _e) in self._counts.items()]
+            heapq.heapify(self._heap)
+        return entry[0]
+
+    def _pop_min(self):
+        """Pop the current minimum, skipping stale heap entries"""
+        while True:
+            count, key = heapq.heappop(self._heap)
+            entry = self._counts.get(key)
+            if entry is not None and entry[0] == count:
+                return count, key
+
+    def top(self, n=10):
+        """The n largest (key, count, error) entries"""
+        ranked = sorted(self._counts.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, count, error) for key, (count, error) in ranked[:n]]
+
+    def decay(self):
+        """Halve every count so old offenders fade out"""
+        self._counts = {key: [count // 2, error // 2]
+                        for key, (count, error) in self._counts.items() if count // 2}
+        self._heap = [(c, k) for k, (c, _e) in self._counts.items()]
+        heapq.heapify(self._heap)
+        self.total //= 2
+
+    def __len__(self):
+        return len(self._counts)
@@ -0,0 +1,158 @@
+"""
+Sliding-window counters
+
+Per-key counts over a trailing time window, kept as a ring of fixed-width
+time buckets. Updates touch one bucket (plus any buckets the clock has
+moved past since the key was last updated, at most one full ring), so
+they are O(1) amortized, and a window total is kept alongside the ring.
+Keys are ordered by last update, which lets sweep() evict idle keys
+without scanning the active ones.
+"""
+
+import time
+from collections import OrderedDict
+
+# Per-key state layout: [bucket number, window total, ring, items]
+_BUCKET, _TOTAL, _RING, _ITEMS = 0, 1, 2, 3
+
+
+class SlidingWindowCounter:
+    """Event counts per key over the trailing window"""
+
+    def __init__(self, window=60.0, buckets=12):
+        self.window = window
+        self.buckets = buckets
+        self.bucket_width = window / buckets
+        self._keys = OrderedDict()  # {key: state}
+        self.evicted = 0
+
+    def _bucket_of(self, now):
+        return int((time.monotonic() if now is None else now) / self.bucket_width)
+
+    def _new_state(self, bucket):
+        return [bucket, 0, [0] * self.buckets]
+
+    def _advance(self, state, bucket):
+        """Zero the buckets that slid out of the window since the last update"""
+        last = state[_BUCKET]
+        if bucket <= last:
+            return
+        ring = state[_RING]
+        for step in range(1, min(bucket - last, self.buckets) + 1):
+            slot = (last + step) % self.buckets
+            state[_TOTAL] -= ring[slot]
+            ring[slot] = 0
+        state[_BUCKET] = bucket
+
+    def _touch(self, key, now):
+        """Return the key's state advanced to now, marking it recently used"""
+        bucket = self._bucket_of(now)
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = self._new_state(bucket)
+        else:
+            self._advance(state, bucket)
+            self._keys.move_to_end(key)
+        return state
+
+    def add(self, key, amount=1, now=None):
+        """Count amount events for key; returns the window total"""
+        state = self._touch(key, now)
+        state[_RING][state[_BUCKET] % self.buckets] += amount
+        state[_TOTAL] += amount
+        return state[_TOTAL]
+
+    def count(self, key, now=None):
+        """Events for key within the window (reading does not keep a key alive)"""
+        state = self._keys.get(key)
+        if state is None:
+            return 0
+
+        bucket = self._bucket_of(now)
+        last = state[_BUCKET]
+        if bucket <= last:
+            return state[_TOTAL]
+        if bucket - last >= self.buckets:
+            return 0
+        ring = state[_RING]
+        expired = sum(ring[(last + step) % self.buckets] for step in range(1, bucket - last + 1))
+        return state[_TOTAL] - expired
+
+    def rate(self, key, now=None):
+        """Events per second for key over the window"""
+        return self.count(key, now) / self.window
+
+    def sweep(self, now=None):
+        """Evict keys with no updates inside the window; returns how many"""
+        oldest = self._bucket_of(now) - self.buckets
+        evicted = 0
+        while self._keys:
+            key, state = next(iter(self._keys.items()))
+            if state[_BUCKET] > oldest:
+                break
+            del self._keys[key]
+            evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get_statistics(self):
+        """Get key counts"""
+        return {
+            'keys': len(self._keys),
+            'evicted': self.evicted,
+            'window': self.window,
+            'buckets': self.buckets
+        }
+
+
+class SlidingWindowDistinct(SlidingWindowCounter):
+    """Distinct items per key over the trailing window.
+
+    Each item is counted once, in the bucket it was last seen in. At most
+    max_items items are remembered per key; beyond that the count
+    saturates, which is enough for threshold detectors as long as
+    max_items exceeds the threshold.
+    """
+
+    def __init__(self, window=60.0, buckets=12, max_items=1024):
+        super().__init__(window, buckets)
+        self.max_items = max_items
+
+    def _new_state(self, bucket):
+        return [bucket, 0, [0] * self.buckets, {}]
+
+    def add(self, key, item, now=None):
+        """Record item for key; returns the distinct count in the window"""
+        state = self._touch(key, now)
+        bucket = state[_BUCKET]
+        ring = state[_RING]
+        items = state[_ITEMS]
+
+        seen = items.get(item)
+        if seen is not None and seen > bucket - self.buckets:
+            if seen == bucket:
+                return state[_TOTAL]
+            # Move the item to the current bucket
+            ring[seen % self.buckets] -= 1
+            state[_TOTAL] -= 1
+        elif seen is None and len(items) >= self.max_items:
+            self._prune(items, bucket)
+            if len(items) >= self.max_items:
+                return state[_TOTAL]
+
+        items[item] = bucket
+        ring[bucket % self.buckets] += 1
+        state[_TOTAL] += 1
+        return state[_TOTAL]
+
+    def _prune(self, items, bucket):
+        """Forget items last seen outside the window"""
+        oldest = bucket - self.buckets
+        for item in [i for i, seen in items.items() if seen <= oldest]:
+            del items[item]
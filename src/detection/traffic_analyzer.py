@@ -2,13 +2,14 @@ import numpy as np
 from collections import defaultdict
 from datetime import datetime, timedelta
 from ..utils.logger import setup_logger
+from .baselines import EWMABaseline
 
 logger = setup_logger('traffic_analyzer')
 
 class TrafficAnalyzer:
     def __init__(self):
         self.flow_cache = defaultdict(dict)  # {(src_ip, dst_ip): flow_data}
-        self.baseline_stats = {}
+        self.baseline_stats = EWMABaseline()  # per source host
         
     def analyze_flow(self, flow_features):
         """Analyze flow for anomalies"""
@@ -20,12 +21,16 @@ class TrafficAnalyzer:
         
         # Update flow statistics
         self._update_flow_stats(flow_key, flow_features)
+        host_anomalies = self.baseline_stats.update(
+            flow_features.get('src_ip'), flow_features.get('dst_ip'),
+            flow_features.get('total_length') or 0)
         
         # Detect anomalies
         anomalies = []
         
-        # Check packet rate
-        if self._detect_packet_rate_anomaly(flow_key):
+        # Check packet rate against the host's baseline, or a fixed
+        # ceiling until one is learned
+        if 'packet_rate' in host_anomalies or self._detect_packet_rate_anomaly(flow_key):
             anomalies.append('HIGH_PACKET_RATE')
         
         # Check payload size
@@ -67,6 +72,8 @@ class TrafficAnalyzer:
         """Detect abnormal packet rate"""
         if flow_key not in self.flow_cache:
             return False
+        if self.baseline_stats.is_learned(flow_key[0]):
+            return False
         
         flow = self.flow_cache[flow_key]
         duration = (flow['last_seen'] - flow['first_seen']).total_seconds()
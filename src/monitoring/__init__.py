@@ -8,10 +8,14 @@ Handles:
 - Statistics aggregation
 """
 
-from .metrics_collector import MetricsCollector
-from .performance_monitor import PerformanceMonitor
+from ..utils.lazy_import import lazy_exports
 
-__all__ = [
-    'MetricsCollector',
-    'PerformanceMonitor'
-]
+# Imported on first access; see src/utils/lazy_import.py
+_EXPORTS = {
+    'MetricsCollector': '.metrics_collector',
+    'PerformanceMonitor': '.performance_monitor'
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
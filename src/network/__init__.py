@@ -8,13 +8,16 @@ Handles:
 - Host and switch management
 """
 
-from .topology import NetworkTopology, create_and_run_topology
-from .topology_manager import TopologyManager
-from .network_monitor import NetworkMonitor
+from ..utils.lazy_import import lazy_exports
 
-__all__ = [
-    'NetworkTopology',
-    'create_and_run_topology',
-    'TopologyManager',
-    'NetworkMonitor'
-]
+# Imported on first access; see src/utils/lazy_import.py
+_EXPORTS = {
+    'NetworkTopology': '.topology',
+    'create_and_run_topology': '.topology',
+    'TopologyManager': '.topology_manager',
+    'NetworkMonitor': '.network_monitor'
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
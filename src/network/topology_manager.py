@@ -1,14 +1,20 @@
 from collections import defaultdict
 from ..utils.logger import setup_logger
+import time
 
 logger = setup_logger('topology_manager')
 
 class TopologyManager:
-    def __init__(self):
+    def __init__(self, host_timeout=300.0):
         self.switches = {}  # {dpid: switch_info}
         self.hosts = {}  # {mac: host_info}
         self.links = []  # [(switch1, port1, switch2, port2)]
         self.mac_to_port = defaultdict(dict)  # {dpid: {mac: port}}
+        self.ip_to_macs = defaultdict(set)  # {ip: {mac}}
+        self.link_ports = set()  # {(dpid, port)} facing other switches
+        self.host_timeout = host_timeout  # seconds without packets before a host is forgotten
+        self._next_sweep = 0.0
+        self.hosts_expired = 0
         
     def add_switch(self, dpid):
         """Add switch to topology"""
@@ -41,16 +47,94 @@ class TopologyManager:
             logger.info(f"Host added: {mac} ({ip})")
     
     def add_link(self, src_dpid, src_port, dst_dpid, dst_port):
-        """Add link between switches"""
+        """Add link between switches (either direction of a known link is ignored)"""
         link = (src_dpid, src_port, dst_dpid, dst_port)
-        if link not in self.links:
+        if link not in self.links and (dst_dpid, dst_port, src_dpid, src_port) not in self.links:
             self.links.append(link)
+            self.link_ports.add((src_dpid, src_port))
+            self.link_ports.add((dst_dpid, dst_port))
             logger.info(f"Link added: {src_dpid}:{src_port} <-> {dst_dpid}:{dst_port}")
     
+    def remove_link(self, src_dpid, src_port, dst_dpid, dst_port):
+        """Remove link between switches, in either direction"""
+        for link in ((src_dpid, src_port, dst_dpid, dst_port),
+                     (dst_dpid, dst_port, src_dpid, src_port)):
+            if link in self.links:
+                self.links.remove(link)
+                logger.info(f"Link removed: {src_dpid}:{src_port} <-> {dst_dpid}:{dst_port}")
+        self.link_ports = {(dpid, port) for s_dpid, s_port, d_dpid, d_port in self.links
+                           for dpid, port in ((s_dpid, s_port), (d_dpid, d_port))}
+    
+    def has_links(self):
+        """True once link discovery has reported inter-switch links"""
+        return bool(self.link_ports)
+    
     def update_mac_port(self, dpid, mac, port):
         """Update MAC to port mapping"""
         self.mac_to_port[dpid][mac] = port
     
+    def learn_host(self, mac, ip, dpid, port):
+        """Record a host's attachment point from a packet-in it sent.
+        
+        Reports on known inter-switch ports are flood copies and never set
+        a location; a report on any other port is where the host attaches
+        now, so a host that moved is followed. Without link data every
+        port looks like an edge port and the first switch to report a MAC
+        is kept, which may be a transit switch.
+        """
+        self.mac_to_port[dpid][mac] = port
+        
+        now = time.time()
+        if now >= self._next_sweep:
+            self.expire_hosts(now)
+        
+        host = self.hosts.get(mac)
+        on_link = (dpid, port) in self.link_ports
+        if host is None:
+            self.add_host(mac, ip, None if on_link else dpid, None if on_link else port)
+            host = self.hosts[mac]
+            host['first_seen'] = now
+        elif not on_link and (self.has_links() or host['switch'] is None):
+            host['switch'] = dpid
+            host['port'] = port
+        
+        if ip:
+            if host['ip'] != ip:
+                # The MAC moved to a new address; it no longer locates the old one
+                self._unmap_ip(host['ip'], mac)
+                host['ip'] = ip
+            self.ip_to_macs[ip].add(mac)
+        host['last_seen'] = now
+    
+    def _unmap_ip(self, ip, mac):
+        macs = self.ip_to_macs.get(ip)
+        if macs is not None:
+            macs.discard(mac)
+            if not macs:
+                del self.ip_to_macs[ip]
+    
+    def expire_hosts(self, now=None):
+        """Forget hosts silent for host_timeout seconds; returns how many"""
+        now = time.time() if now is None else now
+        self._next_sweep = now + self.host_timeout / 4
+        cutoff = now - self.host_timeout
+        stale = [mac for mac, host in self.hosts.items()
+                 if host['last_seen'] is not None and host['last_seen'] < cutoff]
+        for mac in stale:
+            host = self.hosts.pop(mac)
+            self._unmap_ip(host['ip'], mac)
+            for ports in self.mac_to_port.values():
+                ports.pop(mac, None)
+        if stale:
+            self.hosts_expired += len(stale)
+            logger.info(f"Expired {len(stale)} idle hosts")
+        return len(stale)
+    
+    def locate_ip(self, ip):
+        """Return the edge switch dpids where hosts using ip attach"""
+        return {self.hosts[mac]['switch'] for mac in self.ip_to_macs.get(ip, ())
+                if self.hosts[mac]['switch'] is not None}
+    
     def get_topology_data(self):
         """Get topology data for visualization"""
         nodes = []
@@ -100,5 +184,6 @@ class TopologyManager:
             'switches': len(self.switches),
             'hosts': len(self.hosts),
             'links': len(self.links),
+            'hosts_expired': self.hosts_expired,
             'total_flows': sum(s.get('flows', 0) for s in self.switches.values())
         }
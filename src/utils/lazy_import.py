@@ -0,0 +1,30 @@
+"""
+Deferred imports for package __init__ modules
+
+Packages re-export their main classes for convenience, but importing them
+eagerly meant that importing any one module (say src.detection.flow_features)
+also imported the controller, Ryu, SQLAlchemy, Flask and scikit-learn
+through the package __init__ chain. lazy_exports() builds a module-level
+__getattr__ (PEP 562) that imports a re-exported name only when it is
+first accessed, so `from src.detection import MLDetector` still works but
+costs only what MLDetector itself needs.
+"""
+
+import importlib
+import sys
+
+
+def lazy_exports(package, exports):
+    """__getattr__ for package importing each name in exports on first use.
+
+    exports maps a public name to the module defining it, relative to
+    package (e.g. {'MLDetector': '.ml_detector'}).
+    """
+    def __getattr__(name):
+        module = exports.get(name)
+        if module is None:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(module, package), name)
+        setattr(sys.modules[package], name, value)  # later lookups skip __getattr__
+        return value
+    return __getattr__
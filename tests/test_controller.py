@@ -67,6 +67,707 @@ class TestSDNController(unittest.TestCase):
         self.assertIn('10.0.0.1', enforcer.blocked_ips)
         self.assertTrue(self.mock_datapath.send_msg.called)
 
+class TestFlowInstallCache(unittest.TestCase):
+    def setUp(self):
+        from ryu.ofproto import ofproto_v1_3_parser
+        
+        self.parser = ofproto_v1_3_parser
+        self.datapath = Mock()
+        self.datapath.id = 7
+        self.datapath.ofproto = ofproto_v1_3
+        self.datapath.ofproto_parser = ofproto_v1_3_parser
+    
+    def test_duplicate_install_suppressed(self):
+        """Test identical rules are only sent once until they expire"""
+        from src.controller.flow_manager import FlowManager
+        
+        manager = FlowManager()
+        match = self.parser.OFPMatch(eth_type=0x0800, ipv4_src='10.0.0.1')
+        
+        with patch('src.controller.flow_manager.time.monotonic', return_value=100.0):
+            first = manager.install_flow(self.datapath, 100, match, [], hard_timeout=60)
+            second = manager.install_flow(
+                self.datapath, 100,
+                self.parser.OFPMatch(ipv4_src='10.0.0.1', eth_type=0x0800), [],
+                hard_timeout=60)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(self.datapath.send_msg.call_count, 1)
+        self.assertEqual(manager.get_statistics()['flow_mods_avoided'], 1)
+        
+        with patch('src.controller.flow_manager.time.monotonic', return_value=161.0):
+            manager.install_flow(self.datapath, 100, match, [], hard_timeout=60)
+        
+        self.assertEqual(self.datapath.send_msg.call_count, 2)
+        self.assertEqual(manager.get_statistics()['cache_expired'], 1)
+    
+    def test_delete_invalidates_cache(self):
+        """Test deleting a flow forgets covered cached rules"""
+        from src.controller.flow_manager import FlowManager
+        
+        manager = FlowManager()
+        match = self.parser.OFPMatch(eth_type=0x0800, ipv4_src='10.0.0.1', ip_proto=6)
+        manager.install_flow(self.datapath, 100, match, [])
+        manager.delete_flow(self.datapath,
+                            self.parser.OFPMatch(eth_type=0x0800, ipv4_src='10.0.0.1'))
+        manager.install_flow(self.datapath, 100, match, [])
+        
+        # install, delete, reinstall
+        self.assertEqual(self.datapath.send_msg.call_count, 3)
+        self.assertEqual(manager.get_statistics()['cache_hits'], 0)
+
+class TestMultiTablePipeline(unittest.TestCase):
+    def setUp(self):
+        from ryu.ofproto import ofproto_v1_3_parser
+        from src.controller.flow_manager import FlowManager
+        
+        self.datapath = Mock()
+        self.datapath.id = 3
+        self.datapath.ofproto = ofproto_v1_3
+        self.datapath.ofproto_parser = ofproto_v1_3_parser
+        
+        self.manager = FlowManager()
+        self.manager.multi_table = True
+        self.manager.security_table = 0
+        self.manager.forwarding_table = 1
+    
+    def test_install_pipeline(self):
+        """Test security table misses continue to the forwarding table"""
+        self.manager.install_pipeline(self.datapath)
+        
+        security_miss, forwarding_miss = [c.args[0] for c in self.datapath.send_msg.call_args_list]
+        self.assertEqual(security_miss.table_id, 0)
+        self.assertEqual([type(i).__name__ for i in security_miss.instructions],
+                         ['OFPInstructionGotoTable'])
+        self.assertEqual(security_miss.instructions[0].table_id, 1)
+        self.assertEqual(forwarding_miss.table_id, 1)
+        self.assertEqual(forwarding_miss.instructions[0].actions[0].port,
+                         ofproto_v1_3.OFPP_CONTROLLER)
+    
+    def test_blocklist_changes_keep_l2_entries(self):
+        """Test drops go to the security table and unblocking leaves L2 rules"""
+        from src.controller.policy_enforcer import PolicyEnforcer
+        
+        parser = self.datapath.ofproto_parser
+        enforcer = PolicyEnforcer(self.manager)
+        
+        l2_match = parser.OFPMatch(in_port=1, eth_dst='00:00:00:00:00:02',
+                                   eth_src='00:00:00:00:00:01')
+        self.manager.install_flow(self.datapath, 1, l2_match,
+                                  [parser.OFPActionOutput(2)], table_id=1)
+        enforcer.block_ip(self.datapath, '10.0.0.1')
+        
+        drop = self.datapath.send_msg.call_args_list[-1].args[0]
+        self.assertEqual(drop.table_id, 0)
+        
+        enforcer.unblock_ip(self.datapath, '10.0.0.1')
+        delete = self.datapath.send_msg.call_args_list[-1].args[0]
+        self.assertEqual(delete.table_id, 0)
+        self.assertEqual(self.manager.get_statistics()['cached_rules'], 1)
+
+class TestCIDRAggregation(unittest.TestCase):
+    def test_adjacent_addresses_merge(self):
+        """Test covered and adjacent entries collapse into minimal prefixes"""
+        from src.controller.cidr_aggregator import CIDRAggregator
+        
+        aggregator = CIDRAggregator()
+        for host in range(256):
+            aggregator.add(f'10.0.0.{host}')
+        aggregator.add('10.0.1.7')
+        self.assertEqual(aggregator.prefixes(), ['10.0.0.0/24', '10.0.1.7/32'])
+        self.assertEqual(aggregator.get_statistics()['rules_saved'], 255)
+        
+        # Entries already covered by the aggregate change nothing
+        self.assertEqual(aggregator.add('10.0.0.0/25'), ([], []))
+        self.assertEqual(aggregator.remove('10.0.0.0/25'), ([], []))
+        self.assertTrue(aggregator.contains('10.0.0.77'))
+        
+        # Removing one address splits the /24 into the remaining prefixes
+        removed, added = aggregator.remove('10.0.0.5')
+        self.assertEqual(removed, [(0x0a000000, 24)])
+        self.assertEqual(len(added), 8)
+        self.assertIn('10.0.0.128/25', aggregator.prefixes())
+        self.assertIn('10.0.0.4/32', aggregator.prefixes())
+        self.assertFalse(aggregator.contains('10.0.0.5'))
+        self.assertEqual(aggregator.get_statistics()['rules'], 9)
+    
+    def test_enforcer_sends_incremental_changes(self):
+        """Test blocking a neighbour replaces two host rules with one prefix"""
+        from ryu.ofproto import ofproto_v1_3_parser
+        from src.controller.flow_manager import FlowManager
+        from src.controller.policy_enforcer import PolicyEnforcer
+        from src.detection.flow_features import FlowFeatures
+        
+        datapath = Mock()
+        datapath.id = 4
+        datapath.ofproto = ofproto_v1_3
+        datapath.ofproto_parser = ofproto_v1_3_parser
+        enforcer = PolicyEnforcer(FlowManager())
+        
+        enforcer.block_ip(datapath, '10.0.0.2')
+        enforcer.block_flow(datapath, FlowFeatures(src_ip='10.0.0.3', dst_ip='10.0.0.1',
+                                                   protocol=6, src_port=4444))
+        datapath.send_msg.reset_mock()
+        enforcer.block_ip(datapath, '10.0.0.3')
+        
+        # A strict delete leaves the per-flow drop inside the new prefix alone
+        delete, add = [c.args[0] for c in datapath.send_msg.call_args_list]
+        self.assertEqual(delete.command, ofproto_v1_3.OFPFC_DELETE_STRICT)
+        self.assertEqual(delete.priority, 100)
+        self.assertEqual(delete.match['ipv4_src'], '10.0.0.2')
+        cached = enforcer.flow_manager.installed_rules[4]
+        self.assertTrue(any(('tcp_src', 4444) in key[2] for key in cached))
+        self.assertEqual(add.command, ofproto_v1_3.OFPFC_ADD)
+        self.assertEqual(add.match['ipv4_src'], ('10.0.0.2', '255.255.255.254'))
+        
+        stats = enforcer.get_statistics()
+        self.assertEqual(stats['block_rules'], 1)
+        self.assertEqual(stats['rules_saved'], 1)
+        
+        datapath.send_msg.reset_mock()
+        enforcer.unblock_ip(datapath, '10.0.0.2')
+        delete, add = [c.args[0] for c in datapath.send_msg.call_args_list]
+        self.assertEqual(delete.match['ipv4_src'], ('10.0.0.2', '255.255.255.254'))
+        self.assertEqual(add.match['ipv4_src'], '10.0.0.3')
+
+class TestBlockExpiry(unittest.TestCase):
+    def test_timer_wheel_cascades(self):
+        """Test timers fire on their tick across wheel levels"""
+        from src.controller.timer_wheel import TimerWheel
+        
+        wheel = TimerWheel(tick=1.0, slots=8, levels=3, now=0)
+        for delay in (3, 7, 9, 70, 600):
+            wheel.schedule(delay, delay, now=0)
+        wheel.schedule('cancelled', 5, now=0)
+        wheel.cancel('cancelled')
+        
+        fired = {}
+        for now in range(1, 601):
+            for key in wheel.advance(now):
+                fired[key] = now
+        self.assertEqual(fired, {3: 3, 7: 7, 9: 9, 70: 70, 600: 600})
+        self.assertEqual(len(wheel), 0)
+    
+    def _enforcer(self):
+        from ryu.ofproto import ofproto_v1_3_parser
+        from src.controller.flow_manager import FlowManager
+        from src.controller.policy_enforcer import PolicyEnforcer
+        
+        datapath = Mock()
+        datapath.id = 5
+        datapath.ofproto = ofproto_v1_3
+        datapath.ofproto_parser = ofproto_v1_3_parser
+        return datapath, PolicyEnforcer(FlowManager())
+    
+    def test_blocks_expire_and_can_be_reapplied(self):
+        """Test an expired block leaves no state and the IP can be re-blocked"""
+        import time
+        
+        datapath, enforcer = self._enforcer()
+        enforcer.block_ip(datapath, '10.0.0.8', duration=30)
+        
+        drop = datapath.send_msg.call_args_list[-1].args[0]
+        self.assertEqual(drop.hard_timeout, 0)
+        self.assertTrue(drop.flags & ofproto_v1_3.OFPFF_SEND_FLOW_REM)
+        
+        self.assertEqual(enforcer.expire(time.monotonic() + 10), 0)
+        self.assertEqual(enforcer.expire(time.monotonic() + 31), 1)
+        self.assertNotIn('10.0.0.8', enforcer.blocked_ips)
+        sent = [getattr(c.args[0], 'message', c.args[0]) for c in datapath.send_msg.call_args_list]
+        self.assertIn(ofproto_v1_3.OFPFC_DELETE_STRICT,
+                      [getattr(m, 'command', None) for m in sent])
+
+        datapath.send_msg.reset_mock()
+        enforcer.block_ip(datapath, '10.0.0.8')
+        self.assertEqual(datapath.send_msg.call_count, 1)
+    
+    def test_flow_removed_reconciles_state(self):
+        """Test FlowRemoved drops flow blocks and restores lost prefix rules"""
+        from src.detection.flow_features import FlowFeatures
+        
+        datapath, enforcer = self._enforcer()
+        parser = datapath.ofproto_parser
+        enforcer.block_ip(datapath, '10.0.0.8')
+        enforcer.block_flow(datapath, FlowFeatures(src_ip='10.0.0.9', dst_ip='10.0.0.1',
+                                                   protocol=6, src_port=4444))
+        self.assertIn('10.0.0.9:4444', enforcer.blocked_flows)
+        
+        flow_match = datapath.send_msg.call_args_list[-1].args[0].match
+        enforcer.handle_flow_removed(parser.OFPFlowRemoved(
+            datapath, priority=100, reason=ofproto_v1_3.OFPRR_HARD_TIMEOUT,
+            table_id=0, match=flow_match))
+        self.assertNotIn('10.0.0.9:4444', enforcer.blocked_flows)
+        self.assertNotIn(('flow', '10.0.0.9:4444'), enforcer.timers)
+        
+        # The switch evicted a block the controller still enforces
+        datapath.send_msg.reset_mock()
+        enforcer.handle_flow_removed(parser.OFPFlowRemoved(
+            datapath, priority=100, reason=ofproto_v1_3.OFPRR_DELETE, table_id=0,
+            match=parser.OFPMatch(eth_type=0x0800, ipv4_src='10.0.0.8')))
+        reinstall = datapath.send_msg.call_args_list[-1].args[0]
+        self.assertEqual(reinstall.match['ipv4_src'], '10.0.0.8')
+        self.assertEqual(enforcer.get_statistics()['rules_reinstalled'], 1)
+    
+    def test_unblock_flow_deletes_drop_rule(self):
+        """Test unblock_flow removes the exact rule block_flow installed"""
+        from src.detection.flow_features import FlowFeatures
+        
+        datapath, enforcer = self._enforcer()
+        blocked = FlowFeatures(src_ip='10.0.0.9', dst_ip='10.0.0.1', protocol=17, src_port=53)
+        enforcer.block_flow(datapath, blocked)
+        installed = datapath.send_msg.call_args_list[-1].args[0]
+        flow_key = enforcer.flow_key(blocked)
+        
+        self.assertTrue(enforcer.unblock_flow(datapath, flow_key))
+        delete = datapath.send_msg.call_args_list[-1].args[0]
+        self.assertEqual(delete.command, ofproto_v1_3.OFPFC_DELETE_STRICT)
+        self.assertEqual(dict(delete.match.items()), dict(installed.match.items()))
+        self.assertNotIn(flow_key, enforcer.blocked_flows)
+        self.assertNotIn(('flow', flow_key), enforcer.timers)
+        self.assertFalse(enforcer.unblock_flow(datapath, flow_key))
+    
+    def test_block_flow_from_stats_serializes(self):
+        """Test a flow-stats record with no known destination IP can be blocked"""
+        from types import SimpleNamespace
+        from src.controller.sdn_controller import SDNIDPSController
+        from src.network.topology_manager import TopologyManager
+        
+        datapath, enforcer = self._enforcer()
+        sent = []
+        
+        def send_msg(msg):
+            msg.set_xid(len(sent) + 1)
+            msg.serialize()
+            sent.append(msg)
+        datapath.send_msg = send_msg
+        
+        topology = TopologyManager()
+        topology.learn_host('00:00:00:00:00:09', '10.0.0.9', 5, 1)
+        stat = datapath.ofproto_parser.OFPFlowStats(
+            table_id=0, duration_sec=3, duration_nsec=0, priority=1, idle_timeout=0,
+            hard_timeout=0, flags=0, cookie=0, packet_count=900, byte_count=54000,
+            match=datapath.ofproto_parser.OFPMatch(in_port=1, eth_src='00:00:00:00:00:09',
+                                                   eth_dst='00:00:00:00:00:01'),
+            instructions=[])
+        flow = SDNIDPSController.extract_stats_features(
+            SimpleNamespace(topology_manager=topology), stat, 5)
+        self.assertEqual((flow.src_ip, flow.dst_ip), ('10.0.0.9', None))
+        
+        enforcer.block_flow(datapath, flow)
+        match = dict(sent[-1].match.items())
+        self.assertEqual(match['ipv4_src'], '10.0.0.9')
+        self.assertNotIn('ipv4_dst', match)
+        self.assertTrue(enforcer.unblock_flow(datapath, enforcer.flow_key(flow)))
+        
+        # A destination learned from the topology narrows the rule
+        topology.learn_host('00:00:00:00:00:01', '10.0.0.1', 5, 2)
+        flow = SDNIDPSController.extract_stats_features(
+            SimpleNamespace(topology_manager=topology), stat, 5)
+        enforcer.block_flow(datapath, flow)
+        self.assertEqual(sent[-1].match['ipv4_dst'], '10.0.0.1')
+    
+    def test_reconnected_switch_gets_blocks_back(self):
+        """Test a switch's IP blocks are forgotten on disconnect and reinstalled on reconnect"""
+        from src.detection.flow_features import FlowFeatures
+        
+        datapath, enforcer = self._enforcer()
+        enforcer.block_ip(datapath, '10.0.0.8')
+        enforcer.block_flow(datapath, FlowFeatures(switch_id=5, src_ip='10.0.0.9',
+                                                   dst_ip='10.0.0.1', protocol=6, src_port=4444))
+        
+        enforcer.flow_manager.forget_datapath(5)
+        enforcer.forget_datapath(5)
+        self.assertNotIn(5, enforcer.block_switches['10.0.0.8'])
+        self.assertNotIn('10.0.0.9:4444', enforcer.blocked_flows)
+        self.assertNotIn(('flow', '10.0.0.9:4444'), enforcer.timers)
+        self.assertIn('10.0.0.8', enforcer.blocked_ips)
+        
+        datapath.send_msg.reset_mock()
+        self.assertEqual(enforcer.restore_datapath(datapath), 1)
+        sent = [getattr(c.args[0], 'message', c.args[0]) for c in datapath.send_msg.call_args_list]
+        adds = [m for m in sent if getattr(m, 'command', None) == ofproto_v1_3.OFPFC_ADD]
+        self.assertEqual([m.match['ipv4_src'] for m in adds], ['10.0.0.8'])
+        self.assertIn(5, enforcer.block_switches['10.0.0.8'])
+        self.assertEqual(enforcer.get_statistics()['blocks_restored'], 1)
+        self.assertEqual(enforcer.restore_datapath(datapath), 0)
+
+class TestIngressEnforcement(unittest.TestCase):
+    def setUp(self):
+        from ryu.ofproto import ofproto_v1_3_parser
+        from src.controller.flow_manager import FlowManager
+        from src.controller.policy_enforcer import PolicyEnforcer
+        from src.network.topology_manager import TopologyManager
+        
+        self.topology = TopologyManager()
+        self.enforcer = PolicyEnforcer(FlowManager(), self.topology)
+        self.enforcer.ingress_only = True
+        # Edge switches 11 and 12 uplink on port 4 to core switch 13
+        self.topology.add_link(11, 4, 13, 1)
+        self.topology.add_link(12, 4, 13, 2)
+        self.datapaths = []
+        for dpid in (11, 12, 13):
+            datapath = Mock()
+            datapath.id = dpid
+            datapath.ofproto = ofproto_v1_3
+            datapath.ofproto_parser = ofproto_v1_3_parser
+            self.datapaths.append(datapath)
+    
+    def test_block_installed_at_edge_only(self):
+        """Test known hosts are blocked at their edge, unknown ones everywhere"""
+        # Edge switch 11 reports the host first, then the core sees a flood copy
+        self.topology.learn_host('00:00:00:00:00:01', '10.0.0.1', 11, 1)
+        self.topology.learn_host('00:00:00:00:00:01', '10.0.0.1', 13, 1)
+        self.topology.learn_host('00:00:00:00:00:01', '10.0.0.1', 12, 4)
+        self.assertEqual(self.topology.locate_ip('10.0.0.1'), {11})
+        
+        self.enforcer.block_ip_all(self.datapaths, '10.0.0.1')
+        self.assertEqual(self.enforcer.block_switches['10.0.0.1'], {11})
+        self.assertFalse(self.datapaths[1].send_msg.called)
+        
+        self.enforcer.block_ip_all(self.datapaths, '198.51.100.7')
+        self.assertEqual(self.enforcer.block_switches['198.51.100.7'], {11, 12, 13})
+        
+        stats = self.enforcer.get_statistics()
+        self.assertEqual(stats['ingress_blocks'], 1)
+        self.assertEqual(stats['fallback_blocks'], 1)
+        self.assertEqual(stats['switches_skipped'], 2)
+    
+    def test_block_follows_source_to_new_edge(self):
+        """Test a blocked address showing up at another edge gets blocked there"""
+        self.topology.learn_host('00:00:00:00:00:01', '10.0.0.1', 11, 1)
+        self.enforcer.block_ip_all(self.datapaths, '10.0.0.1')
+        
+        # Flood copy at a transit switch: not an edge for the source
+        self.assertFalse(self.enforcer.enforce_at(self.datapaths[2], '10.0.0.1'))
+        
+        # Same address from a different MAC attached to switch 12
+        self.topology.learn_host('00:00:00:00:00:66', '10.0.0.1', 12, 3)
+        self.assertTrue(self.enforcer.enforce_at(self.datapaths[1], '10.0.0.1'))
+        self.assertEqual(self.enforcer.block_switches['10.0.0.1'], {11, 12})
+    
+    def test_host_location_needs_link_data(self):
+        """Test locations follow edge ports and ingress-only waits for links"""
+        from src.network.topology_manager import TopologyManager
+        
+        # A flood copy reported first only sets a location on a non-link port
+        self.topology.learn_host('00:00:00:00:00:02', '10.0.0.2', 13, 2)
+        self.assertEqual(self.topology.locate_ip('10.0.0.2'), set())
+        self.topology.learn_host('00:00:00:00:00:02', '10.0.0.2', 12, 1)
+        self.assertEqual(self.topology.locate_ip('10.0.0.2'), {12})
+        
+        # The host moves to another edge port
+        self.topology.learn_host('00:00:00:00:00:02', '10.0.0.2', 11, 2)
+        self.assertEqual(self.topology.locate_ip('10.0.0.2'), {11})
+        
+        # No link data: edge and transit switches look alike, so block everywhere
+        self.enforcer.topology_manager = TopologyManager()
+        self.enforcer.topology_manager.learn_host('00:00:00:00:00:03', '10.0.0.3', 13, 2)
+        self.enforcer.block_ip_all(self.datapaths, '10.0.0.3')
+        self.assertEqual(self.enforcer.block_switches['10.0.0.3'], {11, 12, 13})
+        
+        self.topology.remove_link(13, 1, 11, 4)
+        self.assertNotIn((11, 4), self.topology.link_ports)
+        self.assertIn((12, 4), self.topology.link_ports)
+    
+    def test_stale_host_addresses_are_forgotten(self):
+        """Test a MAC stops locating an address it moved off, and idle hosts expire"""
+        import time
+        
+        self.topology.learn_host('00:00:00:00:00:01', '10.0.0.1', 11, 1)
+        self.topology.learn_host('00:00:00:00:00:01', '10.0.0.9', 11, 1)
+        self.assertEqual(self.topology.locate_ip('10.0.0.1'), set())
+        self.assertNotIn('10.0.0.1', self.topology.ip_to_macs)
+        self.assertEqual(self.topology.locate_ip('10.0.0.9'), {11})
+        
+        # Without a location the block falls back to every switch
+        self.enforcer.block_ip_all(self.datapaths, '10.0.0.1')
+        self.assertEqual(self.enforcer.block_switches['10.0.0.1'], {11, 12, 13})
+        
+        self.topology.learn_host('00:00:00:00:00:02', '10.0.0.2', 12, 1)
+        self.topology.hosts['00:00:00:00:00:01']['last_seen'] = time.time() - 301
+        self.assertEqual(self.topology.expire_hosts(), 1)
+        self.assertNotIn('00:00:00:00:00:01', self.topology.hosts)
+        self.assertNotIn('10.0.0.9', self.topology.ip_to_macs)
+        self.assertNotIn('00:00:00:00:00:01', self.topology.mac_to_port[11])
+        self.assertEqual(self.topology.locate_ip('10.0.0.2'), {12})
+        self.assertEqual(self.topology.get_statistics()['hosts_expired'], 1)
+
+class TestRateLimiting(unittest.TestCase):
+    def setUp(self):
+        from ryu.ofproto import ofproto_v1_3_parser
+        from src.controller.flow_manager import FlowManager
+        from src.controller.policy_enforcer import PolicyEnforcer
+        
+        self.datapath = Mock()
+        self.datapath.id = 9
+        self.datapath.ofproto = ofproto_v1_3
+        self.datapath.ofproto_parser = ofproto_v1_3_parser
+        
+        manager = FlowManager()
+        manager.multi_table = True
+        manager.security_table = 0
+        manager.forwarding_table = 1
+        self.enforcer = PolicyEnforcer(manager)
+        self.enforcer.rate_limit_enabled = True
+    
+    def _sent(self, cls_name):
+        return [c.args[0] for c in self.datapath.send_msg.call_args_list
+                if type(c.args[0]).__name__ == cls_name]
+    
+    def test_meters_shared_and_freed(self):
+        """Test flows with the same rate share one meter that is freed last"""
+        parser = self.datapath.ofproto_parser
+        first = self.enforcer.rate_limit_ip(self.datapath, '10.0.0.1', max_pps=500)
+        second = self.enforcer.rate_limit_ip(self.datapath, '10.0.0.2', max_pps=500)
+        self.assertEqual(first, second)
+        
+        meter_add, = self._sent('OFPMeterMod')
+        self.assertEqual(meter_add.command, ofproto_v1_3.OFPMC_ADD)
+        self.assertEqual(meter_add.flags, ofproto_v1_3.OFPMF_PKTPS)
+        self.assertEqual(meter_add.bands[0].rate, 500)
+        
+        flow = self._sent('OFPFlowMod')[-1]
+        self.assertEqual([type(i).__name__ for i in flow.instructions],
+                         ['OFPInstructionMeter', 'OFPInstructionGotoTable'])
+        self.assertEqual(flow.instructions[0].meter_id, first)
+        self.assertEqual(flow.instructions[1].table_id, 1)
+        
+        for ip in ('10.0.0.1', '10.0.0.2'):
+            self.enforcer.handle_flow_removed(parser.OFPFlowRemoved(
+                self.datapath, priority=90, reason=ofproto_v1_3.OFPRR_HARD_TIMEOUT,
+                table_id=0, match=parser.OFPMatch(eth_type=0x0800, ipv4_src=ip)))
+        
+        meter_delete = self._sent('OFPMeterMod')[-1]
+        self.assertEqual(meter_delete.command, ofproto_v1_3.OFPMC_DELETE)
+        self.assertEqual(meter_delete.meter_id, first)
+        self.assertEqual(self.enforcer.get_statistics()['meters']['meters_active'], 0)
+    
+    def test_rate_limit_destination(self):
+        """Test a flood victim is metered on ipv4_dst where it attaches"""
+        from src.network.topology_manager import TopologyManager
+        
+        other = Mock()
+        other.id = 10
+        self.enforcer.topology_manager = TopologyManager()
+        self.enforcer.topology_manager.add_link(9, 1, 10, 1)
+        self.enforcer.topology_manager.learn_host('00:00:00:00:00:07', '10.0.0.7', 9, 2)
+        
+        meters = self.enforcer.rate_limit_destination([self.datapath, other], '10.0.0.7',
+                                                      max_pps=2000)
+        self.assertEqual(len(meters), 1)
+        self.assertFalse(other.send_msg.called)
+        flow = self._sent('OFPFlowMod')[-1]
+        self.assertEqual(flow.match['ipv4_dst'], '10.0.0.7')
+        self.assertEqual(self._sent('OFPMeterMod')[0].bands[0].rate, 2000)
+    
+    def test_rate_limit_disabled(self):
+        """Test nothing is installed when rate limiting is turned off"""
+        self.enforcer.rate_limit_enabled = False
+        self.assertIsNone(self.enforcer.rate_limit_ip(self.datapath, '10.0.0.1'))
+        self.assertFalse(self.datapath.send_msg.called)
+
+class TestFlowBatch(unittest.TestCase):
+    def _datapath(self, dpid):
+        from ryu.ofproto import ofproto_v1_3_parser
+        
+        datapath = Mock()
+        datapath.id = dpid
+        datapath.ofproto = ofproto_v1_3
+        datapath.ofproto_parser = ofproto_v1_3_parser
+        datapath.xid = 0
+        
+        def set_xid(msg):
+            datapath.xid += 1
+            msg.set_xid(datapath.xid)
+            return datapath.xid
+        datapath.set_xid.side_effect = set_xid
+        return datapath
+    
+    def _sent_types(self, datapath):
+        return [type(c.args[0]).__name__ for c in datapath.send_msg.call_args_list]
+    
+    def test_block_ip_all_bundles_and_acks(self):
+        """Test one bundle plus barrier per switch and completion on acks"""
+        from src.controller.flow_manager import FlowManager
+        from src.controller.policy_enforcer import PolicyEnforcer
+        
+        manager = FlowManager()
+        manager.use_bundles = True
+        enforcer = PolicyEnforcer(manager)
+        datapaths = [self._datapath(1), self._datapath(2)]
+        completed = []
+        
+        batch = enforcer.block_ip_all(datapaths, '10.0.0.5', callback=completed.append)
+        
+        for datapath in datapaths:
+            self.assertEqual(self._sent_types(datapath), [
+                'ONFBundleCtrlMsg', 'ONFBundleAddMsg', 'ONFBundleCtrlMsg', 'OFPBarrierRequest'])
+            add = datapath.send_msg.call_args_list[1].args[0]
+            self.assertEqual(add.message.xid, add.xid)
+        
+        for datapath in datapaths:
+            self.assertEqual(completed, [])
+            manager.handle_barrier_reply(Mock(datapath=datapath, xid=batch.barrier_xids[datapath.id]))
+        
+        self.assertEqual(completed, [batch])
+        self.assertIsNotNone(batch.install_ms)
+        self.assertEqual(manager.get_statistics()['install_to_ack_ms']['count'], 1)
+        self.assertIn('10.0.0.5', enforcer.blocked_ips)
+    
+    def test_bundle_rejection_falls_back_to_barrier(self):
+        """Test a rejected bundle open resends plain FlowMods"""
+        from src.controller.flow_manager import FlowManager
+        
+        manager = FlowManager()
+        manager.use_bundles = True
+        datapath = self._datapath(1)
+        parser = datapath.ofproto_parser
+        
+        batch = manager.begin_batch()
+        manager.install_flow(datapath, 100, parser.OFPMatch(eth_type=0x0800, ipv4_src='10.0.0.6'),
+                             [], batch=batch)
+        manager.send_batch(batch)
+        open_xid = batch.bundle_xids[1][0]
+        
+        manager.handle_error(Mock(datapath=datapath, xid=open_xid, type=1, code=1))
+        self.assertFalse(manager.bundle_support[1])
+        self.assertEqual(self._sent_types(datapath)[-2:], ['OFPFlowMod', 'OFPBarrierRequest'])
+        
+        manager.handle_barrier_reply(Mock(datapath=datapath, xid=batch.barrier_xids[1]))
+        self.assertTrue(batch.completed)
+        self.assertEqual(manager.get_statistics()['bundle_fallbacks'], 1)
+
+class TestPacketParser(unittest.TestCase):
+    def _build_frame(self, *protocols):
+        from ryu.lib.packet import packet
+        
+        pkt = packet.Packet()
+        for proto in protocols:
+            pkt.add_protocol(proto)
+        pkt.serialize()
+        return bytes(pkt.data)
+    
+    def test_fast_path_parses_headers(self):
+        """Test fast-path header parsing for TCP/UDP/ICMP/ARP frames"""
+        from ryu.lib.packet import ethernet, ipv4, tcp, udp, icmp, arp
+        from src.controller.packet_parser import parse_packet
+        
+        eth = ethernet.ethernet(dst='00:00:00:00:00:02', src='00:00:00:00:00:01',
+                                ethertype=0x0800)
+        
+        features = parse_packet(self._build_frame(
+            eth, ipv4.ipv4(src='10.0.0.1', dst='10.0.0.2', proto=6, ttl=64),
+            tcp.tcp(src_port=40000, dst_port=80, bits=0x02)), 3, 1)
+        self.assertEqual(features['eth_src'], '00:00:00:00:00:01')
+        self.assertEqual(features['eth_dst'], '00:00:00:00:00:02')
+        self.assertEqual(features['src_ip'], '10.0.0.1')
+        self.assertEqual(features['dst_ip'], '10.0.0.2')
+        self.assertEqual(features['ttl'], 64)
+        self.assertEqual(features['total_length'], 40)
+        self.assertEqual(features['protocol_name'], 'TCP')
+        self.assertEqual((features['src_port'], features['dst_port']), (40000, 80))
+        self.assertEqual(features['tcp_flags'], 0x02)
+        self.assertIsNone(features.payload)
+        
+        features = parse_packet(self._build_frame(
+            eth, ipv4.ipv4(src='10.0.0.1', dst='10.0.0.2', proto=6),
+            tcp.tcp(src_port=40000, dst_port=80, bits=0x18,
+                    option=[tcp.TCPOptionNoOperation()] * 4),
+            b'GET / HTTP/1.1\r\n\r\n'), 3, 1)
+        self.assertEqual(bytes(features.payload), b'GET / HTTP/1.1\r\n\r\n')
+        
+        features = parse_packet(self._build_frame(
+            eth, ipv4.ipv4(src='10.0.0.1', dst='10.0.0.2', proto=17),
+            udp.udp(src_port=5353, dst_port=53)), 3, 1)
+        self.assertEqual(features['protocol_name'], 'UDP')
+        self.assertEqual((features['src_port'], features['dst_port']), (5353, 53))
+        
+        features = parse_packet(self._build_frame(
+            eth, ipv4.ipv4(src='10.0.0.1', dst='10.0.0.2', proto=1),
+            icmp.icmp()), 3, 1)
+        self.assertEqual(features['protocol_name'], 'ICMP')
+        self.assertNotIn('dst_port', features)
+        
+        features = parse_packet(self._build_frame(
+            ethernet.ethernet(dst='ff:ff:ff:ff:ff:ff', src='00:00:00:00:00:01',
+                              ethertype=0x0806),
+            arp.arp(src_ip='10.0.0.1', dst_ip='10.0.0.2')), 3, 1)
+        self.assertEqual(features['eth_type'], 0x0806)
+        self.assertNotIn('src_ip', features)
+    
+    def test_fast_path_falls_back(self):
+        """Test unhandled frames are left to the ryu parser"""
+        from ryu.lib.packet import ethernet, vlan, ipv4, tcp
+        from src.controller.packet_parser import parse_packet
+        
+        frame = self._build_frame(
+            ethernet.ethernet(ethertype=0x8100),
+            vlan.vlan(vid=10, ethertype=0x0800),
+            ipv4.ipv4(proto=6),
+            tcp.tcp(src_port=40000, dst_port=80))
+        self.assertIsNone(parse_packet(frame, 1, 1))
+        self.assertIsNone(parse_packet(b'\x00' * 10, 1, 1))
+
+class TestPacketPipeline(unittest.TestCase):
+    def test_bounded_queue_drops_and_batches(self):
+        """Test overflow is dropped and flush drains in micro-batches"""
+        from src.controller.packet_pipeline import PacketPipeline
+        
+        batches = []
+        pipeline = PacketPipeline(batches.append, queue_size=10, batch_size=4)
+        
+        accepted = [pipeline.submit(i) for i in range(12)]
+        self.assertEqual(accepted.count(False), 2)
+        self.assertTrue(pipeline.overloaded())
+        
+        pipeline.flush()
+        self.assertFalse(pipeline.overloaded())
+        self.assertEqual([len(b) for b in batches], [4, 4, 2])
+        self.assertEqual(sum(batches, []), list(range(10)))
+        
+        stats = pipeline.get_statistics()
+        self.assertEqual(stats['dropped'], 2)
+        self.assertEqual(stats['processed'], 10)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['max_queue_depth'], 10)
+    
+    def test_workers_drain_queue(self):
+        """Test worker greenthreads process submitted packets"""
+        from ryu.lib import hub
+        from src.controller.packet_pipeline import PacketPipeline
+        
+        batches = []
+        pipeline = PacketPipeline(batches.append, batch_size=8, batch_timeout=0.01)
+        pipeline.start()
+        for i in range(20):
+            pipeline.submit(i)
+        hub.sleep(0.1)
+        pipeline.stop()
+        
+        self.assertEqual(sum(batches, []), list(range(20)))
+        self.assertTrue(all(len(b) <= 8 for b in batches))
+    
+    def test_blocked_sources_skip_detection(self):
+        """Test packets from blocked sources are dropped before any detector runs"""
+        from src.controller.sdn_controller import SDNIDPSController
+        from src.controller.threat_detector import ThreatDetector
+        from src.detection.flow_features import FlowFeatures
+        
+        detector = ThreatDetector()
+        controller = Mock()
+        controller.threat_detector = detector
+        controller.packet_pipeline.overloaded.return_value = False
+        controller.policy_enforcer.blocked_ips = {'10.0.0.66'}
+        batch = [(Mock(), FlowFeatures(src_ip=ip, dst_ip='10.0.0.2', protocol=6,
+                                       src_port=40000, dst_port=80))
+                 for ip in ('10.0.0.66', '10.0.0.5', '10.0.0.66')]
+        
+        SDNIDPSController.process_packet_batch(controller, batch)
+        
+        self.assertEqual(detector.detectors.packets, 1)
+        self.assertEqual(controller.policy_enforcer.enforce_at.call_count, 2)
+        controller._forward_packet.assert_called_once_with(batch[1][0], batch[1][1])
+
 class TestThreatDetection(unittest.TestCase):
     def test_ml_detector_load(self):
         """Test ML detector initialization"""
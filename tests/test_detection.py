@@ -156,6 +156,1032 @@ class TestThreatDetection(unittest.TestCase):
         
         # Should detect suspicious port
         self.assertTrue(detector._detect_suspicious_port(suspicious_features))
+    
+    def test_verdict_cache_short_circuits_repeat_flows(self):
+        """Test repeat 5-tuples reuse the verdict but still count toward floods"""
+        from unittest.mock import patch
+        from src.controller.threat_detector import ThreatDetector
+        
+        detector = ThreatDetector()
+        detector.ml_detector.model = None
+        detector.suspicious_ips.clear()
+        features = {
+            'src_ip': '10.0.0.7',
+            'dst_ip': '10.0.0.2',
+            'src_port': 40000,
+            'dst_port': 31337,
+            'protocol': 6,
+            'tcp_flags': 0x02
+        }
+        
+        with patch.object(detector, '_detect_suspicious_port',
+                          wraps=detector._detect_suspicious_port) as port_check:
+            results = [detector.analyze_packet(features) for _ in range(20)]
+        
+        self.assertEqual(port_check.call_count, 1)
+        self.assertTrue(all('SUSPICIOUS_PORT' in r['threat_type'] for r in results))
+        self.assertEqual(detector.syn_counts.count('10.0.0.7'), 20)
+        
+        stats = detector.get_statistics()['verdict_cache']
+        self.assertEqual(stats['hits'], 19)
+        self.assertAlmostEqual(stats['hit_ratio'], 0.95)
+        
+        # Different TCP flags are a different ML input, so a new lookup
+        detector.analyze_packet(dict(features, tcp_flags=0x10))
+        self.assertEqual(detector.get_statistics()['verdict_cache']['misses'], 2)
+        
+        detector.invalidate_verdicts('test')
+        self.assertEqual(len(detector.verdict_cache), 0)
+    
+    def test_verdict_cache_ttl_and_lru(self):
+        """Test cached verdicts expire and the least recently used is evicted"""
+        from src.controller.verdict_cache import VerdictCache
+        
+        cache = VerdictCache(max_entries=2, ttl=5.0)
+        cache.put('a', (), now=0)
+        cache.put('b', ('DOS',), now=0)
+        self.assertEqual(cache.get('a', now=1), ())
+        cache.put('c', (), now=2)
+        
+        self.assertIsNone(cache.get('b', now=2))
+        self.assertIsNone(cache.get('a', now=6))
+        self.assertEqual(cache.get('c', now=6), ())
+        
+        stats = cache.get_statistics()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['expirations'], 1)
+
+class TestDetectorRegistry(unittest.TestCase):
+    """Test cost-ordered detector evaluation"""
+    
+    def test_cost_order_and_short_circuit(self):
+        """Test cheap decisive hits skip expensive detectors"""
+        from src.controller.detector_registry import DetectorRegistry
+        
+        calls = []
+        def detector(name, hit):
+            return lambda f: calls.append(name) or ((name.upper(),) if hit(f) else ())
+        
+        registry = DetectorRegistry()
+        registry.register('ml', detector('ml', lambda f: True), cost=100, decisive=True)
+        registry.register('port', detector('port', lambda f: f['dst_port'] == 31337),
+                          cost=1, decisive=True)
+        registry.register('rate', detector('rate', lambda f: False), cost=5, stateful=True)
+        
+        self.assertEqual(registry.evaluate({'dst_port': 31337}), ['PORT'])
+        self.assertEqual(calls, ['rate', 'port'])
+        
+        calls.clear()
+        self.assertEqual(registry.evaluate({'dst_port': 80}), ['ML'])
+        self.assertEqual(calls, ['rate', 'port', 'ml'])
+        
+        stats = {d['name']: d for d in registry.get_statistics()['detectors']}
+        self.assertEqual(stats['ml']['calls'], 1)
+        self.assertEqual(stats['ml']['skipped'], 1)
+        self.assertEqual(stats['rate']['calls'], 2)
+        self.assertEqual([d['name'] for d in registry.get_statistics()['detectors']],
+                         ['rate', 'port', 'ml'])
+        
+        with self.assertRaises(ValueError):
+            registry.register('ml', detector('ml', lambda f: True))
+    
+    def test_load_shedding_skips_expensive_detectors(self):
+        """Test shed verdicts are not cached"""
+        from src.controller.detector_registry import DetectorRegistry
+        from src.controller.verdict_cache import VerdictCache
+        from src.detection.flow_features import FlowFeatures
+        
+        ml = Mock(return_value=('DDoS',))
+        registry = DetectorRegistry(VerdictCache(), shed_cost=10)
+        registry.register('ml', ml, cost=100, decisive=True)
+        features = FlowFeatures(src_ip='10.0.0.1', dst_ip='10.0.0.2', protocol=6,
+                                src_port=40000, dst_port=80)
+        
+        registry.set_shedding(True)
+        self.assertEqual(registry.evaluate(features), [])
+        self.assertEqual(ml.call_count, 0)
+        
+        registry.set_shedding(False)
+        self.assertEqual(registry.evaluate(features), ['DDoS'])
+        self.assertEqual(registry.evaluate(features), ['DDoS'])
+        self.assertEqual(ml.call_count, 1)
+        
+        stats = registry.get_statistics()
+        self.assertEqual(stats['shed_packets'], 1)
+        self.assertEqual(stats['detectors'][0]['shed'], 1)
+    
+    def test_cheap_uncached_detector_runs_before_ml(self):
+        """Test a payload hit spares the model, and only complete verdicts are cached"""
+        from src.controller.detector_registry import DetectorRegistry
+        from src.controller.verdict_cache import VerdictCache
+        from src.detection.flow_features import FlowFeatures
+        
+        ml = Mock(return_value=())
+        payload = Mock(side_effect=lambda f: ('XSS',) if b'<script' in f.payload else ())
+        registry = DetectorRegistry(VerdictCache(), shed_cost=1000)
+        registry.register('ml', ml, cost=100, decisive=True)
+        registry.register('payload_signatures', payload, cost=5, decisive=True, cacheable=False)
+        
+        def packet(data):
+            return FlowFeatures(src_ip='10.0.0.1', dst_ip='10.0.0.2', protocol=6,
+                                src_port=40000, dst_port=80, payload=data)
+        
+        self.assertEqual(registry.evaluate(packet(b'<script>')), ['XSS'])
+        self.assertEqual(ml.call_count, 0)
+        self.assertEqual(len(registry.verdict_cache), 0)
+        
+        self.assertEqual(registry.evaluate(packet(b'GET /')), [])
+        self.assertEqual(ml.call_count, 1)
+        self.assertEqual(registry.evaluate(packet(b'<script>')), ['XSS'])
+        self.assertEqual(ml.call_count, 1)
+        self.assertEqual(payload.call_count, 3)
+        self.assertEqual([d['name'] for d in registry.get_statistics()['detectors']],
+                         ['payload_signatures', 'ml'])
+    
+    def test_threat_detector_skips_ml_after_scan(self):
+        """Test a decisive port scan verdict skips ML inference"""
+        from src.controller.threat_detector import ThreatDetector
+        
+        detector = ThreatDetector()
+        detector.ml_detector.model = Mock()
+        detector.ml_detector.predict = Mock(return_value={'is_malicious': False})
+        
+        for port in range(1, 30):
+            result = detector.analyze_packet({'src_ip': '10.0.0.8', 'dst_ip': '10.0.0.2',
+                                              'protocol': 6, 'src_port': 40000,
+                                              'dst_port': port})
+        
+        self.assertIn('PORT_SCAN', result['threat_type'])
+        stats = {d['name']: d for d in detector.get_statistics()['detectors']['detectors']}
+        self.assertEqual(stats['port_scan']['calls'], 29)
+        self.assertEqual(stats['ml']['calls'] + stats['ml']['skipped'], 29)
+        self.assertGreater(stats['ml']['skipped'], 0)
+        self.assertEqual(detector.ml_detector.predict.call_count, stats['ml']['calls'])
+
+class TestMLBatchInference(unittest.TestCase):
+    """Test batched ML inference"""
+    
+    def _model(self):
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(300, 9)) * 100
+        y = (X[:, 0] > 50).astype(int) + (X[:, 1] > 120).astype(int) * 2
+        return RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y), X
+    
+    def test_predict_batch_matches_predict(self):
+        """Test one batched call agrees with per-row predictions"""
+        import numpy as np
+        from src.detection.ml_detector import MLDetector
+        from src.detection.flow_features import FlowFeatures
+        
+        detector = MLDetector()
+        detector.model = None
+        self.assertIsNone(detector.predict_batch(np.zeros((1, 9))))
+        detector.model, X = self._model()
+        flows = [FlowFeatures(packet_count=r[0], byte_count=r[1], duration=r[2])
+                 for r in X[:20]]
+        
+        result = detector.predict_batch(detector.feature_matrix(flows))
+        self.assertEqual(result['prediction'].shape, (20,))
+        for i, flow in enumerate(flows):
+            single = detector.predict(flow)
+            self.assertEqual(detector.attack_types[result['prediction'][i]], single['attack_type'])
+            self.assertAlmostEqual(result['confidence'][i], single['confidence'])
+            self.assertEqual(bool(result['is_malicious'][i]), single['is_malicious'])
+    
+    def test_analyze_batch_calls_model_once(self):
+        """Test a packet batch needing ML makes a single model call"""
+        import numpy as np
+        from src.controller.threat_detector import ThreatDetector
+        
+        detector = ThreatDetector()
+        detector.ml_detector.model = Mock(classes_=np.array([0, 1]))
+        detector.ml_detector.model.predict_proba.side_effect = lambda m: np.tile(
+            [0.05, 0.95], (len(m), 1))
+        batch = [{'src_ip': f'10.0.0.{i}', 'dst_ip': '10.0.0.2', 'protocol': 6,
+                  'src_port': 40000, 'dst_port': 80} for i in range(10, 20)]
+        
+        results = detector.analyze_batch(batch)
+        self.assertTrue(all(r['threat_type'] == 'DOS' for r in results))
+        self.assertEqual(detector.ml_detector.model.predict_proba.call_count, 1)
+        self.assertEqual(detector.get_statistics()['ml_batch_rows'], 10)
+        
+        flows = detector.ml_detector.feature_matrix([])
+        self.assertEqual(flows.shape, (0, 9))
+        self.assertEqual(len(detector.scan_flows([])), 0)
+
+    def test_analyze_batch_classifies_only_packets_reaching_ml(self):
+        """Test packets decided before ML or answered by the cache are not classified"""
+        import numpy as np
+        from src.controller.threat_detector import ThreatDetector
+        
+        detector = ThreatDetector()
+        detector.suspicious_ips.clear()
+        detector.ml_detector.model = Mock(classes_=np.array([0, 1]))
+        detector.ml_detector.model.predict_proba.side_effect = lambda m: np.tile(
+            [0.05, 0.95], (len(m), 1))
+        flow = {'src_ip': '10.0.0.10', 'dst_ip': '10.0.0.2', 'protocol': 6,
+                'src_port': 40000, 'dst_port': 80}
+        batch = [flow, dict(flow, dst_port=31337), dict(flow, src_ip='10.0.0.11')]
+        
+        results = detector.analyze_batch(batch)
+        self.assertEqual([r['threat_type'] for r in results], ['DOS', 'SUSPICIOUS_PORT', 'DOS'])
+        rows = detector.ml_detector.model.predict_proba.call_args.args[0]
+        self.assertEqual(len(rows), 2)
+        stats = detector.get_statistics()
+        self.assertEqual(stats['ml_batch_rows'], 2)
+        
+        # Resuming starts at the ML detector: nothing cheaper runs twice
+        calls = {d['name']: d['calls'] for d in stats['detectors']['detectors']}
+        self.assertEqual(calls['suspicious_port'], 3)
+        self.assertEqual(calls['ml'], 2)
+        self.assertEqual(stats['verdict_cache']['misses'], 3)
+        
+        # The resumed verdicts were cached with the ML result
+        self.assertEqual(detector.analyze_batch([flow])[0]['threat_type'], 'DOS')
+        self.assertEqual(detector.ml_detector.model.predict_proba.call_count, 1)
+
+class TestCompiledForest(unittest.TestCase):
+    """Test the NumPy random forest inference engine"""
+    
+    def test_matches_sklearn_exactly(self):
+        """Test compiled probabilities equal sklearn's, including NaN inputs"""
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from src.detection.compiled_forest import CompiledForest
+        
+        rng = np.random.default_rng(1)
+        X = rng.normal(size=(2000, 9)) * 100
+        y = (X[:, 0] > 50).astype(int) + (X[:, 1] > rng.normal(120, 50, 2000)).astype(int) * 2
+        model = RandomForestClassifier(n_estimators=20, max_depth=12, min_samples_leaf=2,
+                                       random_state=0, n_jobs=1).fit(X, y)
+        forest = CompiledForest.from_model(model)
+        
+        samples = rng.normal(size=(500, 9)) * 100
+        samples[::25, 3] = np.nan
+        np.testing.assert_array_equal(forest.predict_proba(samples), model.predict_proba(samples))
+        np.testing.assert_array_equal(forest.predict(samples), model.predict(samples))
+        np.testing.assert_array_equal(forest.apply(samples[:1]), model.apply(samples[:1]) +
+                                      forest.roots)
+        with self.assertRaises(ValueError):
+            forest.predict_proba(samples[:, :5])
+    
+    def test_normalizes_leaf_counts(self):
+        """Test trees storing class counts (sklearn < 1.4) compile to probabilities"""
+        from types import SimpleNamespace
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from src.detection.compiled_forest import CompiledForest
+        
+        rng = np.random.default_rng(4)
+        X = rng.normal(size=(500, 9))
+        y = (X[:, 0] > 0).astype(int) + (X[:, 1] > 0.5)
+        model = RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0,
+                                       n_jobs=1).fit(X, y)
+        
+        def counts(tree):
+            # The tree as old sklearn stores it: weighted samples per class
+            fractions = tree.value / tree.value.sum(axis=2, keepdims=True)
+            return SimpleNamespace(
+                node_count=tree.node_count, max_depth=tree.max_depth,
+                children_left=tree.children_left, children_right=tree.children_right,
+                feature=tree.feature, threshold=tree.threshold,
+                value=fractions * tree.weighted_n_node_samples[:, None, None])
+        
+        old = SimpleNamespace(
+            estimators_=[SimpleNamespace(tree_=counts(e.tree_)) for e in model.estimators_],
+            classes_=model.classes_, n_features_in_=9, n_outputs_=1)
+        proba = CompiledForest.from_model(old).predict_proba(X)
+        np.testing.assert_allclose(proba, model.predict_proba(X), rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(proba.sum(axis=1), 1.0)
+    
+    def test_save_load_and_ml_detector(self):
+        """Test a saved forest loads identically and MLDetector compiles its model"""
+        import tempfile
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from src.detection.compiled_forest import CompiledForest
+        from src.detection.ml_detector import MLDetector
+        
+        rng = np.random.default_rng(2)
+        X = rng.normal(size=(300, 9)) * 100
+        model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, X[:, 0] > 0)
+        forest = CompiledForest.from_model(model)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            forest.save(f'{tmpdir}/model.forest', bundle={'version': 'v1'})
+            loaded = CompiledForest.load(f'{tmpdir}/model.forest')
+            np.testing.assert_array_equal(loaded.predict_proba(X), forest.predict_proba(X))
+            self.assertTrue(loaded.memory_mapped)
+            self.assertEqual(loaded.meta['bundle'], {'version': 'v1'})
+            self.assertEqual(dict(loaded.get_statistics(), memory_mapped=False),
+                             forest.get_statistics())
+        
+        detector = MLDetector()
+        detector.model = model
+        result = detector.predict_batch(X[:10])
+        self.assertIsNotNone(detector.forest)
+        np.testing.assert_array_equal(result['confidence'],
+                                      model.predict_proba(X[:10]).max(axis=1))
+
+class TestModelBundle(unittest.TestCase):
+    """Test the versioned model bundle and folded scaling"""
+    
+    def _training_data(self, rng, n):
+        import numpy as np
+        
+        X = np.column_stack([rng.lognormal(5, 2, (n, 2)), rng.normal(10, 3, (n, 7))])
+        return X, (X[:, 0] > 200).astype(int) + (X[:, 2] > 12) * 2
+    
+    def test_folded_scaling_matches_pipeline(self):
+        """Test raw features through the bundle equal scaling then predicting"""
+        import tempfile
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.preprocessing import StandardScaler
+        from src.detection.model_bundle import ModelBundle
+        
+        rng = np.random.default_rng(3)
+        X, y = self._training_data(rng, 2000)
+        scaler = StandardScaler().fit(X)
+        model = RandomForestClassifier(n_estimators=10, random_state=0, n_jobs=1)
+        model.fit(scaler.transform(X), y)
+        bundle = ModelBundle.from_training(model, scaler, metrics={'accuracy': 0.99})
+        
+        samples, _ = self._training_data(rng, 1000)
+        expected = model.predict_proba(scaler.transform(samples))
+        np.testing.assert_array_equal(bundle.predict_proba(samples), expected)
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bundle.save(f'{tmpdir}/model.pkl')
+            loaded = ModelBundle.load(f'{tmpdir}/model.pkl')
+        np.testing.assert_array_equal(loaded.predict_proba(samples), expected)
+        info = loaded.get_info()
+        self.assertEqual(info['version'], bundle.version)
+        self.assertTrue(info['scaled'] and info['compiled'])
+        self.assertEqual(info['classes'], ['BENIGN', 'DOS', 'PROBE', 'R2L'])
+    
+    def test_mapped_load_skips_unpickling(self):
+        """Test a saved bundle maps its forest and unpickles only on demand"""
+        import os
+        import tempfile
+        import joblib
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from src.detection.model_bundle import ModelBundle
+        
+        rng = np.random.default_rng(6)
+        X, y = self._training_data(rng, 300)
+        model = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, y)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f'{tmpdir}/model.pkl'
+            ModelBundle.from_training(model).save(path)
+            self.assertTrue(os.path.isdir(f'{tmpdir}/model.forest'))
+            
+            with patch('joblib.load', side_effect=AssertionError('unpickled')):
+                bundle = ModelBundle.load(path)
+                np.testing.assert_array_equal(bundle.predict_proba(X), model.predict_proba(X))
+                self.assertTrue(bundle.get_info()['memory_mapped'])
+            self.assertEqual(bundle.model.n_estimators, 3)
+            
+            # A pickle rewritten without its forest is not paired with the old one
+            retrained = RandomForestClassifier(n_estimators=4, random_state=0).fit(X, y)
+            joblib.dump(ModelBundle.from_training(retrained).to_dict(), path)
+            self.assertFalse(ModelBundle.load(path).get_info()['memory_mapped'])
+    
+    def test_ml_detector_loads_bundle_and_refuses_drift(self):
+        """Test MLDetector loads bundles and legacy models but not another schema"""
+        import tempfile
+        import joblib
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from src.detection.ml_detector import MLDetector
+        from src.detection.model_bundle import ModelBundle
+        
+        rng = np.random.default_rng(4)
+        X, y = self._training_data(rng, 300)
+        model = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, y)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f'{tmpdir}/model.pkl'
+            with patch('src.detection.ml_detector.config.get',
+                       side_effect=lambda key, default=None: path
+                       if key == 'detection.model_path' else default):
+                ModelBundle.from_training(model).save(path)
+                detector = MLDetector()
+                self.assertTrue(detector.is_loaded())
+                self.assertFalse(detector.get_model_info()['scaled'])
+                
+                joblib.dump(model, path)
+                self.assertTrue(MLDetector().is_loaded())
+                
+                drifted = ModelBundle.from_training(model).to_dict()
+                drifted['feature_names'] = drifted['feature_names'][::-1]
+                joblib.dump(drifted, path)
+                self.assertFalse(MLDetector().is_loaded())
+
+class TestModelRegistry(unittest.TestCase):
+    """Test hot reload and rollback of ML models"""
+    
+    def _bundle(self, label):
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from src.detection.model_bundle import ModelBundle
+        
+        # Every flow gets the same class: BENIGN (0) or DOS (1)
+        X = np.random.default_rng(5).normal(size=(50, 9))
+        y = np.array([label] * 49 + [1 - label])
+        model = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, y)
+        return ModelBundle.from_training(model)
+    
+    def test_swap_warmup_and_rollback(self):
+        """Test a new bundle is warmed up and swapped in, and rolls back"""
+        import os
+        import tempfile
+        import numpy as np
+        from src.detection.ml_detector import MLDetector
+        from src.detection.model_registry import ModelRegistry
+        
+        detector = MLDetector()
+        changes = []
+        detector.add_model_listener(lambda: changes.append(1))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self._bundle(0).save(f'{tmpdir}/v1.pkl')
+            os.utime(f'{tmpdir}/v1.pkl', (1000, 1000))
+            registry = ModelRegistry(detector, model_dir=tmpdir, warmup_rows=8)
+            self.assertTrue(registry.check())
+            self.assertFalse(registry.check())
+            
+            detector.predict_batch(np.ones((3, 9)))
+            self._bundle(1).save(f'{tmpdir}/v2.pkl')
+            os.utime(f'{tmpdir}/v2.pkl', (2000, 2000))
+            self.assertTrue(registry.check())
+            self.assertEqual(detector.predict({'packet_count': 1})['attack_type'], 'DOS')
+            stats = registry.get_statistics()
+            self.assertEqual(stats['active']['path'], os.path.normpath(f'{tmpdir}/v2.pkl'))
+            self.assertIsNotNone(stats['active']['warmup_ms'])
+            self.assertEqual(stats['previous']['path'], os.path.normpath(f'{tmpdir}/v1.pkl'))
+            
+            self.assertTrue(registry.rollback())
+            self.assertEqual(detector.predict({'packet_count': 1})['attack_type'], 'BENIGN')
+            self.assertFalse(registry.check())
+            self.assertEqual(registry.get_statistics()['rollbacks'], 1)
+            
+            os.utime(f'{tmpdir}/v2.pkl', (3000, 3000))
+            self.assertTrue(registry.check())
+        self.assertEqual(len(changes), 4)
+    
+    def test_rejects_bad_bundle(self):
+        """Test a bundle that fails to load or warm up leaves the active model"""
+        import os
+        import tempfile
+        import time
+        import joblib
+        from sklearn.preprocessing import StandardScaler
+        from src.detection.ml_detector import MLDetector
+        from src.detection.model_registry import ModelRegistry
+        
+        detector = MLDetector()
+        active = self._bundle(0)
+        detector.use_bundle(active)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            joblib.dump(StandardScaler(), f'{tmpdir}/scaler.pkl')
+            registry = ModelRegistry(detector, model_dir=tmpdir)
+            self.assertFalse(registry.check())
+            self.assertFalse(registry.check())
+            
+            with open(f'{tmpdir}/broken.pkl', 'wb') as f:
+                f.write(b'not a pickle')
+            os.utime(f'{tmpdir}/broken.pkl', (time.time() + 10,) * 2)
+            self.assertFalse(registry.check())
+        
+        self.assertIs(detector.bundle, active)
+        stats = registry.get_statistics()
+        self.assertEqual(stats['load_failures'], 2)
+        self.assertIn('broken.pkl', stats['last_error'])
+        self.assertFalse(registry.rollback())
+
+class TestInferencePool(unittest.TestCase):
+    """Test ML inference in worker processes"""
+    
+    def test_pool_matches_predict_batch(self):
+        """Test workers classify shared-memory batches like predict_batch"""
+        import tempfile
+        import threading
+        import numpy as np
+        from sklearn.ensemble import RandomForestClassifier
+        from src.detection.inference_pool import InferencePool
+        from src.detection.ml_detector import MLDetector
+        from src.detection.model_bundle import ModelBundle
+        
+        X = np.random.default_rng(3).normal(size=(200, 9))
+        y = (X[:, 0] > 0).astype(int)
+        model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+        detector = MLDetector()
+        pool = InferencePool(detector, workers=1, max_batch=32, slots=2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bundle = ModelBundle.from_training(model)
+            detector.use_bundle(bundle)
+            pool.start()
+            try:
+                self.assertFalse(pool.available())  # not saved: nothing to load
+                self.assertFalse(pool.submit(X[:10], print))
+                bundle.save(f'{tmpdir}/model.pkl')
+                self.assertTrue(pool.available())
+                
+                results = []
+                done = threading.Event()
+                callback = lambda result: (results.append(result), done.set())
+                self.assertFalse(pool.submit(X[:33], callback))
+                self.assertTrue(pool.submit(X[:32], callback))
+                self.assertTrue(done.wait(60))
+            finally:
+                pool.stop()
+        
+        expected = detector.predict_batch(X[:32])
+        np.testing.assert_array_equal(results[0]['prediction'], expected['prediction'])
+        np.testing.assert_array_equal(results[0]['confidence'], expected['confidence'])
+        np.testing.assert_array_equal(results[0]['is_malicious'], expected['is_malicious'])
+        stats = pool.get_statistics()
+        self.assertEqual((stats['completed'], stats['submitted_rows'], stats['errors']), (1, 32, 0))
+        self.assertIsNotNone(stats['latency_ms']['p99'])
+    
+    def test_threat_detector_defers_ml(self):
+        """Test batches get heuristic verdicts now and ML verdicts by callback"""
+        import numpy as np
+        from src.controller.threat_detector import ThreatDetector
+        
+        detector = ThreatDetector()
+        detector.ml_detector.model = Mock(classes_=np.array([0, 1]))
+        detector.ml_detector.model.predict_proba.side_effect = lambda m: np.tile(
+            [0.05, 0.95], (len(m), 1))
+        pool = detector.inference_pool = Mock(max_batch=4)
+        pool.available.return_value = True
+        pool.submit.side_effect = lambda matrix, callback: callback(
+            detector.ml_detector.predict_batch(matrix)) or True
+        batch = [{'src_ip': f'10.0.0.{i}', 'dst_ip': '10.0.0.2', 'protocol': 6,
+                  'src_port': 40000, 'dst_port': 80} for i in range(10, 16)]
+        batch.append({'src_ip': '10.0.0.99', 'dst_ip': '10.0.0.2', 'protocol': 6,
+                      'src_port': 40000, 'dst_port': 4444})
+        
+        verdicts = []
+        results = detector.analyze_batch(batch, ml_callback=verdicts.extend)
+        self.assertEqual([r['is_threat'] for r in results], [False] * 6 + [True])
+        self.assertEqual(pool.submit.call_count, 2)  # 6 rows in chunks of 4
+        self.assertEqual([f.src_ip for f, _threat in verdicts],
+                         [f'10.0.0.{i}' for i in range(10, 16)])
+        self.assertTrue(all(threat['threat_type'] == 'DOS' for _f, threat in verdicts))
+        
+        # Without a callback the model runs inline as before
+        flow = dict(batch[0], src_ip='10.0.0.50')
+        self.assertTrue(detector.analyze_batch([flow])[0]['is_threat'])
+
+class TestReputation(unittest.TestCase):
+    """Test prefix reputation and allowlist lookup"""
+    
+    def test_longest_prefix_match(self):
+        """Test the most specific prefix wins, including at range edges"""
+        from src.detection.reputation import PrefixTable, parse_prefix
+        
+        entries = [parse_prefix(p) + (label,) for p, label in (
+            ('10.0.0.0/8', 'wide'), ('10.1.0.0/16', 'mid'), ('10.1.2.3', 'host'),
+            ('192.168.0.0/24', 'lan'), ('0.0.0.0/0', 'default'))]
+        table = PrefixTable(entries)
+        
+        self.assertEqual(table.lookup('10.200.0.1'), 'wide')
+        self.assertEqual(table.lookup('10.1.2.2'), 'mid')
+        self.assertEqual(table.lookup('10.1.2.3'), 'host')
+        self.assertEqual(table.lookup('10.1.255.255'), 'mid')
+        self.assertEqual(table.lookup('10.2.0.0'), 'wide')
+        self.assertEqual(table.lookup('192.168.0.255'), 'lan')
+        self.assertEqual(table.lookup('192.168.1.0'), 'default')
+        self.assertEqual(table.lookup('255.255.255.255'), 'default')
+        self.assertIsNone(table.lookup('not-an-ip'))
+        self.assertIsNone(PrefixTable().lookup('10.0.0.1'))
+        self.assertIsNone(parse_prefix('10.0.0.1/33'))
+    
+    def test_feeds_allowlist_and_reload(self):
+        """Test allow prefixes carve out blocks and reloads swap the table"""
+        import os
+        import tempfile
+        from src.detection.reputation import IPReputation, BLOCK, ALLOW
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            blocklist = os.path.join(tmp, 'block.txt')
+            allowlist = os.path.join(tmp, 'allow.txt')
+            with open(blocklist, 'w') as f:
+                f.write('# intel\n203.0.113.0/24 botnet-c2\n198.51.100.7\nbogus line\n')
+            with open(allowlist, 'w') as f:
+                f.write('203.0.113.128/25 partner\n')
+            
+            swaps = []
+            reputation = IPReputation([blocklist], [allowlist])
+            reputation.add_listener(lambda: swaps.append(reputation.table))
+            self.assertTrue(reputation.rebuild())
+            
+            self.assertEqual(reputation.lookup('203.0.113.5'), (BLOCK, 'botnet-c2'))
+            self.assertEqual(reputation.lookup('198.51.100.7'), (BLOCK, 'block.txt'))
+            self.assertEqual(reputation.lookup('203.0.113.200'), (ALLOW, 'partner'))
+            self.assertTrue(reputation.is_allowed('203.0.113.200'))
+            self.assertFalse(reputation.is_blocked('10.0.0.1'))
+            
+            old_table = reputation.table
+            with open(blocklist, 'w') as f:
+                f.write('10.9.0.0/16\n')
+            reputation.reload().join()
+            
+            self.assertIsNot(reputation.table, old_table)
+            self.assertEqual(len(swaps), 2)
+            self.assertTrue(reputation.is_blocked('10.9.1.1'))
+            self.assertFalse(reputation.is_blocked('203.0.113.5'))
+            self.assertEqual(reputation.get_statistics()['block_prefixes'], 1)
+    
+    def test_threat_detector_reputation(self):
+        """Test blocklisted sources are flagged and allowlisted ones reported"""
+        from src.controller.threat_detector import ThreatDetector
+        from src.detection.reputation import IPReputation, PrefixTable, parse_prefix
+        
+        detector = ThreatDetector()
+        detector.ml_detector.model = None
+        detector.reputation = IPReputation()
+        detector.reputation.table = PrefixTable([
+            parse_prefix('203.0.113.0/24') + (('block', 'intel'),),
+            parse_prefix('10.0.0.0/24') + (('allow', 'ops'),)])
+        detector.register_detector(
+            'reputation',
+            lambda f: ('BAD_REPUTATION',) if detector.reputation.is_blocked(f.src_ip) else (),
+            cost=0.5, decisive=True)
+        
+        result = detector.analyze_packet({'src_ip': '203.0.113.9', 'dst_ip': '10.0.0.2',
+                                          'protocol': 17, 'dst_port': 53})
+        self.assertEqual(result['threat_type'], 'BAD_REPUTATION')
+        self.assertFalse(detector.analyze_packet({'src_ip': '198.51.100.1', 'dst_ip': '10.0.0.2',
+                                                  'protocol': 17, 'dst_port': 53})['is_threat'])
+        self.assertTrue(detector.is_allowlisted('10.0.0.42'))
+        self.assertFalse(detector.is_allowlisted('203.0.113.9'))
+
+class TestPayloadSignatures(unittest.TestCase):
+    """Test Aho-Corasick payload signature matching"""
+    
+    def test_aho_corasick_matches_naive_search(self):
+        """Test overlapping and nested patterns are all found in one pass"""
+        import random
+        from src.detection.payload_signatures import AhoCorasick
+        
+        rng = random.Random(7)
+        patterns = [b'he', b'she', b'his', b'hers', b'a', b'abcab', b'bca'] + [
+            bytes(rng.choice(b'abc') for _ in range(rng.randint(1, 6))) for _ in range(40)]
+        matcher = AhoCorasick(patterns)
+        for _ in range(200):
+            data = bytes(rng.choice(b'abchers') for _ in range(rng.randint(0, 40)))
+            expected = {i for i, p in enumerate(patterns) if p in data}
+            self.assertEqual(matcher.scan(data), expected)
+        self.assertEqual(matcher.scan(b'ushers'), {0, 1, 3})
+    
+    def test_signature_file(self):
+        """Test hex escapes, nocase and the bundled rules"""
+        from src.detection.payload_signatures import PayloadSignatures, parse_content
+        
+        self.assertEqual(parse_content('a|0d 0a|b|3B|'), b'a\r\nb;')
+        signatures = PayloadSignatures(signatures=[
+            ('SQL_INJECTION', b'union select', True), ('MALWARE', b'EvilBin', False)])
+        self.assertEqual(signatures.match(b'id=1 UNION SELECT pw'), ('SQL_INJECTION',))
+        self.assertEqual(signatures.match(b'evilbin'), ())
+        self.assertEqual(signatures.match(b'EvilBin union select'), ('SQL_INJECTION', 'MALWARE'))
+        self.assertEqual(signatures.match(None), ())
+        
+        bundled = PayloadSignatures('src/detection/rules/payload.sigs')
+        self.assertEqual(bundled.match(b'GET /?q=%27+or+%271%27%3d%271 HTTP/1.1'), ('SQL_INJECTION',))
+        self.assertEqual(bundled.match(b'GET /?f=../../etc/passwd HTTP/1.1'), ('PATH_TRAVERSAL',))
+        self.assertEqual(bundled.match(b'GET /index.html HTTP/1.1\r\nHost: a\r\n\r\n'), ())
+        stats = bundled.get_statistics()
+        self.assertEqual(stats['scans'], 3)
+        self.assertEqual(stats['matches'], 2)
+    
+    def test_threat_detector_payload_not_cached(self):
+        """Test each payload of a flow is inspected despite the verdict cache"""
+        from src.controller.threat_detector import ThreatDetector
+        from src.detection.payload_signatures import PayloadSignatures
+        from src.detection.flow_features import FlowFeatures
+        
+        detector = ThreatDetector()
+        detector.ml_detector.model = None
+        detector.payload_signatures = PayloadSignatures(signatures=[('XSS', b'<script', True)])
+        detector.register_detector(
+            'payload_signatures', lambda f: detector.payload_signatures.match(f.payload),
+            cost=5, decisive=True, cacheable=False)
+        
+        def packet(payload):
+            return FlowFeatures(src_ip='10.0.0.7', dst_ip='10.0.0.2', protocol=6,
+                                src_port=40000, dst_port=80, payload=payload)
+        
+        self.assertFalse(detector.analyze_packet(packet(b'GET / HTTP/1.1'))['is_threat'])
+        result = detector.analyze_packet(packet(b'q=<SCRIPT>alert(1)</script>'))
+        self.assertEqual(result['threat_type'], 'XSS')
+        self.assertEqual(result['severity'], 2)
+        self.assertEqual(detector.get_statistics()['verdict_cache']['hits'], 1)
+
+class TestBaselines(unittest.TestCase):
+    """Test EWMA per-host and per-subnet baselines"""
+    
+    def test_ewma_learns_and_flags_spikes(self):
+        """Test a host is flagged by z-score only against its own baseline"""
+        from src.detection.baselines import EWMABaseline
+        
+        baseline = EWMABaseline(interval=10, alpha=0.2, z_threshold=4, min_samples=5)
+        now = 0.0
+        for interval in range(20):
+            for i in range(50 + interval % 3):  # ~5 pps to 2 destinations
+                self.assertEqual(baseline.update('10.0.0.1', f'10.0.1.{i % 2}', 100,
+                                                 now=interval * 10 + i * 0.1), ())
+            now = interval * 10 + 9
+        self.assertTrue(baseline.is_learned('10.0.0.1'))
+        mean, std = baseline.baseline('10.0.0.1')['packet_rate']
+        self.assertAlmostEqual(mean, 5.1, delta=0.2)
+        
+        # A burst to many destinations trips packet rate and fan-out
+        flagged = ()
+        for i in range(200):
+            flagged = baseline.update('10.0.0.1', f'10.0.2.{i}', 100, now=200 + i * 0.01) or flagged
+        self.assertEqual(set(flagged), {'packet_rate', 'byte_rate', 'fan_out'})
+        self.assertGreater(baseline.zscores('10.0.0.1')['fan_out'], 4)
+        
+        # The same burst from a new host is not judged before it has history
+        self.assertEqual(baseline.update('10.0.0.9', '10.0.2.1', 100, now=200), ())
+    
+    def test_idle_intervals_decay_and_expire(self):
+        """Test idle intervals fold in as zeros and idle keys expire"""
+        from src.detection.baselines import EWMABaseline
+        
+        baseline = EWMABaseline(interval=10, alpha=0.5, min_samples=1, expiry=100)
+        baseline.update('a', 'x', 60, now=0)
+        baseline.update('a', 'x', 60, now=10)
+        self.assertAlmostEqual(baseline.baseline('a')['packet_rate'][0], 0.1)
+        baseline.update('a', 'x', 60, now=40)
+        self.assertAlmostEqual(baseline.baseline('a')['packet_rate'][0], 0.025)
+        baseline.update('b', 'x', 60, now=120)
+        
+        self.assertEqual(baseline.sweep(now=145), 1)
+        self.assertNotIn('a', baseline)
+        self.assertIn('b', baseline)
+    
+    def test_traffic_baselines_persist(self):
+        """Test host and subnet baselines survive a save and load"""
+        import os
+        import tempfile
+        from src.detection.baselines import TrafficBaselines, subnet_of
+        
+        self.assertEqual(subnet_of('10.1.2.3', 24), '10.1.2.0/24')
+        self.assertIsNone(subnet_of('bogus'))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'baselines.npz')
+            baselines = TrafficBaselines(state_file=path, interval=10, min_samples=3)
+            for t in range(0, 100):
+                self.assertEqual(baselines.observe(
+                    {'src_ip': f'10.1.2.{t % 4}', 'dst_ip': '10.0.0.2', 'total_length': 500},
+                    now=float(t)), ())
+            self.assertTrue(baselines.save())
+            
+            restored = TrafficBaselines(state_file=path, interval=10, min_samples=3)
+            self.assertEqual(len(restored.hosts), 4)
+            self.assertTrue(restored.subnets.is_learned('10.1.2.0/24'))
+            saved = baselines.subnets.baseline('10.1.2.0/24')['byte_rate']
+            loaded = restored.subnets.baseline('10.1.2.0/24')['byte_rate']
+            self.assertAlmostEqual(saved[0], loaded[0], places=3)
+            
+            threats = ()
+            for i in range(400):
+                threats = restored.observe({'src_ip': '10.1.2.1', 'dst_ip': f'10.0.3.{i % 250}',
+                                            'total_length': 1500}, now=1000 + i * 0.01)
+            self.assertEqual(threats, ('TRAFFIC_ANOMALY', 'SUBNET_TRAFFIC_ANOMALY'))
+
+class TestDestinationMonitor(unittest.TestCase):
+    """Test destination-centric distributed flood detection"""
+    
+    def _flood(self, count, sources, dst_ip='10.0.0.80', offset=0):
+        from src.detection.flow_features import FlowFeatures
+        
+        return [FlowFeatures(src_ip=f'11.{(offset + i) % sources // 256}.{(offset + i) % sources % 256}.1',
+                             dst_ip=dst_ip, protocol=6, tcp_flags=0x02)
+                for i in range(count)]
+    
+    def test_spoofed_flood_reported_once(self):
+        """Test many low-rate sources trip the per-destination aggregates"""
+        from src.detection.destination_monitor import DestinationMonitor
+        
+        monitor = DestinationMonitor(window=10, buckets=5, packet_rate_threshold=1000,
+                                     syn_rate_threshold=500, min_sources=100, hold_time=30)
+        victims = []
+        for step in range(100):
+            victims += monitor.update(self._flood(100, sources=5000, offset=step * 100),
+                                      now=step * 0.1)
+        
+        victim, = victims
+        self.assertEqual(victim['dst_ip'], '10.0.0.80')
+        self.assertGreaterEqual(victim['syn_rate'], 500)
+        self.assertGreater(victim['sources'], 100)
+        self.assertGreater(victim['entropy'], 0.9)
+        self.assertEqual(monitor.get_statistics()['detections'], 1)
+        
+        # Reported again only once the hold has passed
+        for step in range(100, 400):
+            victims += monitor.update(self._flood(100, sources=5000, offset=step * 100),
+                                      now=step * 0.1)
+        self.assertEqual(len(victims), 2)
+    
+    def test_single_source_and_window_expiry(self):
+        """Test heavy traffic from one source is left to the per-source detectors"""
+        from src.detection.destination_monitor import DestinationMonitor
+        
+        monitor = DestinationMonitor(window=10, buckets=5, packet_rate_threshold=100,
+                                     min_sources=50, max_destinations=2)
+        for step in range(20):
+            self.assertEqual(monitor.update(self._flood(200, sources=1), now=step * 0.1), [])
+        stats = monitor.destination_stats('10.0.0.80')
+        self.assertEqual(stats['sources'], 1)
+        self.assertEqual(stats['entropy'], 0.0)
+        self.assertEqual(stats['packet_rate'], 400.0)
+        
+        # The window slides past the burst
+        monitor.update(self._flood(1, sources=1), now=30)
+        self.assertEqual(monitor.destination_stats('10.0.0.80')['packet_rate'], 0.1)
+        
+        # Least recently seen destinations make room for new ones
+        monitor.update(self._flood(1, sources=1, dst_ip='10.0.0.81'), now=31)
+        monitor.update(self._flood(1, sources=1, dst_ip='10.0.0.82'), now=32)
+        self.assertIsNone(monitor.destination_stats('10.0.0.80'))
+        self.assertEqual(monitor.get_statistics()['evictions'], 1)
+
+class TestSlidingWindow(unittest.TestCase):
+    """Test trailing-window counters"""
+    
+    def test_counter_trailing_window(self):
+        """Test counts drop out as their buckets leave the window"""
+        from src.detection.sliding_window import SlidingWindowCounter
+        
+        counter = SlidingWindowCounter(window=60, buckets=6)
+        for t in range(0, 60, 5):
+            counter.add('10.0.0.1', now=t)
+        self.assertEqual(counter.count('10.0.0.1', now=59), 12)
+        self.assertEqual(counter.count('10.0.0.1', now=75), 8)
+        self.assertEqual(counter.count('10.0.0.1', now=500), 0)
+        
+        counter.add('10.0.0.2', now=500)
+        self.assertEqual(counter.sweep(now=500), 1)
+        self.assertNotIn('10.0.0.1', counter)
+        self.assertIn('10.0.0.2', counter)
+    
+    def test_distinct_items(self):
+        """Test repeated items count once and saturate at max_items"""
+        from src.detection.sliding_window import SlidingWindowDistinct
+        
+        ports = SlidingWindowDistinct(window=60, buckets=6, max_items=5)
+        for port in (22, 22, 80, 443, 80):
+            ports.add('10.0.0.1', port, now=1)
+        self.assertEqual(ports.count('10.0.0.1', now=1), 3)
+        
+        # 22 seen again later stays counted once, in the newer bucket
+        ports.add('10.0.0.1', 22, now=50)
+        self.assertEqual(ports.count('10.0.0.1', now=65), 1)
+        
+        for port in range(1000, 1010):
+            ports.add('10.0.0.1', port, now=70)
+        self.assertEqual(ports.count('10.0.0.1', now=70), 5)
+    
+    def test_port_scan_uses_trailing_window(self):
+        """Test slow scans spread beyond the window are not flagged"""
+        from unittest.mock import patch
+        from src.controller.threat_detector import ThreatDetector
+        
+        detector = ThreatDetector()
+        features = {'src_ip': '10.0.0.3', 'dst_ip': '10.0.0.2', 'protocol': 6}
+        
+        with patch('src.detection.sliding_window.time.monotonic') as clock:
+            for port in range(1, 30):
+                clock.return_value = port * 10.0
+                self.assertFalse(detector._detect_port_scan(dict(features, dst_port=port)))
+            
+            clock.return_value = 1000.0
+            results = [detector._detect_port_scan(dict(features, dst_port=port))
+                       for port in range(100, 112)]
+        
+        self.assertFalse(any(results[:10]))
+        self.assertTrue(results[10])
+        self.assertIn('10.0.0.3', detector.suspicious_ips)
+
+class TestSketches(unittest.TestCase):
+    """Test fixed-memory sketch counters"""
+    
+    def test_count_min_window(self):
+        """Test counts never underestimate and expire with their slice"""
+        from src.detection.sketches import CountMinSketch
+        
+        sketch = CountMinSketch(width=64, depth=4, window=60, generations=4)
+        for i in range(500):
+            sketch.add(f'10.0.{i // 250}.{i % 250}', now=1)
+        for _ in range(200):
+            sketch.add('10.9.9.9', now=20)
+        
+        self.assertGreaterEqual(sketch.count('10.9.9.9', now=20), 200)
+        self.assertLessEqual(sketch.count('10.9.9.9', now=20), 200 + 500 * 3 // 64)
+        self.assertGreaterEqual(sketch.count('10.0.0.1', now=59), 1)
+        self.assertEqual(sketch.count('10.9.9.9', now=200), 0)
+        self.assertEqual(sketch.memory_bytes(), sketch.get_statistics()['memory_bytes'])
+    
+    def test_distinct_sketch_estimates(self):
+        """Test distinct-port estimates stay within the HyperLogLog error"""
+        from src.detection.sketches import DistinctSketch
+        
+        sketch = DistinctSketch.with_memory(256 * 1024, window=60)
+        self.assertLessEqual(sketch.memory_bytes(), 256 * 1024)
+        
+        for port in (22, 22, 80, 443, 80):
+            sketch.add('10.0.0.1', port, now=1)
+        self.assertAlmostEqual(sketch.count('10.0.0.1', now=1), 3, delta=1)
+        
+        for port in range(1, 2001):
+            estimate = sketch.add('10.0.0.2', port, now=2)
+        self.assertLess(abs(estimate - 2000), 2000 * 0.3)
+        
+        # Many single-port sources only add their shared port
+        for i in range(5000):
+            sketch.add(f'198.51.{i // 250}.{i % 250}', 80, now=3)
+        self.assertLessEqual(sketch.count('10.0.0.1', now=3), 5)
+        self.assertEqual(sketch.count('10.0.0.2', now=300), 0)
+    
+    def test_heavy_hitters(self):
+        """Test Space-Saving keeps the largest counts with bounded error"""
+        from src.detection.sketches import HeavyHitters
+        
+        hitters = HeavyHitters(k=5)
+        for i in range(1000):
+            hitters.offer(f'10.0.0.{i % 50}')
+            if i % 2:
+                hitters.offer('172.16.0.1')
+        
+        top = hitters.top(1)[0]
+        self.assertEqual(top[0], '172.16.0.1')
+        self.assertGreaterEqual(top[1], 500)
+        self.assertLessEqual(top[1] - top[2], 500)
+        self.assertEqual(len(hitters), 5)
+        
+        hitters.decay()
+        self.assertLessEqual(hitters.top(1)[0][1], top[1] // 2)
+    
+    def test_threat_detector_sketch_mode(self):
+        """Test the detector flags scans and floods from sketch counters"""
+        from src.controller.threat_detector import ThreatDetector
+        from src.detection.sketches import CountMinSketch, DistinctSketch
+        from src.utils.config import config
+        
+        sketch = {'enabled': True, 'memory_kb': 256}
+        with patch.dict(config._config['detection'], {'sketch': sketch}):
+            detector = ThreatDetector()
+        self.assertIsInstance(detector.scanned_ports, DistinctSketch)
+        self.assertIsInstance(detector.syn_counts, CountMinSketch)
+        
+        features = {'src_ip': '10.0.0.5', 'dst_ip': '10.0.0.2', 'protocol': 6, 'tcp_flags': 0x02}
+        results = [detector.analyze_packet(dict(features, dst_port=port)) for port in range(1, 150)]
+        self.assertTrue(results[-1]['is_threat'])
+        self.assertIn('PORT_SCAN', results[-1]['threat_type'])
+        self.assertIn('DOS_ATTACK', results[-1]['threat_type'])
+        
+        stats = detector.get_statistics()
+        self.assertEqual(stats['counter_mode'], 'sketch')
+        self.assertEqual(stats['top_offenders'][0]['ip'], '10.0.0.5')
+        self.assertLessEqual(stats['sketches']['ports']['memory_bytes'] +
+                             stats['sketches']['syns']['memory_bytes'], 256 * 1024)
+
+class TestFlowFeatures(unittest.TestCase):
+    """Test the slotted flow feature record"""
+    
+    def test_dict_compatibility(self):
+        """Test FlowFeatures round-trips and supports dict-style access"""
+        from src.detection.flow_features import FlowFeatures
+        
+        data = {'src_ip': '10.0.0.1', 'dst_port': 80, 'protocol': 6}
+        features = FlowFeatures.from_dict(data)
+        
+        self.assertEqual(features.src_ip, '10.0.0.1')
+        self.assertEqual(features['dst_port'], 80)
+        self.assertEqual(features.get('tcp_flags', 0), 0)
+        self.assertIn('protocol', features)
+        self.assertNotIn('src_port', features)
+        self.assertEqual(features.to_dict(), data)
+        self.assertIs(FlowFeatures.coerce(features), features)
+        self.assertFalse(hasattr(features, '__dict__'))
+    
+    def test_to_row(self):
+        """Test conversion to the ML feature vector"""
+        from src.detection.flow_features import FlowFeatures
+        
+        features = FlowFeatures(packet_count=100, byte_count=50000, duration=10,
+                                protocol=6, src_port=12345, dst_port=80, tcp_flags=2)
+        row = features.to_row()
+        
+        self.assertEqual(row.shape, (9,))
+        self.assertEqual(list(row), [100, 50000, 10, 10, 500, 6, 12345, 80, 2])
+        self.assertEqual(list(FlowFeatures().to_row()), [0] * 9)
 
 class TestDatabase(unittest.TestCase):
     """Test database operations"""
@@ -204,6 +1230,108 @@ class TestDatabase(unittest.TestCase):
         
         self.assertIsNotNone(alerts)
 
+    def test_write_behind_alerts(self):
+        """Test queued alerts are bulk written on flush"""
+        alert_ids = [
+            self.db.queue_alert({
+                'severity': 2,
+                'alert_type': 'WRITE_BEHIND_TEST',
+                'source_ip': '10.0.0.9',
+                'blocked': True
+            })
+            for _ in range(3)
+        ]
+        
+        self.assertEqual(len(set(alert_ids)), 3)
+        self.db.flush()
+        
+        stats = self.db.writer.get_statistics()
+        self.assertEqual(stats['backlog'], 0)
+        self.assertGreaterEqual(stats['flushed_rows'], 3)
+        
+        with self.db.session_scope() as session:
+            from src.database.models import Alert
+            stored = session.query(Alert).filter(Alert.id.in_(alert_ids)).count()
+        self.assertEqual(stored, 3)
+
+    def test_write_behind_retries_failed_flush(self):
+        """Test a failed flush is re-buffered, retried and finally dead-lettered"""
+        from contextlib import contextmanager
+        from src.database.models import Alert, FlowRule
+        from src.database.write_behind import WriteBehindWriter
+        
+        session = MagicMock()
+        session.query.return_value.scalar.return_value = None
+        
+        @contextmanager
+        def session_scope():
+            yield session
+        
+        writer = WriteBehindWriter(session_scope, flush_interval=60, max_retries=1,
+                                   retry_backoff=60)
+        try:
+            writer.enqueue(Alert, {'alert_type': 'RETRY_TEST'})
+            writer.enqueue_update(FlowRule, 7, {'active': False})
+            session.bulk_insert_mappings.side_effect = RuntimeError('database is locked')
+            self.assertEqual(writer.flush(), 0)
+            
+            stats = writer.get_statistics()
+            self.assertEqual(stats['backlog'], 2)
+            self.assertEqual(stats['flush_failures'], 1)
+            self.assertEqual(stats['failed_rows'], 0)
+            
+            # A later update to the same row coalesces with the failed one
+            writer.enqueue_update(FlowRule, 7, {'expires_at': 'later'})
+            self.assertEqual(writer.get_statistics()['backlog'], 2)
+            session.bulk_insert_mappings.side_effect = None
+            self.assertEqual(writer.flush(), 2)
+            session.bulk_insert_mappings.assert_called_with(
+                Alert, [{'alert_type': 'RETRY_TEST', 'id': 1}])
+            session.bulk_update_mappings.assert_called_once_with(
+                FlowRule, [{'id': 7, 'active': False, 'expires_at': 'later'}])
+            
+            # Out of retries: rows are written one by one and only the bad one is dropped
+            def insert(model, rows):
+                if any(row['alert_type'] == 'DEAD_LETTER_TEST' for row in rows):
+                    raise RuntimeError('CHECK constraint failed')
+            
+            writer.enqueue(Alert, {'alert_type': 'DEAD_LETTER_TEST'})
+            writer.enqueue(Alert, {'alert_type': 'VALID_TEST'})
+            session.bulk_insert_mappings.side_effect = insert
+            writer.flush()
+            with self.assertLogs('write_behind', 'ERROR') as logs:
+                writer.flush()
+            dead = [line for line in logs.output if 'Dead letter' in line]
+            self.assertEqual(len(dead), 1)
+            self.assertIn('DEAD_LETTER_TEST', dead[0])
+            session.bulk_insert_mappings.assert_called_with(
+                Alert, [{'alert_type': 'VALID_TEST', 'id': 3}])
+            
+            stats = writer.get_statistics()
+            self.assertEqual(stats['backlog'], 0)
+            self.assertEqual(stats['failed_rows'], 1)
+            self.assertEqual(stats['flushed_rows'], 3)
+        finally:
+            writer.stop()
+    
+    def test_flow_rules_marked_inactive(self):
+        """Test queued flow-rule deactivations are applied in bulk"""
+        from src.database.models import FlowRule
+        
+        flow_ids = [
+            self.db.queue_flow_rule({'switch_id': '1', 'priority': 100, 'active': True})
+            for _ in range(2)
+        ]
+        self.db.queue_flow_rules_inactive(flow_ids[:1])
+        self.db.flush()
+        
+        with self.db.session_scope() as session:
+            rows = {r.id: (r.active, r.expires_at) for r in
+                    session.query(FlowRule).filter(FlowRule.id.in_(flow_ids))}
+        self.assertEqual(rows[flow_ids[0]][0], False)
+        self.assertIsNotNone(rows[flow_ids[0]][1])
+        self.assertEqual(rows[flow_ids[1]], (True, None))
+
 class TestAttackDetection(unittest.TestCase):
     """Test attack detection"""
     